@@ -1,8 +1,13 @@
 #!/usr/bin/env python
 import os
 
-from datetime import datetime
+from datetime import datetime, timedelta
 
-print datetime.now().strftime('%Y-%m-%d %H:%M:%S')+' executing cronHFRadar.py'
-os.system('python ../py/bin/getHFRadar.py -v 38 42 -128 -123 "2000-01-01 00:00:00" "'+datetime.now().strftime('%Y-%m-%d %H:00:00')+'" 6km >> cron.log')
-#print('python ../py/bin/getHFRadar.py -v 38 42 -128 -123 "2000-01-01 00:00:00" "'+datetime.now().strftime('%Y-%m-%d %H:00:00')+'" 6km >> cron.log')
+# Records that are already in the database are skipped when loading, so each
+# run only needs to cover a window long enough to pick up late-arriving data.
+# Widen it to backfill after an outage.
+now = datetime.now()
+start = now - timedelta(days = 3)
+
+print now.strftime('%Y-%m-%d %H:%M:%S')+' executing cronHFRadar.py'
+os.system('python ../py/bin/getHFRadar.py -v 38 42 -128 -123 "'+start.strftime('%Y-%m-%d %H:00:00')+'" "'+now.strftime('%Y-%m-%d %H:00:00')+'" 6km >> cron.log')
@@ -57,30 +57,19 @@ filename2 = '_000.grb'
 ################################
 # CREATE DATABASE OBJECTS
 ################################
-srctype = DBman.accessTable( None, 'tblsourcetype' )
-src = DBman.accessTable( None, 'tblsource')
 wind = DBman.accessTable( None, 'tblwind' ) 
 
 ################################
 # ADD NAM12 TO tblSourceType
 ################################
-session = DBman.startSession()     
 srctypename = 'NAM12'
-existing = session.query(srctype)\
-    .filter( srctype.sourcetypename == srctypename )
-if ( existing.first() == None ):
-    record = srctype(srctypename)                              
-    session.add(record)
-    session.commit()
-srctypeid = session.query(srctype)\
-    .filter( srctype.sourcetypename == srctypename )\
-    .first().id
-session.close()
-session.bind.dispose()
+DBman.source_type_id(srctypename)
 
 ################################
 # GET DATA FOR EACH TIMESTAMP
 ################################
+# records are loaded in the background while the next file downloads
+writer = DBman.BatchWriter('tblwind')
 date = starttime
 while date < stoptime :
 
@@ -119,30 +108,12 @@ while date < stoptime :
     dir = arctan2(vgrid,ugrid)   
     dir = dir*180./pi 
     
-    # choose srcname
-    for i in range(1000):
-      srcname = srctypename+'_'+date.strftime("%Y%m%d_%H")+'_'+str(i)
-      existing = session.query(src).filter( src.srcname == srcname )
-      if (existing.first() == None):
-          break
-
-    # prepare record for tblSource
-    record = src(
-        srcName=srcname, 
-        srcConfig='', 
-        srcBeginExecution=date.today(), 
-        srcEndExecution=date.today(), 
-        srcSourceTypeID=srctypeid)
-    
-    # add record to tblSource
-    session = DBman.startSession()     
-    session.add(record)    
-    session.commit()
-    srcid = session.query(src)\
-        .filter( src.srcname == srcname )\
-        .first().id
+    # add a uniquely numbered run to tblSource
+    srcid = DBman.register_source(srctypename,
+        srctypename+'_'+date.strftime("%Y%m%d_%H"))
 
     # add records to tblwind
+    records = []
     for i in range(len(lats)) : 
         loc = WKTSpatialElement('POINT('+str(lons[i])+' '+str(lats[i])+')')
         record = wind(
@@ -151,12 +122,8 @@ while date < stoptime :
             winDateTime=date, 
             winSpeed=float(spd[i]), 
             winDirection=float(dir[i]))
-        session.add(record)    
-    
-    # close session
-    session.commit()
-    session.close() 
-    session.bind.dispose()
+        records.append(record)    
+    writer.put(records)
     
     # close grb file and delete
     niofile.close()
@@ -165,6 +132,8 @@ while date < stoptime :
     # go to next timestamp
     print 'done with: '+str(date)
     date = date + delta
+
+writer.close()
     
 ### TO DO ###
 #modulize
@@ -7,11 +7,9 @@
 ################################
 import urllib #web support
 import sys #argument parsing
-import re #regex support
 import glob #file wildcard support
 import datetime #posix support
 from numpy import * #math support
-from geoalchemy import WKTSpatialElement
 from os import path,system,remove
 strptime = datetime.datetime.strptime
 
@@ -20,15 +18,7 @@ strptime = datetime.datetime.strptime
 ################################
 DBman_path = path.abspath('.')+'/../lib/'
 sys.path.insert( 0, DBman_path )
-from wavecon import DBman
-
-################################
-# CREATE DATABASE OBJECTS
-################################
-srctype = DBman.accessTable( None, 'tblsourcetype' )
-src = DBman.accessTable( None, 'tblsource')
-spec = DBman.accessTable( None, 'tblspectrabin' )
-wave = DBman.accessTable( None, 'tblwave')
+from wavecon import DBman, WW3
 
 ################################
 # PARSE COMMAND LINE ARGUMENTS
@@ -43,25 +33,10 @@ tmpdir =    sys.argv[7]       #/Users/naftali/Desktop/tmp
 locale = 'EKA'
 
 ################################
-# ADD WWIII TO tblSource
+# ADD WWIII TO tblSourceType
 ################################
-session = DBman.startSession()
 srctypename = 'WWIII'
-existing = session.query(srctype)\
-    .filter( srctype.sourcetypename == srctypename )
-
-if (existing.first() == None):
-    record = srctype(srctypename)
-    session.add(record)
-    session.commit()
-
-# determine sourcetypeid to use in tblsource
-srctypeid = session.query(srctype)\
-    .filter( srctype.sourcetypename == srctypename )\
-    .first().id
-
-session.close()
-session.bind.dispose()
+DBman.source_type_id(srctypename)
 
 ################################
 # PARSE DATE PARAMATERS
@@ -72,17 +47,11 @@ delta = datetime.timedelta(1) # 24 hour increment
 if (starttime==stoptime):
     stoptime = starttime + delta
 
-################################
-# COMPILE REGEX PATTERNS
-################################
-freqdir_pat = re.compile("III.*?(\d+).*?(\d+)")
-num_pat = re.compile("-*\d+\.*\d+E.\d+")
-timestamp_pat = re.compile("\d{8} \d{6}")
-latlon_pat = re.compile("\d+.\d+-\d+.\d+")
-
 ################################
 # GET DATA FOR EACH DAY, PARSE, THEN ADD TO DB 
 ################################
+# records are loaded in the background while the next file is parsed
+writer = DBman.BatchWriter('tblwave')
 date = starttime
 while date < stoptime :
 
@@ -96,33 +65,12 @@ while date < stoptime :
     system(command)
     
     ################################
-    # OPEN SESSION, ADD SOURCE TO tblSource
+    # ADD SOURCE TO tblSource
     ################################
     
-    # choose srcname
-    session = DBman.startSession()
-    for i in range(1000):
-      srcname = srctypename+'_'+date.strftime("%Y%m%d_%H")+'_'+str(i)
-      existing = session.query(src).filter( src.srcname == srcname )
-      if (existing.first() == None):
-          break
-    
-    #create record for tblsource
-    record = src(
-        srcName=srcname,
-        srcConfig='',
-        srcBeginExecution=date.today(),
-        srcEndExecution=date.today(),
-        srcSourceTypeID=srctypeid)
-    
-    # add record to tblSource
-    session.add(record)
-    session.commit()
-    
-    # get source id to use in tblwave
-    srcid = session.query(src)\
-        .filter( src.srcname == srcname )\
-        .first().id
+    # add a uniquely numbered run to tblSource
+    srcid = DBman.register_source(srctypename,
+        srctypename+'_'+date.strftime("%Y%m%d_%H"))
 
     ################################
     # LOOP THROUGH DOWNLOADED FILES
@@ -130,98 +78,49 @@ while date < stoptime :
 
     files = glob.glob(tmpdir + '/' + filename)
     for file in files:
-        
-        # store in long string, then delete file
-        lines = open(file).read()
-
-        # look for matches
-        freqdir_match = freqdir_pat.search(lines)
-        num_match = num_pat.findall(lines) 
-        num_match = map(float,num_match)
-        timestamp_match = timestamp_pat.findall(lines)
-        latlon_match = latlon_pat.findall(lines)  
-        
-        # parse lat/lon
-        lat = latlon_match[0][0:5]
-        lon = latlon_match[0][5:]
-        loc = WKTSpatialElement('POINT('+lon+' '+lat+')')
-        
-        # parse freq/dir bins
+
+        # read the spectra, each file holds a single point
+        point = WW3.read_point_spectra(file)[0]
+
+        # freq/dir bins, convert from numpy.float to float
         # NOTE DIRS = DIRECTION OF TRAVEL
-        nfreqs = int(freqdir_match.group(1))  
-        ndirs = int(freqdir_match.group(2))
-        freqs = num_match[0:nfreqs]
-        dirs = num_match[nfreqs:(nfreqs+ndirs)]        
-        dirs = map(degrees,dirs)
-        
-        # convert from numpy.float to float
-        freqs = array(freqs).tolist()
-        dirs = array(dirs).tolist()
-                          
-        # parse dates, select only 24hrs of data
-        timestamps = [strptime( ts, '%Y%m%d %H0000' ) for ts in timestamp_match]
-        timestamps = array(timestamps)
+        freqs = point.freqs.tolist()
+        dirs = point.dirs.tolist()
+
+        # select only 24hrs of data
+        timestamps = array(point.times)
         filter = (timestamps >= date) & (timestamps < (date+delta))
         if (all(filter==False)):
           quit('error: cannot find valid timesteps in WW3 datafile: '+file)
         timestamps = timestamps[filter]
-              
-        # parse spectra, select only 24hrs of data
-        spectra = num_match[(nfreqs+ndirs):]
-        spectra = array(spectra)
-        spectra = spectra * (pi/180) #m^2/Hz/rad to m^2/Hz/degree         
-        spectra = spectra.reshape(len(filter),nfreqs,ndirs)
-        spectra = spectra[filter,:,:]
-        spectra = spectra.tolist()
-        
+
+        # spectra are already in m^2/Hz/degree
+        spectra = point.spectra[filter,:,:]
+
         ################################
         # ADD SPECTRAL BINS TO tblSpectra IF NECCESSARY
         ################################
-        
-        # determine whether bins exist in db 
-        exists = False
-        for rec in session.query(spec):
-            dirshape = array(rec.spcdir).size==array(dirs).size
-            freqshape = array(rec.spcfreq).size==array(freqs).size
-            dirval = all((array(rec.spcdir) - array(dirs)) < .01)
-            freqval = all((array(rec.spcfreq) - array(freqs)) < .01)
-            if (dirshape and freqshape and dirval and freqval):
-                exists = True
-                specid = rec.id  
-                break         
- 
-        # if bins don't exist in db, add them
-        if (exists == False):
-            record = spec(freqs,dirs)
-            session.add(record)
-            session.commit()
-            specid = record.id
-         
+        specid = DBman.spectra_bin_id(freqs,dirs)
+
         ################################
         # ADD DATA TO tblWave
         ################################
-        for i in range(len(timestamps)):
-            myspec = spectra[i]
-            record = wave(
-                wavSourceID=srcid, 
-                wavSpectraBinID=specid, 
-                wavLocation=loc, 
-                wavDateTime=timestamps[i],  
-                wavSpectra=myspec, 
-                wavHeight=None, 
-                wavPeakDir=None, 
-                wavPeakPeriod=None)
-            session.add(record)
-        session.commit()
-    
+        # the spectra are loaded column-wise with a single COPY
+        writer.put_columns({
+            'wavsourceid':srcid,
+            'wavspectrabinid':specid,
+            'wavlocation':(point.lon,point.lat),
+            'wavdatetime':array(timestamps,dtype='datetime64[us]'),
+            'wavspectra':spectra})
+
     ################################
-    #CLOSE SESSION, REMOVE FILES, MOVE TO NEXT DAY    
+    #REMOVE FILES, MOVE TO NEXT DAY    
     ################################
-    session.close()
-    session.bind.dispose()   
     command = 'rm -f '+' '.join(files)
     system(command)
     date = date+delta
+
+writer.close()
     
 ######TO DO###
 ####modulize
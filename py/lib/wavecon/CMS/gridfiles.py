@@ -24,12 +24,12 @@ from math import cos, sin, radians
 #  Imports from third party libraries
 #------------------------------------------------------------------------------
 from numpy import array, dot, transpose, cumsum, meshgrid
-from pyproj import Proj, transform
 
 
 #------------------------------------------------------------------------------
 #  Imports from other CMS submodules
 #------------------------------------------------------------------------------
+from wavecon.projection import unproject
 
 
 #------------------------------------------------------------------------------
@@ -126,14 +126,10 @@ def georeference_grid(grid_coords, grid_info):
 
   grid_coords = dot(rot_matrix, transpose(grid_coords))
 
-  # Set up projection from grid coordinate system to WGS84 lat/lons.
-  grid_proj = Proj(init = grid_info['grid_epsg_code'])
-  wgs84 = Proj(init = 'epsg:4326')
-
+  # Project from the grid coordinate system to WGS84 lat/lons.
   grid_origin = grid_info['grid_origin']
-  lons, lats = transform(grid_proj, wgs84,
-    grid_coords[0,:] + grid_origin[0],
-    grid_coords[1,:] + grid_origin[1] )
+  lons, lats = unproject(grid_coords[0,:] + grid_origin[0],
+    grid_coords[1,:] + grid_origin[1], grid_info['grid_epsg_code'])
 
   return zip(lons, lats)
 
@@ -8,13 +8,16 @@ import datetime #sposix support
 import glob #file wildcard support
 import re #regex support
 from numpy import * #math support
+import numpy as np
 import DBman
+from projection import project,unproject,project_corners,polygon_wkt
 from math import sin,cos,atan2,degrees
-from griddata import griddata
+from regrid import grid_operator
 strptime = datetime.datetime.strptime
 
 import tempfile
-import shutil
+from fractions import Fraction
+from decimal import Decimal, ROUND_HALF_UP
 
 ################################
 # DEFINE POSTGIS BOX-OBJECT
@@ -27,10 +30,12 @@ def makebox(model_config):
     north = model_config['north']
     projection = model_config['projection']
     
-    #create box2d object (in projected coordinates)
-    point_ll = 'ST_TRANSFORM(ST_SETSRID(ST_POINT('+west+','+south+'),4236),'+projection+')'
-    point_ur = 'ST_TRANSFORM(ST_SETSRID(ST_POINT('+east+','+north+'),4326),'+projection+')'
-    box = 'ST_SETSRID(ST_MAKEBOX2D('+point_ll+','+point_ur+'),'+projection+')'
+    #the box is square in projected coordinates. its corners are
+    #projected here and handed to the queries as a wgs84 polygon literal,
+    #so postgres has nothing left to transform
+    x0,y0,x1,y1 = project_corners(west,south,east,north,projection)
+    lons,lats = unproject([x0,x1,x1,x0],[y0,y0,y1,y1],projection)
+    box = "ST_GEOMFROMTEXT('"+polygon_wkt(lons,lats)+"',4326)"
     return box
 
 ################################
@@ -46,17 +51,8 @@ def makegrid(model_config):
     ny = int(model_config['ny'])
     projection = model_config['projection']
     
-    #build query
-    point_ll = 'ST_TRANSFORM(ST_SETSRID(ST_POINT('+west+','+south+'),4236),'+projection+')'
-    point_ur = 'ST_TRANSFORM(ST_SETSRID(ST_POINT('+east+','+north+'),4326),'+projection+')'  
-    query = 'select ST_X('+point_ll+'),ST_Y('+point_ll+'),ST_X('+point_ur+'),ST_Y('+point_ur+')'
-    
-    #execute query
-    session = DBman.startSession()
-    result = session.execute(query).fetchall()
-    west,south,east,north = result[0] 
-    session.close()
-    session.bind.dispose()  
+    #project the corners, see projection.py
+    west,south,east,north = project_corners(west,south,east,north,projection)
 
     #create meshgrid object 
     gridx = linspace(float(west),float(east),nx)
@@ -90,131 +86,156 @@ def maketimes(starttime,simduration,steeringinterval, return_timestamps = True):
           return steeringsteps
 
 ################################
-# RETREIVE DATA FROM TBLWAVE
+# FILTER RECORDS BY TIME AND BOX
 ################################
-def getwavedata(box, steeringtimes, model_config):
-    #define constants
-    projection = model_config['projection']
+def makefilter(prefix, box, steeringtimes):
+    # Builds the where clause selecting the records of a fact table (prefix
+    # 'wav', 'win' or 'cur') that lie inside box during steeringtimes.  The box
+    # comes from makebox already in the SRID of the stored locations, rather
+    # than every location being transformed to the box projection, so the
+    # GiST index on location can be used. The time range also lets Postgres
+    # skip the monthly partitions outside of it.
     starttime = steeringtimes[0]
     stoptime = steeringtimes[len(steeringtimes)-1]
     starttime = starttime.strftime('%Y%m%d %H:00' )
     stoptime = stoptime.strftime('%Y%m%d %H:00' )
     starttime = '(TIMESTAMP \''+starttime+'\')'
     stoptime = '(TIMESTAMP \''+stoptime+'\')'
-  
-    #construct query
-    q1 = ' select wavid from tblwave '
-    q2 = ' where ST_WITHIN(ST_TRANSFORM( '
-    q3 = ' wavlocation,'+projection+'),'+box+')'
-    q4 = ' and wavdatetime>='+starttime
-    q5 = ' and wavdatetime<='+stoptime
-    subquery = q1+q2+q3+q4+q5
-    q1 = ' select wavspectra,wavspectrabinid,'
-    q2 = ' wavdatetime,wavlocation,'
-    q3 = ' ST_X(ST_TRANSFORM(wavlocation,'+projection+')),'
-    q4 = ' ST_Y(ST_TRANSFORM(wavlocation,'+projection+')) '
-    q5 = ' from tblwave where wavid in ('+subquery+')'
+
+    q1 = ' where '+prefix+'datetime>='+starttime
+    q2 = ' and '+prefix+'datetime<='+stoptime
+    where = q1+q2
+    if (box != None):
+        q3 = ' and ST_WITHIN('+prefix+'location,'+box+')'
+        where = where+q3
+    return where
+
+################################
+# RETREIVE DATA FROM TBLWAVE
+################################
+def wavequery(box, steeringtimes, model_config):
+    #locations are projected after the fetch, see getwavedata
+    q1 = ' select wavspectra as spec,wavspectrabinid as specid,'
+    q2 = ' wavdatetime as time,wavlocation as loc,'
+    q3 = ' ST_X(wavlocation) as lon,'
+    q4 = ' ST_Y(wavlocation) as lat '
+    q5 = ' from tblwave'+makefilter('wav', box, steeringtimes)
     query = q1+q2+q3+q4+q5
-    
-    #execute query
-    session = DBman.startSession()
-    result = session.execute(query).fetchall()
-    if (len(result)==0): return None
-      
-    #parse result of query
-    spec,specid,wavtime = [[],[],[]]
-    wavloc,wavx,wavy = [[],[],[]]
-    for k in range(len(result)):
-        spec.append(result[k][0])
-        specid.append(result[k][1])
-        wavtime.append(result[k][2])
-        wavloc.append(result[k][3])
-        wavx.append(result[k][4])
-        wavy.append(result[k][5])
-    spec=array(spec)
-    specid=array(specid)
-    wavtime=array(wavtime)
-    wavloc=array(wavloc)
-    wavx=array(wavx)
-    wavy=array(wavy)       
-    
-    #retreive freq/dir bins
-    freq,dir = [[],[]]
-    for myspectraid in specid:
-        q1 = "select spcfreq,spcdir from "
-        q2 = "tblspectrabin where spcid='"+myspectraid+"'"
-        query = q1+q2
-        result = session.execute(query).fetchall()
-        freq.append(result[0][0])
-        dir.append(result[0][1])            
-    freq=array(freq)
-    dir=array(dir)
-    
-    #close session and return
-    session.close()
-    session.bind.dispose()
+    return query
+
+def getwavedata(box, steeringtimes, model_config):
+    query = wavequery(box, steeringtimes, model_config)
+
+    #execute query, results come back as numpy arrays
+    result = DBman.fetch_arrays(query)
+    if (len(result['time'])==0): return None
+    result['x'],result['y'] = project(result['lon'],result['lat'],
+                                      model_config['projection'])
+
+    #bins are fetched once per distinct set, nearly always a single one
+    bins = DBman.spectra_bins(unique(result['specid']))
+    freq,dir = bins.values()[0]
+    fingerprint = DBman.spectra_bin_fingerprint(freq,dir)
+    for myfreq,mydir in bins.values():
+        if (fingerprint not in DBman.spectra_bin_fingerprints(myfreq,mydir)):
+            quit('error: frequency bin mismatch!')
+
+    return wavecube(result,freq,dir)
+
+def wavecube(result,freq,dir):
+    #groups the records by location and time, spectra are laid out as a
+    #(loc x time x freq x dir) cube sharing the freq/dir axes, entries
+    #without a record are nan and marked false in 'mask'. if several
+    #records share a location and time only one of them is kept
+    locs,locindex = unique(result['loc'],return_inverse=True)
+    times,timeindex = unique(result['time'],return_inverse=True)
+    nlocs,ntimes = len(locs),len(times)
+
+    spec = empty((nlocs,ntimes)+result['spec'].shape[1:])
+    spec.fill(nan)
+    spec[locindex,timeindex] = result['spec']
+    mask = zeros((nlocs,ntimes),dtype=bool)
+    mask[locindex,timeindex] = True
+
+    #locations are stored once, so each has a single x/y
+    wavx = empty(nlocs)
+    wavy = empty(nlocs)
+    wavx[locindex] = result['x']
+    wavy[locindex] = result['y']
+
+    #return results
     wavdata = {
-      'spec':spec,'time':wavtime,'x':wavx,
-      'y':wavy,'freq':freq,'dir':dir,'loc':wavloc}
+      'spec':spec,'mask':mask,'time':times,'x':wavx,
+      'y':wavy,'freq':freq,'dir':dir,'loc':locs}
     return wavdata
 
 ################################
 # RETREIVE DATA FROM TBLWIND
 ################################
+def windquery(box, steeringtimes, model_config):
+    #locations are projected after the fetch, see getwinddata
+    q1 = ' select winspeed as speed,windirection as dir,windatetime as time,'
+    q2 = ' ST_X(winlocation) as lon,'
+    q3 = ' ST_Y(winlocation) as lat '
+    q4 = ' from tblwind'+makefilter('win', box, steeringtimes)
+    query = q1+q2+q3+q4
+    return query
+
 def getwinddata(box, steeringtimes, model_config):
 
-    #define constants
-    projection = model_config['projection']
-    starttime = steeringtimes[0]
-    stoptime = steeringtimes[len(steeringtimes)-1]
-    starttime = starttime.strftime('%Y%m%d %H:00' )
-    stoptime = stoptime.strftime('%Y%m%d %H:00' )
-    starttime = '(TIMESTAMP \''+starttime+'\')'
-    stoptime = '(TIMESTAMP \''+stoptime+'\')'
+    #wind stored as a cube is read straight from its file
+    cube = getwindcube(steeringtimes, model_config)
+    if (cube != None):
+        return cubetowinddata(cube, model_config)
 
-    #construct query
-    q1 = ' select winid from tblwind where'
-    q2 = ' windatetime>='+starttime
-    q3 = ' and windatetime<='+stoptime
-    subquery = q1+q2+q3
-    if (box != None):
-        q4 = ' and ST_WITHIN(ST_TRANSFORM( '
-        q5 = ' winlocation,'+projection+'),'+box+')'
-        subquery = subquery+q4+q5
-    q1 = ' select winspeed,windirection,windatetime,'
-    q2 = ' ST_X(ST_TRANSFORM(winlocation,'+projection+')),'
-    q3 = ' ST_Y(ST_TRANSFORM(winlocation,'+projection+')) '
-    q4 = ' from tblwind where winid in ('+subquery+')'
-    query = q1+q2+q3+q4
+    query = windquery(box, steeringtimes, model_config)
+
+    #execute query, results come back as numpy arrays
+    result = DBman.fetch_arrays(query)
+    if (len(result['time'])==0): return None
+    winspeed = result['speed']
+    windir = result['dir']
+    wintime = result['time']
+    winx,winy = project(result['lon'],result['lat'],
+                        model_config['projection'])
 
-    #execute query
-    session = DBman.startSession()
-    result = session.execute(query).fetchall()
-    if (len(result)==0): return None
-
-    #parse results
-    wintime, winx, winy = [[],[],[]]
-    winspeed, windir, winid = [[],[],[]] 
-    for k in range(len(result)):
-        winspeed.append(result[k][0])
-        windir.append(result[k][1])
-        wintime.append(result[k][2])
-        winx.append(result[k][3])
-        winy.append(result[k][4])
-    winspeed=array(winspeed)
-    windir=array(windir)
-    wintime=array(wintime)
-    winx=array(winx)
-    winy=array(winy)
-
-    #close session and return
-    session.close()
-    session.bind.dispose()
+    #return results
     windata = {
         'speed':winspeed,'dir':windir,
         'time':wintime,'x':winx,'y':winy }
     return windata
 
+################################
+# RETREIVE DATA FROM A WIND CUBE
+################################
+def getwindcube(steeringtimes, model_config):
+    #reads the cells around the model box at the steering times as
+    #(time,y,x) arrays, None if no stored cube holds them. cubes are only
+    #written, and so only looked for, when "windstore" is set in the config
+    if not model_config.get('windstore'):
+        return None
+    import windstore
+
+    west = float(model_config['west'])
+    south = float(model_config['south'])
+    east = float(model_config['east'])
+    north = float(model_config['north'])
+    wintype = model_config.get('wintype')
+    return windstore.read_wind(steeringtimes,west,south,east,north,wintype)
+
+def cubetowinddata(cube, model_config):
+    #lays a cube out like the records returned by getwinddata
+    projection = model_config['projection']
+    ntimes = len(cube['time'])
+    x,y = project(cube['lon'].ravel(),cube['lat'].ravel(),projection)
+
+    windata = {
+        'speed':cube['speed'].reshape(ntimes,-1).ravel(),
+        'dir':cube['dir'].reshape(ntimes,-1).ravel(),
+        'time':repeat(array(cube['time'],dtype='datetime64[us]'),x.size),
+        'x':tile(x,ntimes),'y':tile(y,ntimes) }
+    return windata
+
 ################################
 # INTERPOLATE SPECTRA TO NEW
 # DIRECTION BINS, CMS EXPECTS 
@@ -226,24 +247,24 @@ def getwinddata(box, steeringtimes, model_config):
 def interpolatespectra(wavdata):
   
     spec = wavdata['spec']
-    dir = wavdata['dir']
+    dir = array(wavdata['dir'],dtype=float)
     
-    #cycle through each spectra
-    for k in range(len(spec)):
-        filter = dir[k]>90
-        dir[k][filter] = dir[k][filter]-360
-        sortorder = argsort(dir[k])
-        sorted_dirs = dir[k][sortorder]
-        mydirs = linspace(-90,90,len(dir[k]))
-        #cycle through each frequency-row of spectra
-        for f in range(len(spec[k])):
-            sorted_spec = spec[k][f][sortorder]
-            spec[k][f] = interp(mydirs,sorted_dirs,sorted_spec)
-            dir[k] = array(mydirs)
+    #the bins are shared, so the weights of the linear interpolation
+    #are found once and applied to every spectrum of the cube
+    dir[dir>90] = dir[dir>90]-360
+    sortorder = argsort(dir)
+    sorted_dirs = dir[sortorder]
+    mydirs = linspace(-90,90,len(dir))
+    upper = clip(searchsorted(sorted_dirs,mydirs),1,len(dir)-1)
+    lower = upper-1
+    weight = (mydirs-sorted_dirs[lower])/(sorted_dirs[upper]-sorted_dirs[lower])
+    weight = clip(weight,0,1)
+    spec = spec[...,sortorder]
+    spec = spec[...,lower]*(1-weight)+spec[...,upper]*weight
 
     #push new values into wavdata and return
-    wavdata['spec']=array(spec)
-    wavdata['dir']=array(dir)
+    wavdata['spec']=spec
+    wavdata['dir']=mydirs
     return wavdata
 
 ################################
@@ -254,15 +275,12 @@ def calculatepeakfreq(wavdata):
     spec = wavdata['spec']
     freq = wavdata['freq']
 
-    peakfreqindex = spec.max(1).argmax(1)
-    peakfreq = []
-    k=0
-    for index in peakfreqindex:
-        peakfreq.append(freq[k][index])
-        k=k+1
+    #the peak is taken along the frequency axis of each (loc x time)
+    #spectrum, after the maximum over directions
+    peakfreqindex = nan_to_num(spec).max(-1).argmax(-1)
 
     #push new values into wavdata
-    wavdata['peakfreq'] = array(peakfreq)
+    wavdata['peakfreq'] = freq[peakfreqindex]
     return wavdata
 
 ################################
@@ -276,17 +294,10 @@ def gen_wavefiles(wavdata, steeringtimes, model_config, output_path):
     wavdata = interpolatespectra(wavdata)
     wavdata = calculatepeakfreq(wavdata)  
 
-    tmpdir = tempfile.gettempdir()
-    nestfn = 'nest.dat'
-    metafn = 'nest.meta'
-
-    loc = wavdata['loc']
-    freq = wavdata['freq']
+    freq = wavdata['freq'].tolist()
     dir = wavdata['dir']
     wavx = wavdata['x']
     wavy = wavdata['y']
-    wavloc = wavdata['loc']
-    wavtime = wavdata['time']
     peakfreq = wavdata['peakfreq']
     spec = wavdata['spec']
 
@@ -299,69 +310,213 @@ def gen_wavefiles(wavdata, steeringtimes, model_config, output_path):
     win_dat = [(speed, direc) for speed, direc in (line.split() for
         line in windat)]
     
-    #FIND DISTINCT LOCATIONS
-    locset = [x for x in set(loc)]
-    sortorder = argsort(locset)
-    locset = array(locset)[sortorder]
+    #DISTINCT LOCATIONS COME SORTED, EACH WITH ONE SET OF BINS. THE
+    #STEERINGTIMES ARE LOOKED UP ONCE FOR ALL OF THEM
+    steps = engsteps(wavdata, steeringtimes)
     
-    #WRITE METAFILE HEADER
-    nestfn = '/'.join([tmpdir,nestfn])
-    metafn = '/'.join([tmpdir,metafn])
-    metafile = open(metafn,'w')
-    metafile.write(nestfn+'\n')
-    metafile.write(str(len(locset))+'\n0\n')
-    counter=0
-    for myloc in locset:
-      wind = iter(win_dat)
-      #CHECK THAT ALL FREQUENCY BINS MATCH
-      filter = (loc==myloc)
-      myfreq = freq[filter].tolist()
-      nf = len(myfreq[0])
-      nd = len(dir[0])
-      myfreqstr = [' '.join([str(i) for i in f]) for f in myfreq]
-      if (len(set(myfreqstr))>1):
-        quit('error: frequency bin mismatch!')
-      fn = 'WAVE.'+str(counter)+'.eng'
-      fn = '/'.join([tmpdir,fn])
-      counter=counter+1
-      #ADD META DATA TO METAFILE
-      myx = set(wavx[filter])
-      myy = set(wavy[filter])
-      if (len(myx)>1 or len(myy)>1):
-        quit('error: coordinate mismatch!')
-      myx = wavx[filter][0]
-      myy = wavy[filter][0]
-      metafile.write(fn+'\n')
-      metafile.write(str(myx)+' '+str(myy)+'\n')
-      #WRITE SPEC FILE HEADER
-      file=open(fn,'w')
-      file.write( str(nf) + ' ' + str(nd) + '\n' )
-      file.write( myfreqstr[0] + '\n')
-      #WRITE CONSECUTIVE TIMESTEPS TO FILE 
-      for mytime in steeringtimes:
-        filter = logical_and( wavloc==myloc, wavtime==mytime)
-        if (all(filter==False)):
-          #CANT HANDLE MISSING DATA
-          quit('\n\nno data exists for time: '+str(mytime)+'\n\n')
-        else:
-          #WRITE SINGLE TIMESTEP DATA TO SPEC FILE
-          filter = filter.tolist().index(True)
-          win_speed, win_dir = wind.next()
-          line = ' '.join([
-            str(mytime.strftime('%m%d%H')),win_speed,win_dir,
-            str(peakfreq[filter]),'0'])
-          file.write(line+'\n')
-          for f in range(len(freq[filter])):
-            line = ' '.join([str(d) for d in spec[filter][f]])
-            file.write('\t'+line+'\n')
-      file.close()
-    metafile.close()
-    winfile.close()
-    os.system('mergeENG < '+metafn)
-    os.system('rm /'+tmpdir+'/*.eng '+metafn)
-    shutil.copy(nestfn, output_path)
+    #NEST.DAT IS WRITTEN NEXT TO THE OUTPUT AND MOVED INTO PLACE ONCE IT IS
+    #COMPLETE, SO CONCURRENT RUNS NEVER SHARE A FILE
+    handle,nestfn = tempfile.mkstemp(suffix='.dat',
+        dir=os.path.dirname(os.path.abspath(output_path)))
+    nestfile = os.fdopen(handle,'w')
+    try:
+      write_nestfile(nestfile, freq, spec[:,steps],
+        peakfreq[:,steps].tolist(), wavx, wavy, steeringtimes, win_dat)
+      nestfile.close()
+      os.rename(nestfn, output_path)
+    except:
+      nestfile.close()
+      os.remove(nestfn)
+      raise
     return 
 
+def engsteps(wavdata, steeringtimes):
+    #cube columns of the steeringtimes, every location must hold them
+    timeindex = dict((t,j) for j,t in enumerate(wavdata['time'].tolist()))
+    steps = []
+    for mytime in steeringtimes:
+      j = timeindex.get(mytime)
+      if (j==None or not all(wavdata['mask'][:,j])):
+        #CANT HANDLE MISSING DATA
+        quit('\n\nno data exists for time: '+str(mytime)+'\n\n')
+      steps.append(j)
+    return steps
+
+def englines(freq, dir, spec, peakfreq, steeringtimes, win_dat):
+    #lines of a spec file, spec holds a (time x freq x dir) spectrum
+    #per steeringtime. a whole spectrum is laid out by one format string,
+    #%r writes each value as str() of a numpy float does. so does the
+    #peak frequency, str() of a python float keeps only 12 digits
+    nf = len(freq)
+    nd = len(dir)
+    specfmt = ('\t'+' '.join(['%r']*nd)+'\n')*nf
+    lines = [str(nf)+' '+str(nd)+'\n', ' '.join([str(f) for f in freq])+'\n']
+    for k in range(len(steeringtimes)):
+      win_speed, win_dir = win_dat[k]
+      lines.append(' '.join([
+        str(steeringtimes[k].strftime('%m%d%H')),win_speed,win_dir,
+        '%r' % peakfreq[k],'0'])+'\n')
+      lines.append(specfmt % tuple(spec[k].ravel().tolist()))
+    return lines
+
+def write_nestfile(file, freq, spec, peakfreq, wavx, wavy,
+                   steeringtimes, win_dat):
+    #streams the nest.dat spectral input of CMS-Wave in a single pass,
+    #byte for byte as mergeENG merged it from the spec files englines()
+    #writes for each location: the bin counts and frequencies once, then
+    #for every steeringtime the record of each location in turn. spec is a
+    #(loc x time x freq x dir) cube holding only the steeringtimes
+    nf = len(freq)
+    nd = spec.shape[-1]
+    if (nf<3):
+      raise ValueError('mergeENG needs at least 3 frequency bins')
+
+    #mergeENG READS EVERY VALUE AS A SINGLE PRECISION REAL FROM THE TEXT
+    #THE SPEC FILES AND THE METAFILE HOLD
+    freqtext = [str(f) for f in freq]
+    freq = engsingles([float(f) for f in freqtext], freqtext)
+    spec = engsingles(spec)
+    if (not np.isfinite(spec).all()):
+      raise ValueError('mergeENG cannot read spectra that are not finite')
+    peaktext = ['%r' % p for mypeak in peakfreq for p in mypeak]
+    peakfreq = engsingles([float(p) for p in peaktext],
+        peaktext).reshape(len(wavx),-1)
+    xytext = [str(x) for x in wavx]+[str(y) for y in wavy]
+    xy = engsingles([float(v) for v in xytext], xytext).reshape(2,-1)
+    windtext = [v for wind in win_dat[:len(steeringtimes)] for v in wind]
+    wind = engsingles([float(v) for v in windtext], windtext).reshape(-1,2)
+
+    #SIGNIFICANT WAVE HEIGHT OF EACH RECORD, SUMMED IN SINGLE PRECISION
+    #AND IN THE SAME ORDER AS mergeENG DOES
+    one = np.float32
+    df = np.empty(nf, dtype=np.float32)
+    df[1:-1] = one(0.5)*(freq[2:]-freq[:-2])
+    df[0] = df[1]
+    df[-1] = df[-2]
+    dtheta = one(180)/one(nd+1)*(one(np.pi)/one(180))
+    m0 = np.zeros(spec.shape[:2], dtype=np.float32)
+    for j in range(nd):
+      for i in range(nf):
+        m0 = m0+spec[:,:,i,j]*df[i]
+    with np.errstate(invalid='ignore'):
+      hs = one(4)*np.sqrt(m0*dtheta)
+
+    #list-directed header, the shore-normal orientation is always 0
+    file.write('%12d%12d%12d' % (nf, nd, len(wavx))+'   0.000000    \n')
+    #(5(E15.7))
+    file.write(''.join([''.join(fortrane(f,15,7) for f in freq[i:i+5])+'\n'
+        for i in range(0,nf,5)]))
+
+    #(17(1x,f8.3)) FOR EACH FREQUENCY ROW OF A SPECTRUM
+    rows = ''.join(['%9.3f'*len(range(i,min(i+17,nd)))+'\n'
+        for i in range(0,nd,17)])
+    specfmt = rows*nf
+    spec, overflow = fortranf_array(spec, 8, 3)
+    for k in range(len(steeringtimes)):
+      date = int(steeringtimes[k].strftime('%m%d%H'))
+      lines = []
+      for i in range(len(wavx)):
+        #(2x,i8,2f8.2,f8.4,f8.2,2f15.2,f8.3)
+        lines.append(''.join(['  ',fortrani(date,8),fortranf(wind[k,0],8,2),
+          fortranf(wind[k,1],8,2),fortranf(peakfreq[i,k],8,4),
+          fortranf(0,8,2),fortranf(xy[0,i],15,2),fortranf(xy[1,i],15,2),
+          fortranf(hs[i,k],8,3)])+'\n')
+        if (overflow[i,k].any()):
+          values = iter([fortranf(v,8,3) for v in spec[i,k].ravel()])
+          lines.append(rows.replace('%9.3f','%s')*nf % tuple(
+              ' '+v for v in values))
+        else:
+          lines.append(specfmt % tuple(spec[i,k].ravel().tolist()))
+      file.write(''.join(lines))
+    return
+
+################################
+# mergeENG's FORTRAN READS AND WRITES
+################################
+def engsingles(values, texts=None):
+    #the single precision reals mergeENG reads from the text of values,
+    #repr() unless texts are given. going through the double rounds
+    #twice, which only differs from reading the text straight to single
+    #precision when the double lies halfway between two singles
+    values = np.asarray(values, dtype=np.float64)
+    singles = values.astype(np.float32)
+    with np.errstate(invalid='ignore', over='ignore'):
+      lower = np.nextafter(singles, np.float32(-np.inf))
+      upper = np.nextafter(singles, np.float32(np.inf))
+      below = (singles.astype(np.float64)+lower)/2
+      above = (singles.astype(np.float64)+upper)/2
+    for index in zip(*np.nonzero((values==below) | (values==above))):
+      value = values[index]
+      if (texts==None):
+        text = repr(float(value))
+      else:
+        text = texts[np.ravel_multi_index(index, values.shape)]
+      if (value==below[index]):
+        low, high = lower[index], singles[index]
+      else:
+        low, high = singles[index], upper[index]
+      exact = Fraction(text)
+      if (exact>Fraction(value)):
+        singles[index] = high
+      elif (exact<Fraction(value)):
+        singles[index] = low
+    return singles
+
+def fortrani(value, w):
+    #Iw
+    text = '%d' % value
+    if (len(text)>w):
+      return '*'*w
+    return text.rjust(w)
+
+def fortranf(value, w, d):
+    #Fw.d of a single precision real. the runtime mergeENG was built with
+    #rounds halves of the exact value away from zero, and drops the sign
+    #of negative values that round to zero
+    value = float(value)
+    if (np.isnan(value)):
+      return 'NaN'.rjust(w)
+    if (np.isinf(value)):
+      sign = '-' if value<0 else '+'
+      if (w<3 or (w==3 and sign=='-')):
+        return '*'*w
+      return (sign+'Infinity').rjust(w) if w>8 else (sign+'Inf').rjust(w)
+    scaled = int(np.floor(abs(value)*10**d+0.5))
+    text = '%d.%0*d' % (scaled//10**d, d, scaled%10**d)
+    if (value<0 and scaled>0):
+      text = '-'+text
+    if (len(text)>w):
+      return '*'*w
+    return text.rjust(w)
+
+def fortranf_array(values, w, d):
+    #values as fortranf() rounds them, for formatting with %(w+1).(d)f, and
+    #where they overflow the field and need fortranf() itself
+    scaled = np.floor(np.abs(values.astype(np.float64))*10**d+0.5)
+    rounded = np.copysign(scaled, values)/10**d+0.0
+    overflow = scaled>=np.where(values<0, 10.0**(w-2), 10.0**(w-1))
+    return rounded, overflow
+
+def fortrane(value, w, d):
+    #Ew.d of a single precision real, digits rounded as fortranf() does
+    value = Decimal(float(value))
+    exponent = 0
+    digits = '0'*d
+    if (value!=0):
+      exponent = abs(value).adjusted()+1
+      mantissa = abs(value).scaleb(-exponent).quantize(
+          Decimal(1).scaleb(-d), rounding=ROUND_HALF_UP)
+      if (mantissa>=1):
+        mantissa = mantissa/10
+        exponent = exponent+1
+      digits = str(mantissa)[2:]
+    text = '0.'+digits+'E'+('%+03d' % exponent)
+    if (value<0):
+      text = '-'+text
+    if (len(text)>w):
+      return '*'*w
+    return text.rjust(w)
+
 ################################
 # GENERATE A CMS WIND FILE 
 ################################
@@ -374,44 +529,59 @@ def gen_windfiles(windata,grid,steeringtimes,model_config,output_path):
   tmpdir = tempfile.gettempdir()
   nx = int(model_config['nx'])
   ny = int(model_config['ny'])
-  winspeed = windata['speed']
-  windir = windata['dir']
-  wintime = windata['time']
-  winx = windata['x']
-  winy = windata['y']
   gridx=array(grid[0])
   gridy=array(grid[1])
 
-  ugrid,vgrid=[[],[]]
+  #records are sorted by time and location once, so every steeringtime
+  #is a slice holding its points in the same order
+  order = lexsort((windata['y'],windata['x'],windata['time']))
+  wintime = windata['time'][order]
+  winx = windata['x'][order]
+  winy = windata['y'][order]
+  #math's cos/sin shadow numpy's here and only take single values
+  vel_x = windata['speed'][order]*np.cos(windata['dir'][order])
+  vel_y = windata['speed'][order]*np.sin(windata['dir'][order])
+  steps = []
+  for mytime in steeringtimes:
+    first = searchsorted(wintime,datetime64(mytime,'us'),'left')
+    last = searchsorted(wintime,datetime64(mytime,'us'),'right')
+    if (first==last): #CANT HANDLE MISSING DATA
+      quit('\n\nno data exists for time: '+str(mytime)+'\n\n')
+    steps.append(slice(first,last))
+
+  #INTERPOLATE ALL TIMESTEPS AND BOTH COMPONENTS AT ONCE, THE WEIGHTS ARE
+  #WORKED OUT ONCE FOR THE POINTS AND GRID, SEE regrid.py
+  operators = [grid_operator(winx[s],winy[s],gridx,gridy) for s in steps]
+  if all([operator is operators[0] for operator in operators]):
+    newvel_x,newvel_y = operators[0].apply(
+      [[vel_x[s] for s in steps],[vel_y[s] for s in steps]])
+  else:
+    newvel_x = array([operators[k].apply(vel_x[s])
+                      for k,s in enumerate(steps)])
+    newvel_y = array([operators[k].apply(vel_y[s])
+                      for k,s in enumerate(steps)])
+
   windfn = '/'.join([tmpdir,'wind.dat']) 
   avewindfn = '/'.join([tmpdir,'avewind.dat'])
   winfile = open(windfn,'w')
   avewinfile = open(avewindfn, 'w')
   line = str(nx)+' '+str(ny)+'\n'
   winfile.write(line)
-  for mytime in steeringtimes:
-    filter = (wintime==mytime)
-    if (all(filter==False)): #CANT HANDLE MISSING DATA
-      quit('\n\nno data exists for time: '+str(mytime)+'\n\n')
-    else: #INTERPOLATE SINGLE TIMESTEP
-      myx = winx[filter]
-      myy = winy[filter]
-      vel_x = winspeed[filter]*map(cos,windir[filter])
-      vel_y = winspeed[filter]*map(sin,windir[filter])
-      newvel_x = griddata(myx,myy,vel_x,gridx,gridy)
-      newvel_y = griddata(myx,myy,vel_y,gridx,gridy)
-      avevel_x = mean(newvel_x)
-      avevel_y = mean(newvel_y)
-      win_speed = sqrt(avevel_x**2 + avevel_y**2)
-      win_dir = degrees(atan2(avevel_y, avevel_x))
-      #WRITE SINGLE TIMESTEP TO INPUT FILE
-      winfile.write(mytime.strftime('%m%d%H')+'\n')
-      lines = ['\n'.join([' '.join([str(newvel_x[i][j])+' '+
-              str(newvel_y[i][j]) for j in range(nx)])])
-              for i in range(ny)[::-1]]
-      lines = '\n'.join(lines)
-      winfile.write(lines+'\n')
-      avewinfile.write('{0} {1}\n'.format(win_speed, win_dir))
+
+  #a grid is laid out by one format string, north row first with the
+  #components of each cell side by side. %r writes each value as str() does
+  gridfmt = (' '.join(['%r']*(2*nx))+'\n')*ny
+  for k in range(len(steeringtimes)):
+    mytime = steeringtimes[k]
+    avevel_x = mean(newvel_x[k])
+    avevel_y = mean(newvel_y[k])
+    win_speed = sqrt(avevel_x**2 + avevel_y**2)
+    win_dir = degrees(atan2(avevel_y, avevel_x))
+    #WRITE SINGLE TIMESTEP TO INPUT FILE
+    winfile.write(mytime.strftime('%m%d%H')+'\n')
+    cells = dstack((newvel_x[k][::-1],newvel_y[k][::-1]))
+    winfile.write(gridfmt % tuple(cells.ravel().tolist()))
+    avewinfile.write('{0} {1}\n'.format(win_speed, win_dir))
   winfile.close()
   avewinfile.close()
   os.system('mv ' + windfn + ' ' + output_path)
@@ -40,16 +40,37 @@ from string import ascii_lowercase
 import csv
 import tempfile
 import os
+import cPickle as pickle
+from contextlib import contextmanager
+from datetime import datetime
+import struct
+import re
+import itertools
+from uuid import uuid4
+import sys
+import time
+import threading
+import Queue
+import hashlib
 
 #------------------------------------------------------------------------------
 #  Imports from third party libraries
 #------------------------------------------------------------------------------
-from sqlalchemy import create_engine, MetaData
+import numpy
+
+from sqlalchemy import create_engine, MetaData, event
+from sqlalchemy import types, Column, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, synonym
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.dialects.postgresql import ARRAY, DOUBLE_PRECISION, TIMESTAMP
 
 from geoalchemy import GeometryColumn, SpatialElement
+from geoalchemy import WKTSpatialElement, WKBSpatialElement
+from geoalchemy.base import PersistentSpatialElement
 from geoalchemy import Point
+from geoalchemy.geometry import Geometry
 
 
 #------------------------------------------------------------------------------
@@ -62,13 +83,79 @@ def mkDbURL( DBconfig ):
 
   return url
 
-DB_ENGINE = create_engine(mkDbURL(DB_CONFIG))
-# SQLAlchmey whines because it can't figure out what to do with
-# GIS columns in the database.  This shuts it up.
+class _CountingQueuePool(QueuePool):
+  # A QueuePool that keeps track of how it is being used so that scripts can
+  # tell whether the pool is sized correctly.  See pool_stats().
+  checkouts = 0
+  waits = 0
+  timeouts = 0
+  peak_overflow = 0
+
+  def _do_get(self):
+    self.checkouts += 1
+    if self._max_overflow > -1 and self._pool.empty() and \
+      self._overflow >= self._max_overflow:
+      # Every connection is in use and no more may be opened.  This checkout
+      # will block until somebody returns a connection.
+      self.waits += 1
+
+    try:
+      connection = QueuePool._do_get(self)
+    except TimeoutError:
+      self.timeouts += 1
+      raise
+
+    self.peak_overflow = max(self.peak_overflow, self.overflow())
+
+    return connection
+
+
+def mkEngine( DBconfig ):
+  # Connection pool settings may be tuned through an optional "pool" entry in
+  # dbconfig.json.  See wavecon.config.DBconfig.
+  pool_config = DBconfig.get('pool', {})
+
+  return create_engine(mkDbURL(DBconfig),
+    poolclass = _CountingQueuePool,
+    pool_size = pool_config.get('size', 5),
+    max_overflow = pool_config.get('max_overflow', 10),
+    pool_timeout = pool_config.get('timeout', 30),
+    pool_recycle = pool_config.get('recycle', 3600)
+  )
+
+# A single engine, and therefore a single connection pool, is shared by
+# everything in the process.  Sessions borrow connections from the pool and
+# give them back when they are closed.
+DB_ENGINE = mkEngine(DB_CONFIG)
+_Session = sessionmaker(bind=DB_ENGINE)
+# Creating the engine does not touch the database.  Table definitions are
+# reflected lazily, one table at a time, the first time accessTable() asks for
+# them---see _reflectTable() below.  The partitioned tables are the exception,
+# see _DECLARED_TEMPLATES.
 DB_META = MetaData(bind=DB_ENGINE)
-with catch_warnings():
-  simplefilter('ignore')
-  DB_META.reflect()
+
+# Pristine copies of every table reflected so far.  DB_META gets modified by
+# the declarative classes (GeometryColumn replaces the reflected location
+# columns) so it is this object that is pickled to the metadata cache.
+_REFLECTED_META = MetaData()
+_METADATA_CACHE_CHECKED = False
+_SCHEMA_FINGERPRINT = None
+
+# Changes to any column or constraint in the current schema will change this
+# fingerprint and invalidate the on-disk metadata cache.
+_SCHEMA_FINGERPRINT_QUERY = """
+  SELECT md5(array_to_string(ARRAY(
+    SELECT c.table_name || '.' || c.column_name || ':' || c.data_type || ':' ||
+      c.is_nullable || ':' || coalesce(c.column_default, '')
+    FROM information_schema.columns c
+    WHERE c.table_schema = current_schema()
+    UNION ALL
+    SELECT t.table_name || '.' || t.constraint_name || ':' || t.constraint_type
+    FROM information_schema.table_constraints t
+    WHERE t.table_schema = current_schema()
+    ORDER BY 1
+  ), ','))
+"""
 
 
 #------------------------------------------------------------------------------
@@ -78,7 +165,7 @@ def _tblSourceTypeTmpl( tableName, BaseClass ):
 
   class SourceType(BaseClass):
     __tablename__ = tableName
-    __table_args__ = {'autoload' : True, 'useexisting' : True } 
+    __table_args__ = {'useexisting' : True }
 
     def __init__( self, sourceTypeName = None ):
       self.sourcetypename = sourceTypeName
@@ -97,7 +184,7 @@ def _tblSourceTmpl( tableName, BaseClass ):
 
   class Source(BaseClass):
     __tablename__ = tableName
-    __table_args__ = {'autoload' : True, 'useexisting' : True } 
+    __table_args__ = {'useexisting' : True }
 
     def __init__( self, srcName = None, srcConfig = None, 
       srcBeginExecution = None , srcEndExecution = None, 
@@ -124,7 +211,7 @@ def _tblSpectraBinTmpl( tableName, BaseClass ):
 
   class SpectraBin(BaseClass):
     __tablename__ = tableName
-    __table_args__ = {'autoload' : True, 'useexisting' : True } 
+    __table_args__ = {'useexisting' : True }
 
     def __init__( self, spcFreq = None, spcDir = None ):
       self.spcfreq = spcFreq
@@ -139,13 +226,26 @@ def _tblSpectraBinTmpl( tableName, BaseClass ):
   return SpectraBin
 
 
+# SQLAlchemy 0.7 cannot reflect partitioned tables, so the tables below
+# declare their columns, in the order of db/design/wave.psql, rather than
+# reading them from the database.  The primary keys include the datetime
+# partition key.
 def _tblWaveTmpl( tableName, BaseClass ):
 
   BaseClass = spatiallyEnable(BaseClass)
 
   class Wave(BaseClass):
     __tablename__ = tableName
-    __table_args__ = {'autoload' : True, 'useexisting' : True } 
+    __table_args__ = {'useexisting' : True }
+    wavid = Column( types.Text, primary_key = True,
+      server_default = text('uuid_generate_v4()') )
+    wavsourceid = Column( types.Text, nullable = False )
+    wavspectrabinid = Column( types.Text, nullable = False )
+    wavdatetime = Column( TIMESTAMP, primary_key = True )
+    wavspectra = Column( ARRAY(DOUBLE_PRECISION) )
+    wavheight = Column( DOUBLE_PRECISION )
+    wavpeakdir = Column( DOUBLE_PRECISION )
+    wavpeakperiod = Column( DOUBLE_PRECISION )
     wavlocation = GeometryColumn( Point(2) )
 
     def __init__( self, wavSourceID = None, wavSpectraBinID = None, 
@@ -182,7 +282,13 @@ def _tblWindTmpl( tableName, BaseClass ):
 
   class Wind(BaseClass):
     __tablename__ = tableName
-    __table_args__ = {'autoload' : True, 'useexisting' : True } 
+    __table_args__ = {'useexisting' : True }
+    winid = Column( types.Text, primary_key = True,
+      server_default = text('uuid_generate_v4()') )
+    winsourceid = Column( types.Text, nullable = False )
+    windatetime = Column( TIMESTAMP, primary_key = True )
+    winspeed = Column( DOUBLE_PRECISION, nullable = False )
+    windirection = Column( DOUBLE_PRECISION, nullable = False )
     winlocation = GeometryColumn( Point(2) )
 
     def __init__( self, winSourceID = None, winLocation = None, 
@@ -213,7 +319,13 @@ def _tblCurrentTmpl( tableName, BaseClass ):
 
   class Current(BaseClass):
     __tablename__ = tableName
-    __table_args__ = {'autoload' : True, 'useexisting' : True } 
+    __table_args__ = {'useexisting' : True }
+    curid = Column( types.Text, primary_key = True,
+      server_default = text('uuid_generate_v4()') )
+    cursourceid = Column( types.Text, nullable = False )
+    curdatetime = Column( TIMESTAMP, primary_key = True )
+    curspeed = Column( DOUBLE_PRECISION, nullable = False )
+    curdirection = Column( DOUBLE_PRECISION, nullable = False )
     curlocation = GeometryColumn( Point(2) )
 
     def __init__( self, curSourceID = None, curLocation = None, 
@@ -244,7 +356,7 @@ def _tblBathyTmpl( tableName, BaseClass ):
 
   class Bathy(BaseClass):
     __tablename__ = tableName
-    __table_args__ = {'autoload' : True, 'useexisting' : True } 
+    __table_args__ = {'useexisting' : True }
     batlocation = GeometryColumn( Point(2) )
 
     def __init__( self, batSourceID = None, batLocation = None, 
@@ -278,6 +390,9 @@ _DATABASE_TEMPLATES = {
 
 }
 
+# Templates whose tables are declared above instead of being reflected.
+_DECLARED_TEMPLATES = frozenset(['tblwave', 'tblwind', 'tblcurrent'])
+
 
 #------------------------------------------------------------------
 #  Class Utility Methods
@@ -310,26 +425,239 @@ def recoverWKT(self):
   """For records that contain a spatial component, this function will return the
   coordinates of that component as a string of `Well Known Text`_ (WKT).
 
+  Point locations are decoded locally, without querying the database.  Other
+  kinds of spatial elements are converted by the database.
+
   .. _Well Known Text: http://en.wikipedia.org/wiki/Well-known_text
   """
+  try:
+    return 'POINT({0:.15g} {1:.15g})'.format(*decode_point(self.location))
+  except ValueError:
+    pass
+
   if isinstance(self.location, SpatialElement):
-    session = startSession()
-    WKT = session.scalar(self.location.wkt)
-    session.close()
+    with session() as a_session:
+      WKT = a_session.scalar(self.location.wkt)
   elif isinstance(self.location, str):
-    WKT = location
+    WKT = self.location
   else:
     raise(RuntimeError('''Could not figure out how to recover WKT from an object
     of type {0}'''.format(type(self.location))))
 
   return WKT
 
+def recoverXY(self):
+  """For records that contain a point location, returns the coordinates of the
+  point as an ``(x, y)`` tuple.  See :py:func:`wavecon.DBman.decode_point`.
+  """
+  return decode_point(self.location)
+
 def spatiallyEnable(BaseClass):
   BaseClass.recoverWKT = recoverWKT
+  BaseClass.recoverXY = recoverXY
 
   return BaseClass
 
 
+#------------------------------------------------------------------
+#  Geometry Decoding
+#------------------------------------------------------------------
+# GeoAlchemy fetches geometry columns with ST_AsBinary(), so the coordinates
+# of every record in a result set arrive along with the records themselves.
+# Decoding them here saves a round trip to the database per record.
+_WKB_POINT_SIZE = 21
+_WKB_POINT_DTYPE = numpy.dtype([('order', 'u1'), ('type', '<u4'),
+  ('x', '<f8'), ('y', '<f8')])
+_HEX_DIGITS = frozenset('0123456789abcdefABCDEF')
+
+def _geometry_data(value):
+  # Digs the raw WKB, EWKB or WKT out of the many forms a location can take.
+  if isinstance(value, PersistentSpatialElement):
+    value = value.desc
+  if isinstance(value, (WKBSpatialElement, WKTSpatialElement)):
+    value = value.desc
+  if isinstance(value, buffer):
+    value = str(value)
+
+  return value
+
+
+def _decode_wkb(data):
+  if len(data) < 5:
+    raise ValueError('Truncated WKB geometry')
+
+  order = '<' if ord(data[0]) == 1 else '>'
+  geometry_type, = struct.unpack(order + 'I', data[1:5])
+  offset = 5
+  if geometry_type & 0x20000000:
+    # EWKB with an embedded SRID
+    offset += 4
+
+  # Strip the EWKB flags and the ISO dimension offsets before checking for
+  # the point type.
+  if (geometry_type & 0x0FFFFFFF) % 1000 != 1:
+    raise ValueError('Geometry is not a point')
+
+  return struct.unpack(order + 'dd', data[offset:offset + 16])
+
+
+def decode_point(value):
+  """Returns the coordinates of a point geometry as an ``(x, y)`` tuple
+  without contacting the database.
+
+  *value* may be a location attribute loaded by the ORM, a WKB or WKT spatial
+  element, WKB or EWKB as a byte string or a hex string (which is what a raw
+  query selecting a geometry column returns), WKT or EWKT text, or an
+  ``(x, y)`` pair.  A ``ValueError`` is raised for anything else, including
+  geometries that are not points.
+  """
+  data = _geometry_data(value)
+
+  if isinstance(data, (tuple, list)) and len(data) == 2:
+    return float(data[0]), float(data[1])
+
+  if not isinstance(data, basestring) or not data:
+    raise ValueError('Cannot decode a point from an object of type {0}'\
+      .format(type(value)))
+
+  if data[0] in '01' and set(data) <= _HEX_DIGITS:
+    return _decode_wkb(data.decode('hex'))
+
+  if data[0] in '\x00\x01':
+    return _decode_wkb(data)
+
+  match = _EWKT_POINT.match(data)
+  if match is None:
+    raise ValueError('Cannot decode a point from: {0}'.format(data[:40]))
+
+  return float(match.group(2)), float(match.group(3))
+
+
+def coordinates(values):
+  """Decodes the point locations of an entire result set at once.  *values*
+  is a sequence of records returned by a query, or of their location
+  attributes, in any form accepted by :py:func:`wavecon.DBman.decode_point`.
+  Returns two numpy arrays holding the x and y coordinates.
+
+  This replaces calling ``recoverWKT()`` on each record, which used to cost a
+  database query per record.  When every location is a little-endian WKB
+  point, which is what PostGIS hands back on x86 servers, all of them are
+  decoded in one shot by numpy.
+  """
+  data = [ _geometry_data(getattr(value, 'location', value))
+    for value in values ]
+
+  if all(isinstance(wkb, str) and len(wkb) == _WKB_POINT_SIZE and
+    wkb[0] == '\x01' for wkb in data):
+    points = numpy.frombuffer(''.join(data), dtype = _WKB_POINT_DTYPE)
+    if numpy.all(points['type'] == 1):
+      return points['x'].copy(), points['y'].copy()
+
+  points = [ decode_point(wkb) for wkb in data ]
+  x = numpy.array([ point[0] for point in points ], dtype = float)
+  y = numpy.array([ point[1] for point in points ], dtype = float)
+
+  return x, y
+
+
+#------------------------------------------------------------------
+#  Schema Reflection
+#------------------------------------------------------------------
+def _reflectTable(name):
+  # Makes sure the definition of table `name` is present in DB_META.  Tables
+  # are pulled from the on-disk metadata cache if one has been configured and
+  # is still valid, otherwise they are reflected from the database.  Tables
+  # referenced through foreign keys come along for the ride.
+  global _METADATA_CACHE_CHECKED
+
+  if name in DB_META.tables:
+    return None
+
+  cache_file = _metadataCacheFile()
+
+  if cache_file is not None and not _METADATA_CACHE_CHECKED:
+    _METADATA_CACHE_CHECKED = True
+    _loadMetadataCache(cache_file)
+    if name in DB_META.tables:
+      return None
+
+  # SQLAlchmey whines because it can't figure out what to do with
+  # GIS columns in the database.  This shuts it up.
+  with catch_warnings():
+    simplefilter('ignore')
+    _REFLECTED_META.reflect(bind = DB_ENGINE, only = [name])
+
+  _copyReflectedTables()
+
+  if cache_file is not None:
+    _writeMetadataCache(cache_file)
+
+  return None
+
+
+def _copyReflectedTables():
+  for table in _REFLECTED_META.sorted_tables:
+    if table.name not in DB_META.tables:
+      table.tometadata(DB_META)
+
+  return None
+
+
+def _metadataCacheFile():
+  # The metadata cache is opt-in.  It is switched on by adding a
+  # "metadata_cache" entry to dbconfig.json that names a directory in which
+  # pickled table definitions may be stored.
+  global _SCHEMA_FINGERPRINT
+
+  cache_dir = DB_CONFIG.get('metadata_cache')
+  if not cache_dir:
+    return None
+
+  # Only ever changes when the schema is migrated, so the engine is asked
+  # once per process rather than every time a table is reflected.
+  if _SCHEMA_FINGERPRINT is None:
+    _SCHEMA_FINGERPRINT = DB_ENGINE.scalar(_SCHEMA_FINGERPRINT_QUERY)
+
+  return os.path.join(os.path.expanduser(cache_dir),
+    'schema-{0}.pickle'.format(_SCHEMA_FINGERPRINT))
+
+
+def _loadMetadataCache(cache_file):
+  if not os.path.exists(cache_file):
+    return None
+
+  try:
+    with open(cache_file, 'rb') as cache:
+      cached_meta = pickle.load(cache)
+  except Exception as error:
+    warn(RuntimeWarning('''Ignoring unreadable metadata cache {0}: {1}'''\
+      .format(cache_file, error)))
+    return None
+
+  for table in cached_meta.sorted_tables:
+    if table.name not in _REFLECTED_META.tables:
+      table.tometadata(_REFLECTED_META)
+
+  _copyReflectedTables()
+
+  return None
+
+
+def _writeMetadataCache(cache_file):
+  cache_dir = os.path.dirname(cache_file)
+  if not os.path.isdir(cache_dir):
+    os.makedirs(cache_dir)
+
+  # Write to a temporary file and rename it into place so concurrent cron jobs
+  # never see a half-written cache.
+  fd, temp_file = tempfile.mkstemp(dir = cache_dir)
+  with os.fdopen(fd, 'wb') as cache:
+    pickle.dump(_REFLECTED_META, cache, pickle.HIGHEST_PROTOCOL)
+  os.rename(temp_file, cache_file)
+
+  return None
+
+
 #------------------------------------------------------------------
 #  Database Access Functions
 #------------------------------------------------------------------
@@ -364,6 +692,13 @@ def accessTable(DBconfig, template, name = None):
         ``'tblwavemodeled'`` for the *name* parameter.  If left
         blank it will default to the value passed for *template*
 
+  The table definition is reflected from the database the first time a table
+  is requested.  If the optional ``metadata_cache`` entry of
+  :py:data:`wavecon.config.DBconfig` names a directory, reflected definitions
+  are cached there and re-used by later processes for as long as the schema
+  does not change.  Tables made from the partitioned ``tblwave``,
+  ``tblwind`` and ``tblcurrent`` templates are declared in this module and
+  never reflected.
   """
   if DBconfig is not None:
     warn(FutureWarning('''The DBconfig argument to accessTable will be
@@ -372,12 +707,17 @@ def accessTable(DBconfig, template, name = None):
   if name is None:
     name = template
 
+  if template not in _DECLARED_TEMPLATES:
+    _reflectTable(name)
+
   BaseClass = declarative_base(metadata = DB_META)
   # Add helper methods that will filter to all classes and objects
   # through inheritance.
   BaseClass.recordToDict = recordToDict
 
   Class = _DATABASE_TEMPLATES[template]( name, BaseClass )
+  # Remembered so import_records() can find the schema of a record's table.
+  Class._template = template
 
   return Class
 
@@ -388,6 +728,11 @@ def startSession(DBconfig = None):
   by ``accessTable()`` to add objects to the database, run queries,
   perform updates and do all kinds of useful things.
 
+  The session borrows its connection from a pool shared by the whole process.
+  Call ``close()`` on it when done so that the connection is returned.  New
+  code should prefer :py:func:`wavecon.DBman.session`, which takes care of
+  this automatically.
+
   The following websites explain how to use ``session`` objects:
 
     * `SQLAlchemy documentation`_.  Describes basic usage.
@@ -408,11 +753,63 @@ def startSession(DBconfig = None):
     warn(FutureWarning('''The DBconfig argument to startSession will be
     removed soon.'''))
 
-  session = sessionmaker(bind=DB_ENGINE)()
-  return session
+  return _Session()
+
+
+@contextmanager
+def session():
+  """Context manager that provides a database session::
+
+    with DBman.session() as a_session:
+      a_session.add(record)
+
+  The session is committed when the ``with`` block finishes and rolled back
+  if an exception escapes from it.  Either way the session is closed and its
+  connection returned to the process-wide connection pool.
+  """
+  a_session = _Session()
+  try:
+    yield a_session
+    a_session.commit()
+  except:
+    a_session.rollback()
+    raise
+  finally:
+    a_session.close()
+
+
+def pool_stats():
+  """Returns a dictionary describing the state of the connection pool shared
+  by this process:
+
+    * *size*: Number of connections the pool keeps open.
+    * *checked_out*: Number of connections currently in use.
+    * *overflow*: Number of connections currently open beyond *size*.
+    * *peak_overflow*: The largest value *overflow* has reached.
+    * *checkouts*: Number of times a connection was requested from the pool.
+    * *waits*: Number of requests that had to wait for a connection to be
+      returned because the pool was exhausted.
+    * *timeouts*: Number of requests that gave up waiting.
+  """
+  pool = DB_ENGINE.pool
+
+  return {
+    'size' : pool.size(),
+    'checked_out' : pool.checkedout(),
+    'overflow' : max(pool.overflow(), 0),
+    'peak_overflow' : max(pool.peak_overflow, 0),
+    'checkouts' : pool.checkouts,
+    'waits' : pool.waits,
+    'timeouts' : pool.timeouts
+  }
 
 
 def RawPostgresConnection(config = DB_CONFIG):
+  # Connections to the default database come out of the shared pool.  Closing
+  # them hands them back rather than disconnecting.
+  if config is DB_CONFIG:
+    return DB_ENGINE.raw_connection()
+
   # Isolated imports so DBman does not crash when imported to connect to a
   # non-Postgres database.  Currently not ever done or supported, but hey, who
   # knows what the future will hold?
@@ -422,7 +819,922 @@ def RawPostgresConnection(config = DB_CONFIG):
     format(**config))
 
 
-def bulk_import(records, table_template, table_name = None):
+#------------------------------------------------------------------
+#  Partitioning
+#------------------------------------------------------------------
+# tblWave, tblWind and tblCurrent may be partitioned by month on their
+# datetime columns---see db/design/partitions.psql.  Postgres refuses rows
+# that fall outside of every partition, so DBman creates the partitions a
+# write needs before making it.
+_PARTITION_KEYS = {
+  'tblwave' : 'wavdatetime',
+  'tblwind' : 'windatetime',
+  'tblcurrent' : 'curdatetime'
+}
+_CREATE_PARTITIONS = 'SELECT create_monthly_partitions(%s, %s, %s)'
+_PARTITIONED = {}
+
+def _isPartitioned(table_name):
+  # Only ever changes when the schema is migrated, so ask the database once
+  # per process.
+  if table_name not in _PARTITIONED:
+    _PARTITIONED[table_name] = bool(DB_ENGINE.scalar('''
+      SELECT c.relkind = 'p' FROM pg_class c
+      WHERE c.relname = %s AND pg_table_is_visible(c.oid)
+      ''', table_name))
+
+  return _PARTITIONED[table_name]
+
+
+def _createPartitionsForFlush(a_session, flush_context, instances):
+  # Creates the partitions needed by new records before the session inserts
+  # them.  Runs on the session's own connection so the partitions are part of
+  # the same transaction.
+  spans = {}
+  for record in a_session.new:
+    table = getattr(record, '__table__', None)
+    if table is None or not _isPartitioned(table.name):
+      continue
+
+    timestamp = record.datetime
+    if timestamp is None:
+      continue
+
+    first, last = spans.get(table.name, (timestamp, timestamp))
+    spans[table.name] = (min(first, timestamp), max(last, timestamp))
+
+  for table_name, (first, last) in spans.iteritems():
+    a_session.connection().execute(_CREATE_PARTITIONS,
+      (table_name, first, last))
+
+  return None
+
+event.listen(_Session, 'before_flush', _createPartitionsForFlush)
+
+
+def ensure_partitions(table_name, first, last):
+  """Creates any monthly partitions of *table_name* that are needed to hold
+  records with datetimes between *first* and *last*.  Returns the number of
+  partitions created.
+
+  ``bulk_import()`` and sessions create partitions as they need them, so this
+  is only required to set partitions up ahead of time, e.g. from a cron job.
+  """
+  connection = RawPostgresConnection()
+  cursor = connection.cursor()
+
+  try:
+    cursor.execute(_CREATE_PARTITIONS, (table_name, first, last))
+    created = cursor.fetchone()[0]
+    connection.commit()
+  except:
+    connection.rollback()
+    raise
+  finally:
+    cursor.close()
+    connection.close()
+
+  return created
+
+
+def retire_partitions(table_name, older_than, drop = True):
+  """Removes the monthly partitions of *table_name* that only hold records
+  older than the datetime *older_than* and returns their names.
+
+  Removing a partition only touches the catalog, so this is much cheaper than
+  deleting the same records.  If *drop* is ``False`` the partitions are
+  detached and left behind as ordinary tables, e.g. so they can be archived
+  with ``pg_dump`` before being dropped by hand.
+  """
+  connection = RawPostgresConnection()
+  cursor = connection.cursor()
+
+  try:
+    cursor.execute('SELECT drop_monthly_partitions(%s, %s, %s)',
+      (table_name, older_than, not drop))
+    retired = [ row[0] for row in cursor.fetchall() ]
+    connection.commit()
+  except:
+    connection.rollback()
+    raise
+  finally:
+    cursor.close()
+    connection.close()
+
+  return retired
+
+
+#------------------------------------------------------------------
+#  Sources
+#------------------------------------------------------------------
+# Source type ids never change once created, so they are kept for the life of
+# the process.  Runs are named after their source type and date plus a number
+# from the tblSource_run_seq sequence, which makes every name unique without
+# probing the table for free ones.
+_SOURCE_TYPES = {}
+_SOURCE_TYPES_LOCK = threading.Lock()
+
+_SOURCE_TYPE_ID = '''
+  WITH existing AS (
+    SELECT sourcetypeid FROM tblsourcetype
+    WHERE sourcetypename = %(name)s
+    ORDER BY sourcetypeid LIMIT 1
+  ), added AS (
+    INSERT INTO tblsourcetype (sourcetypename)
+    SELECT %(name)s WHERE NOT EXISTS (SELECT 1 FROM existing)
+    RETURNING sourcetypeid
+  )
+  SELECT sourcetypeid FROM existing UNION ALL SELECT sourcetypeid FROM added
+  '''
+
+_REGISTER_SOURCE = '''
+  INSERT INTO tblsource (srcname, srcconfig, srcbeginexecution,
+    srcendexecution, srcsourcetypeid)
+  VALUES (%s || '_' || nextval('tblsource_run_seq'), %s, %s, %s, %s)
+  RETURNING srcid
+  '''
+
+def source_type_id(name):
+  """Returns the tblSourceType id of the source type *name*, adding it to the
+  table if it is new.  Ids are cached per process."""
+  sourcetypeid = _SOURCE_TYPES.get(name)
+  if sourcetypeid is not None:
+    return sourcetypeid
+
+  with _SOURCE_TYPES_LOCK:
+    if name in _SOURCE_TYPES:
+      return _SOURCE_TYPES[name]
+
+    connection = RawPostgresConnection()
+    cursor = connection.cursor()
+
+    try:
+      # Source type names are not unique in the schema, so loaders adding the
+      # same type at once take turns.
+      cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))',
+        ('tblsourcetype:' + name,))
+      cursor.execute(_SOURCE_TYPE_ID, {'name' : name})
+      _SOURCE_TYPES[name] = cursor.fetchone()[0]
+      connection.commit()
+    except:
+      connection.rollback()
+      raise
+    finally:
+      cursor.close()
+      connection.close()
+
+  return _SOURCE_TYPES[name]
+
+
+def register_source(source_type, name, begin = None, end = None,
+    config = ''):
+  """Adds a run of the source type named *source_type* to tblSource and
+  returns its id.
+
+  The run is named *name* followed by a number that is unique to the
+  database, e.g. ``NAM12_20101222_00_1042``.  *begin* and *end* are the
+  execution times of the run and default to now.
+  """
+  now = datetime.now()
+  sourcetypeid = source_type_id(source_type)
+
+  connection = RawPostgresConnection()
+  cursor = connection.cursor()
+
+  try:
+    cursor.execute(_REGISTER_SOURCE, (name, config, begin or now, end or now,
+      sourcetypeid))
+    srcid = cursor.fetchone()[0]
+    connection.commit()
+  except:
+    connection.rollback()
+    raise
+  finally:
+    cursor.close()
+    connection.close()
+
+  return srcid
+
+
+def remove_source(srcid):
+  """Deletes the run *srcid* from tblSource.  Every wind, wave and current
+  record of the run and its wind cube listing go with it, e.g. when a load
+  fails halfway and nothing of it should be kept."""
+  connection = RawPostgresConnection()
+  cursor = connection.cursor()
+
+  try:
+    cursor.execute('DELETE FROM tblsource WHERE srcid = %s', (srcid,))
+    connection.commit()
+  except:
+    connection.rollback()
+    raise
+  finally:
+    cursor.close()
+    connection.close()
+
+
+#------------------------------------------------------------------
+#  Spectral Bins
+#------------------------------------------------------------------
+# Every wave record names the frequency and direction bins of its spectrum by
+# a tblSpectraBin id.  Bin sets are identified by a fingerprint of their
+# values rounded to whole multiples of _BIN_QUANTUM, so bins that only differ
+# by parsing noise resolve to the same row.  A value within _BIN_TOLERANCE of
+# halfway between two multiples may have been rounded either way elsewhere, so
+# lookups also try the fingerprints of the other rounding before adding a new
+# row.  Fingerprints are unique in the database and the ids are kept for the
+# life of the process, so only the first lookup of a bin set costs a round
+# trip.
+_BIN_QUANTUM = 1e-3
+_BIN_TOLERANCE = 1e-5
+# Other roundings are only tried for this many values of a bin set.
+_BIN_MAX_AMBIGUOUS = 8
+_SPECTRA_BINS = {}
+_SPECTRA_BINS_LOCK = threading.Lock()
+_SPECTRA_BINS_LOADED = []
+
+_INSERT_SPECTRA_BIN = '''
+  INSERT INTO tblspectrabin (spcfreq, spcdir, spcfingerprint)
+  VALUES (%s, %s, %s)
+  ON CONFLICT (spcfingerprint)
+    DO UPDATE SET spcfingerprint = EXCLUDED.spcfingerprint
+  RETURNING spcid
+  '''
+
+_FIND_SPECTRA_BINS = '''
+  SELECT spcfingerprint, spcid FROM tblspectrabin
+  WHERE spcfingerprint = ANY(%s)
+  '''
+
+def _bin_steps(values):
+  # Each value as the multiples of _BIN_QUANTUM it may round to, the nearest
+  # first.  Integers carry no sign, so -0.0 and 0.0 agree.
+  if values is None:
+    return []
+
+  steps = []
+  for value in numpy.ravel(values):
+    scaled = float(value) / _BIN_QUANTUM
+    nearest = int(round(scaled))
+    if abs(abs(scaled - nearest) - 0.5) * _BIN_QUANTUM <= _BIN_TOLERANCE:
+      steps.append((nearest, nearest - 1 if nearest > scaled else nearest + 1))
+    else:
+      steps.append((nearest,))
+
+  return steps
+
+
+def _bin_fingerprint(freq_steps, dir_steps):
+  return hashlib.sha1('quantum:{0!r}|freq:{1}|dir:{2}'.format(_BIN_QUANTUM,
+    ','.join(str(step) for step in freq_steps),
+    ','.join(str(step) for step in dir_steps))).hexdigest()
+
+
+def spectra_bin_fingerprint(freqs, dirs):
+  """Returns the fingerprint identifying the spectral bins *freqs* and *dirs*,
+  either of which may be ``None``.  Bins that round to the same multiples of
+  0.001 share a fingerprint."""
+  return _bin_fingerprint([ steps[0] for steps in _bin_steps(freqs) ],
+    [ steps[0] for steps in _bin_steps(dirs) ])
+
+
+def spectra_bin_fingerprints(freqs, dirs):
+  """Returns every fingerprint the spectral bins *freqs* and *dirs* may have
+  been given, see :py:func:`spectra_bin_fingerprint`, which comes first.  The
+  others round the values lying within 0.00001 of halfway between two
+  multiples of 0.001 the other way."""
+  freq_steps = _bin_steps(freqs)
+  choices = freq_steps + _bin_steps(dirs)
+  ambiguous = 0
+  for i, steps in enumerate(choices):
+    if len(steps) > 1:
+      ambiguous += 1
+      if ambiguous > _BIN_MAX_AMBIGUOUS:
+        choices[i] = steps[:1]
+
+  nfreqs = len(freq_steps)
+  return [ _bin_fingerprint(steps[:nfreqs], steps[nfreqs:])
+    for steps in itertools.product(*choices) ]
+
+
+def _bin_list(values):
+  if values is None:
+    return None
+
+  return numpy.asarray(values, dtype = float).ravel().tolist()
+
+
+def _load_spectra_bins(cursor):
+  # Fills the cache with the bins already in the database.  Rows written
+  # before fingerprints were introduced, or under another rounding, are
+  # fingerprinted on the way.  When two rows share a fingerprint the one
+  # holding it in the database keeps it, otherwise the lowest id.
+  cursor.execute('''
+    SELECT spcid, spcfreq, spcdir, spcfingerprint FROM tblspectrabin
+    ORDER BY spcfingerprint IS NULL, spcid
+    ''')
+
+  for spcid, freqs, dirs, stored in cursor.fetchall():
+    fingerprint = spectra_bin_fingerprint(freqs, dirs)
+    if fingerprint != stored and fingerprint not in _SPECTRA_BINS:
+      cursor.execute('''
+        UPDATE tblspectrabin SET spcfingerprint = %s
+        WHERE spcid = %s AND NOT EXISTS (
+          SELECT 1 FROM tblspectrabin WHERE spcfingerprint = %s)
+        ''', (fingerprint, spcid, fingerprint))
+
+      if cursor.rowcount == 0:
+        # Another process gave the fingerprint to a different row first.
+        cursor.execute('''
+          SELECT spcid FROM tblspectrabin WHERE spcfingerprint = %s
+          ''', (fingerprint,))
+        spcid = cursor.fetchone()[0]
+
+    _SPECTRA_BINS.setdefault(fingerprint, spcid)
+
+  _SPECTRA_BINS_LOADED.append(True)
+
+
+def _cached_spectra_bin(fingerprints):
+  for fingerprint in fingerprints:
+    spcid = _SPECTRA_BINS.get(fingerprint)
+    if spcid is not None:
+      return spcid
+
+  return None
+
+
+def spectra_bin_id(freqs, dirs):
+  """Returns the tblSpectraBin id of the spectral bins *freqs* and *dirs*,
+  adding them to the table if they are new.  Bins stored under any of their
+  :py:func:`spectra_bin_fingerprints` are reused.
+
+  Ids are cached per process.  Concurrent loaders adding the same bins end up
+  with the same row, since fingerprints are unique.
+  """
+  fingerprints = spectra_bin_fingerprints(freqs, dirs)
+  spcid = _cached_spectra_bin(fingerprints)
+  if spcid is not None:
+    return spcid
+
+  with _SPECTRA_BINS_LOCK:
+    spcid = _cached_spectra_bin(fingerprints)
+    if spcid is not None:
+      return spcid
+
+    connection = RawPostgresConnection()
+    cursor = connection.cursor()
+
+    try:
+      if not _SPECTRA_BINS_LOADED:
+        _load_spectra_bins(cursor)
+        connection.commit()
+
+      spcid = _cached_spectra_bin(fingerprints)
+      if spcid is None:
+        # Bins added by other processes since the cache was filled.
+        cursor.execute(_FIND_SPECTRA_BINS, (fingerprints,))
+        stored = dict(cursor.fetchall())
+        for fingerprint in fingerprints:
+          if fingerprint in stored:
+            spcid = stored[fingerprint]
+            break
+
+      if spcid is None:
+        cursor.execute(_INSERT_SPECTRA_BIN, (_bin_list(freqs), _bin_list(dirs),
+          fingerprints[0]))
+        spcid = cursor.fetchone()[0]
+
+      connection.commit()
+    except:
+      connection.rollback()
+      raise
+    finally:
+      cursor.close()
+      connection.close()
+
+    _SPECTRA_BINS[fingerprints[0]] = spcid
+
+  return spcid
+
+
+# Bin values by tblSpectraBin id, filled by spectra_bins().  Bins are never
+# changed once written, so they are kept for the life of the process.
+_SPECTRA_BIN_VALUES = {}
+
+def spectra_bins(spcids):
+  """Returns a dictionary mapping each of the tblSpectraBin ids *spcids* to a
+  ``(freqs, dirs)`` pair of float arrays.
+
+  Ids that have not been seen before are looked up with a single query, so
+  readers can resolve the bins of any number of records in one round trip::
+
+    bins = DBman.spectra_bins(numpy.unique(result['specid']))
+  """
+  spcids = set(spcids)
+  missing = [ spcid for spcid in spcids if spcid not in _SPECTRA_BIN_VALUES ]
+
+  if missing:
+    connection = RawPostgresConnection()
+    cursor = connection.cursor()
+
+    try:
+      cursor.execute('''
+        SELECT spcid, spcfreq, spcdir FROM tblspectrabin
+        WHERE spcid = ANY(%s)
+        ''', (missing,))
+      for spcid, freqs, dirs in cursor.fetchall():
+        _SPECTRA_BIN_VALUES[spcid] = (numpy.array(freqs, dtype = float),
+          numpy.array(dirs, dtype = float))
+      connection.commit()
+    finally:
+      cursor.close()
+      connection.close()
+
+  unknown = spcids.difference(_SPECTRA_BIN_VALUES)
+  if unknown:
+    raise KeyError('No spectral bins with id {0}'.format(
+      ', '.join(sorted(unknown))))
+
+  return dict( (spcid, _SPECTRA_BIN_VALUES[spcid]) for spcid in spcids )
+
+
+#------------------------------------------------------------------
+#  Columnar Queries
+#------------------------------------------------------------------
+# numpy types for the Postgres type OIDs reported by cursor.description.
+# Columns of any other type are returned as arrays of Python objects.
+_NUMPY_TYPES = {
+  16 : bool,                  # boolean
+  20 : numpy.int64,           # bigint
+  21 : numpy.int16,           # smallint
+  23 : numpy.int32,           # integer
+  700 : numpy.float32,        # real
+  701 : numpy.float64,        # double precision
+  1700 : numpy.float64,       # numeric
+  1082 : 'datetime64[D]',     # date
+  1114 : 'datetime64[us]'     # timestamp
+}
+_FLOAT_ARRAY_OIDS = (1021, 1022)
+_INTEGER_TYPES = (numpy.int16, numpy.int32, numpy.int64)
+
+def _cast_float_array(value, cursor):
+  # Parses Postgres float arrays straight into numpy arrays.  The default
+  # psycopg2 caster builds nested lists of Python floats which then have to be
+  # converted a second time.
+  if value is None:
+    return None
+
+  ndim = len(value) - len(value.lstrip('{'))
+  if ndim not in (1, 2) or 'NULL' in value:
+    # Arrays with missing values or more than two dimensions are rare enough
+    # to leave to psycopg2.
+    from psycopg2.extensions import FLOATARRAY
+    return numpy.array(FLOATARRAY(value, cursor), dtype = float)
+
+  data = numpy.fromstring(value.translate(None, '{}'), sep = ',')
+  if ndim == 2:
+    data = data.reshape(value.count('{') - 1, -1)
+
+  return data
+
+def _column_array(values, type_code):
+  dtype = _NUMPY_TYPES.get(type_code, object)
+
+  if type_code in _FLOAT_ARRAY_OIDS:
+    try:
+      # Spectra of a common shape are stacked into a single array with one
+      # more dimension than the spectra themselves.
+      return numpy.array(values, dtype = float)
+    except ValueError:
+      dtype = object
+
+  if (dtype in _INTEGER_TYPES or dtype is bool) and None in values:
+    # numpy has no missing integers or booleans.  Integers fall back to
+    # floats with NaN for NULL, booleans to Python objects with None.
+    if dtype is bool:
+      dtype = object
+    else:
+      return numpy.array([ numpy.nan if value is None else value
+        for value in values ], dtype = float)
+
+  if dtype is object:
+    column = numpy.empty(len(values), dtype = object)
+    column[:] = values
+    return column
+
+  return numpy.array(values, dtype = dtype)
+
+
+def iter_arrays(query, params = None, chunk_size = 10000):
+  """Runs *query* and yields the results in chunks of up to *chunk_size* rows.
+  Each chunk is a dictionary that maps column names to numpy arrays.  See
+  :py:func:`wavecon.DBman.fetch_arrays` for the types of the arrays.
+
+  The query runs in a server-side cursor so only one chunk is held in memory
+  at a time, no matter how large the result set is.  A query that returns no
+  rows yields a single chunk of empty arrays.
+  """
+  # Isolated imports, see RawPostgresConnection()
+  from psycopg2.extensions import new_type, register_type
+
+  connection = RawPostgresConnection()
+  cursor = connection.cursor('iter_arrays_' +
+    ''.join((random.choice(ascii_lowercase) for i in xrange(8))))
+  register_type(new_type(_FLOAT_ARRAY_OIDS, 'NUMPY_FLOAT_ARRAY',
+    _cast_float_array), cursor)
+
+  try:
+    cursor.itersize = chunk_size
+    cursor.execute(query, params)
+
+    rows = cursor.fetchmany(chunk_size)
+    columns = [ (column[0], column[1]) for column in cursor.description ]
+
+    if not rows:
+      yield dict( (name, numpy.array([],
+        dtype = _NUMPY_TYPES.get(type_code, object)))
+        for name, type_code in columns )
+
+    while rows:
+      values = zip(*rows)
+      yield dict( (name, _column_array(values[i], type_code))
+        for i, (name, type_code) in enumerate(columns) )
+
+      rows = cursor.fetchmany(chunk_size)
+  finally:
+    cursor.close()
+    connection.rollback()
+    connection.close()
+
+
+def fetch_arrays(query, params = None, chunk_size = 10000):
+  """Runs *query* and returns the result as a dictionary that maps column names
+  to numpy arrays, one element per row.
+
+  Argument Info:
+
+    * *query*:
+        A SQL query string.  Parameters are written as ``%(name)s`` or ``%s``,
+        as in psycopg2.
+
+    * *params*:
+        An optional dictionary or sequence of query parameters.
+
+    * *chunk_size*:
+        The number of rows pulled from the server at a time.
+
+  Numeric columns become float or integer arrays and timestamps become
+  ``datetime64[us]`` arrays, in which ``NULL`` shows up as ``NaT``.  ``NULL``
+  shows up as ``NaN`` in float columns, and integer columns holding ``NULL``
+  are returned as float arrays for the same reason.  Boolean columns holding
+  ``NULL`` are returned as arrays of Python objects.  Float array columns such
+  as ``wavspectra`` are stacked, so a query returning N spectra of shape
+  (nfreq, ndir) gives an array of shape (N, nfreq, ndir).  Other columns,
+  including geometries, are returned as arrays of Python objects.
+
+  Rows are fetched in chunks from a server-side cursor.  psycopg2 still builds
+  a tuple per row, but only for one chunk at a time, and the chunk is
+  converted column by column rather than value by value.
+  """
+  chunks = list(iter_arrays(query, params, chunk_size))
+
+  return dict( (name, numpy.concatenate([ chunk[name] for chunk in chunks ]))
+    for name in chunks[0] )
+
+
+#------------------------------------------------------------------
+#  Bulk Loading
+#------------------------------------------------------------------
+# Records are handed to COPY in chunks of roughly this many bytes.  This bounds
+# the memory used by bulk_import() regardless of how many records are loaded.
+_COPY_CHUNK_SIZE = 1 << 16
+
+# Columns that identify a record independently of its generated id.  Each
+# table has a unique constraint on them, see db/design/wave.psql.
+_NATURAL_KEYS = {
+  'tblwave' : ('wavsourceid', 'wavdatetime', 'wavlocation'),
+  'tblwind' : ('winsourceid', 'windatetime', 'winlocation'),
+  'tblcurrent' : ('cursourceid', 'curdatetime', 'curlocation')
+}
+
+class _CopyStream(object):
+  # A read-only file-like object that lets psycopg2's copy_expert() pull data
+  # directly out of a generator of strings.  Nothing touches the disk and at
+  # most one chunk plus one read() request is held in memory.
+  def __init__(self, chunks):
+    self._chunks = iter(chunks)
+    self._buffer = ''
+
+  def read(self, size = -1):
+    while size < 0 or len(self._buffer) < size:
+      try:
+        self._buffer += next(self._chunks)
+      except StopIteration:
+        break
+
+    if size < 0:
+      data, self._buffer = self._buffer, ''
+    else:
+      data, self._buffer = self._buffer[:size], self._buffer[size:]
+
+    return data
+
+  def readline(self, size = -1):
+    return self.read(size)
+
+
+class _LineBuffer(object):
+  # Minimal file-like target for csv.writer so rows can be formatted without
+  # going through a file.
+  def __init__(self):
+    self.lines = []
+
+  def write(self, line):
+    self.lines.append(line)
+
+  def flush(self):
+    lines, self.lines = ''.join(self.lines), []
+    return lines
+
+
+def _csv_chunks(records, columns):
+  # Formats records for COPY using the text format with '|' as the delimiter.
+  # A different delimiter is needed due to array notation.
+  lines = _LineBuffer()
+  writer = csv.DictWriter(lines, fieldnames = columns, delimiter = '|')
+
+  # Loop over each record individually with `writerow()` rather than all at
+  # once with `writerows()` as records may be a generator and this prevents
+  # the entire dataset from being expanded in memory.
+  size = 0
+  for record in records:
+    writer.writerow(record)
+    size += len(lines.lines[-1])
+    if size >= _COPY_CHUNK_SIZE:
+      yield lines.flush()
+      size = 0
+
+  yield lines.flush()
+
+
+def _staged_insert(table, temp_table, columns, natural_key, on_conflict):
+  # Builds the statement that moves records from a staging table into the
+  # target table, skipping or updating those that are already stored.
+  source = 'SELECT {columns} FROM {temp_table}'
+  conflict = ''
+
+  if on_conflict == 'ignore':
+    conflict = 'ON CONFLICT ({key}) DO NOTHING'
+
+  elif on_conflict == 'update':
+    # An upsert may not touch the same row twice, so only one of any
+    # duplicates within the batch is kept.
+    source = 'SELECT DISTINCT ON ({key}) {columns} FROM {temp_table}'
+
+    # Generated ids and the natural key of stored records stay as they are.
+    fixed = set(natural_key) | \
+      set(column.name for column in table.primary_key)
+    conflict = 'ON CONFLICT ({key}) DO UPDATE SET ' + ', '.join(
+      '{0} = EXCLUDED.{0}'.format(column)
+      for column in columns if column not in fixed)
+
+  return ('INSERT INTO {target_table} ({columns}) ' + source + ' ' +
+    conflict).format(
+      target_table = table.name,
+      temp_table = temp_table,
+      columns = ', '.join(columns),
+      key = ', '.join(natural_key or ())
+    )
+
+
+#------------------------------------------------------------------
+#  Binary COPY Encoding
+#------------------------------------------------------------------
+# These functions produce the PGCOPY binary format documented in the
+# Postgresql manual under the COPY command.  Each field is sent as a 32-bit
+# length followed by the value in the type's binary wire format, so the server
+# does no parsing at all.  This matters most for spectra, which are otherwise
+# printed and re-parsed number by number.
+_PGCOPY_HEADER = 'PGCOPY\n\377\r\n\0' + struct.pack('>ii', 0, 0)
+_PGCOPY_TRAILER = struct.pack('>h', -1)
+_NULL_FIELD = struct.pack('>i', -1)
+
+# Postgres stores timestamps as microseconds since the start of 2000.
+_PG_EPOCH = datetime(2000, 1, 1)
+
+# Type OIDs, which array values must declare for their elements.
+_FLOAT4_OID = 700
+_FLOAT8_OID = 701
+
+# EWKB headers: little-endian byte order, point type with the SRID flag set.
+_EWKB_POINT = struct.pack('<BI', 1, 0x20000001)
+_EWKT_POINT = re.compile(r'(?:SRID=(\d+);)?\s*POINT\s*\(\s*(\S+)\s+(\S+)\s*\)',
+  re.IGNORECASE)
+
+
+def _encode_text(value):
+  if isinstance(value, unicode):
+    return value.encode('utf-8')
+
+  return str(value)
+
+
+def _encode_float8(value):
+  return struct.pack('>d', value)
+
+
+def _encode_float4(value):
+  return struct.pack('>f', value)
+
+
+def _integer_encoder(code):
+  def encode(value):
+    return struct.pack(code, value)
+
+  return encode
+
+
+def _timestamp_micros(value):
+  delta = value - _PG_EPOCH
+
+  return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _encode_timestamp(value):
+  return struct.pack('>q', _timestamp_micros(value))
+
+
+def _array_encoder(dtype, oid):
+  element = numpy.dtype([('length', '>i4'), ('value', dtype)])
+
+  def encode(value):
+    data = numpy.asarray(value, dtype = dtype)
+    if data.size == 0:
+      return struct.pack('>iii', 0, 0, oid)
+
+    # Array header: dimensions, null flag and element type followed by the
+    # size and lower bound of each dimension.
+    header = struct.pack('>iii', data.ndim, 0, oid) + \
+      struct.pack('>' + 'ii' * data.ndim,
+        *[ n for size in data.shape for n in (size, 1) ])
+
+    # Every element is prefixed with its length.  Interleaving the lengths
+    # and values with a structured array lets numpy do all the work.
+    elements = numpy.empty(data.size, dtype = element)
+    elements['length'] = data.itemsize
+    elements['value'] = data.ravel()
+
+    return header + elements.tostring()
+
+  return encode
+
+
+def _point_encoder(srid):
+  def encode(value):
+    if isinstance(value, basestring):
+      match = _EWKT_POINT.match(value)
+      if match is None:
+        raise ValueError('Could not parse a point from: {0}'.format(value))
+      point_srid, x, y = match.groups()
+      point_srid = srid if point_srid is None else int(point_srid)
+    else:
+      point_srid = srid
+      x, y = value
+
+    return _EWKB_POINT + struct.pack('<Idd', point_srid, float(x), float(y))
+
+  return encode
+
+
+def _binary_encoder(column_type):
+  # Picks the function that encodes values for a column of the given
+  # SQLAlchemy type.  Anything not recognized is sent as text, which is the
+  # binary format of Postgres string types.
+  if isinstance(column_type, ARRAY):
+    if isinstance(column_type.item_type, types.REAL):
+      return _array_encoder('>f4', _FLOAT4_OID)
+    return _array_encoder('>f8', _FLOAT8_OID)
+
+  if isinstance(column_type, Geometry):
+    return _point_encoder(getattr(column_type, 'srid', 4326))
+
+  if isinstance(column_type, types.DateTime):
+    return _encode_timestamp
+
+  if isinstance(column_type, types.REAL):
+    return _encode_float4
+
+  if isinstance(column_type, types.Float):
+    return _encode_float8
+
+  if isinstance(column_type, types.SmallInteger):
+    return _integer_encoder('>h')
+
+  if isinstance(column_type, types.BigInteger):
+    return _integer_encoder('>q')
+
+  if isinstance(column_type, types.Integer):
+    return _integer_encoder('>i')
+
+  return _encode_text
+
+
+def _binary_chunks(records, columns, column_types):
+  encoders = [ _binary_encoder(column_type) for column_type in column_types ]
+  tuple_header = struct.pack('>h', len(columns))
+  fields = zip(columns, encoders)
+
+  chunk = [_PGCOPY_HEADER]
+  size = 0
+  for record in records:
+    row = [tuple_header]
+    for column, encode in fields:
+      value = record.get(column)
+      if value is None:
+        row.append(_NULL_FIELD)
+      else:
+        data = encode(value)
+        row.append(struct.pack('>i', len(data)))
+        row.append(data)
+
+    chunk.extend(row)
+    size += sum(len(piece) for piece in row)
+    if size >= _COPY_CHUNK_SIZE:
+      yield ''.join(chunk)
+      chunk = []
+      size = 0
+
+  chunk.append(_PGCOPY_TRAILER)
+  yield ''.join(chunk)
+
+
+def _copy_into(table, table_name, table_columns, copy_format, copy_data,
+  staging, partition_key, natural_key, on_conflict):
+  # Streams copy_data into table_name in one transaction, through a staging
+  # table if asked to.  Returns the number of records written.
+  #
+  # Open a raw database connection using psycopg2.  Stand by for some low-level
+  # voodoo.
+  connection = RawPostgresConnection()
+  cursor = connection.cursor()
+
+  try:
+    if staging:
+      # Create a name for the temporary table padded with some random ASCII
+      # characters in case multiple bulk imports are running at the same time.
+      copy_table = 'bulk_import_' + \
+        ''.join((random.choice(ascii_lowercase) for i in xrange(4)))
+
+      cursor.execute('''
+        CREATE TEMP TABLE {temp_table} ( LIKE {target_table} ) ON COMMIT DROP;
+        '''.format(
+          temp_table = copy_table,
+          target_table = table_name,
+        )
+      )
+    else:
+      copy_table = table_name
+
+    cursor.copy_expert('''
+      COPY {copy_table} ({columns}) FROM STDIN WITH {copy_format};
+      '''.format(
+        copy_table = copy_table,
+        columns = ', '.join(table_columns),
+        copy_format = copy_format
+      ),
+      _CopyStream(copy_data),
+      _COPY_CHUNK_SIZE
+    )
+
+    if partition_key is not None:
+      # Must run in this transaction: the staging table holds a lock on the
+      # target table that can block partitions being created elsewhere.
+      cursor.execute('SELECT min({key}), max({key}) FROM {temp_table}'.format(
+        key = partition_key, temp_table = copy_table))
+      first, last = cursor.fetchone()
+      if first is not None:
+        cursor.execute(_CREATE_PARTITIONS, (table_name, first, last))
+
+    if staging:
+      cursor.execute(_staged_insert(table, copy_table,
+        table_columns, natural_key, on_conflict))
+
+    written = cursor.rowcount
+    connection.commit()
+  except:
+    connection.rollback()
+    raise
+  finally:
+    cursor.close()
+    connection.close()
+
+  return written
+
+
+def bulk_import(records, table_template, table_name = None, staging = True,
+  binary = False, on_conflict = None):
   """Efficient loading of large datasets into PostgreSQL
   
   .. note:: This function will only work with PostgreSQL databases
@@ -450,82 +1762,535 @@ def bulk_import(records, table_template, table_name = None):
         parameter and ``'tblwavemodeled'`` for the *table_name* parameter.  If
         left blank this will default to the value passed for *table_template*
 
-  .. todo::
-     Currently this function dumps the records to a temporary CSV file and
-     then uses the Postgresql ``COPY`` to load the data from CSV.  The time it
-     takes this function to execute can be cut by approximately 33% if the
-     temporary CSV file could be eliminated.
+    * *staging*
+        If ``True`` (the default), records are copied into a temporary staging
+        table and then moved into the target table with a single ``INSERT``.
+        If ``False``, records are copied straight into the target table which
+        avoids writing them twice.
+
+    * *binary*
+        If ``True``, records are sent using the binary ``COPY`` format, which
+        spares Postgres from parsing text.  This is much faster for tables
+        that hold spectra, such as ``tblwave``.  Array columns then accept
+        numpy arrays or nested lists, point columns accept an ``(x, y)``
+        tuple or a ``'SRID=4326;POINT(x y)'`` string and timestamp columns
+        accept ``datetime`` objects.
+
+    * *on_conflict*
+        What to do with records whose source, datetime and location match a
+        record that is already stored in ``tblwave``, ``tblwind`` or
+        ``tblcurrent``.  ``'ignore'`` keeps the stored record and skips the
+        new one, ``'update'`` overwrites the stored values with the new ones.
+        If ``None`` (the default), such records are rejected along with the
+        rest of the load.  Using either option implies *staging*.
+
+  Records are formatted and streamed to the Postgresql ``COPY`` command as they
+  are produced by *records*, so memory use stays bounded and no temporary
+  files are written.  All records are loaded in a single transaction---if any
+  of them are rejected, none are loaded.
+
+  Tables that are partitioned by month are always loaded through a staging
+  table so that the partitions needed by the records can be created before
+  the records are moved into place.
+
+  Returns the number of records written to the table.  With *on_conflict*
+  this excludes skipped records, so re-loading data that is already stored
+  writes nothing.
   """
+  if on_conflict not in (None, 'ignore', 'update'):
+    raise ValueError('on_conflict must be None, \'ignore\' or \'update\', '
+      'not {0!r}'.format(on_conflict))
 
   if table_name is None:
     table_name = table_template
 
-  # Dump records to temporary CSV file
-  #========================================================================
   # Retrieve order of table column names
   table = accessTable(None, table_template, table_name)
   table_columns = table.__table__._columns.keys()
 
-  temp_file = tempfile.mkstemp()
-  os.close(temp_file[0]) # Just wanted the path, thank you
-  temp_file = temp_file[1]
+  partition_key = None
+  if _isPartitioned(table_name):
+    partition_key = _PARTITION_KEYS[table_template]
+    staging = True
 
-  # Open file in binary mode because the table columns are returned as UTF-8
-  # strings and writing UTF-8 to non-binary files results in bad output for some
-  # reason.
-  csv_file = open(temp_file, 'wb')
-  csv_writer = csv.DictWriter(csv_file, fieldnames = table_columns,
-    delimiter='|') # Need to use a different delimiter due to array notation
+  natural_key = None
+  if on_conflict is not None:
+    natural_key = _NATURAL_KEYS[table_template]
+    staging = True
+
+  if binary:
+    column_types = [ column.type for column in table.__table__._columns ]
+    copy_format = 'BINARY'
+    copy_data = _binary_chunks(records, table_columns, column_types)
+  else:
+    copy_format = "DELIMITER '|' NULL ''"
+    copy_data = _csv_chunks(records, table_columns)
+
+  return _copy_into(table.__table__, table_name, table_columns, copy_format,
+    copy_data, staging, partition_key, natural_key, on_conflict)
+
+
+def _record_rows(records, table):
+  # Turns ORM records into the dictionaries bulk_import() expects.  Locations
+  # become (x, y) pairs and ids the server would have generated are made here,
+  # as COPY does not apply column defaults to the columns it is given.
+  columns = [ (column.name, isinstance(column.type, Geometry),
+    column.primary_key and column.server_default is not None)
+    for column in table.columns ]
 
-  # Loop over each record and commit individually with `writerow()` rather than
-  # all at once with `writerows()` as records should be a generator and this
-  # prevents the entire dataset from being expanded in memory.
-  #
-  # TODO: Add an isinstance() check for generators or lists and use the most
-  # efficient method for each.
   for record in records:
-    csv_writer.writerow(record)
+    row = {}
+    for name, is_geometry, is_generated in columns:
+      value = getattr(record, name)
+      if value is None:
+        if is_generated:
+          value = str(uuid4())
+      elif is_geometry:
+        value = decode_point(value)
+      row[name] = value
+
+    yield row
+
+
+def import_records(records, on_conflict = 'ignore'):
+  """Loads records made from a class returned by
+  :py:func:`wavecon.DBman.accessTable` using
+  :py:func:`wavecon.DBman.bulk_import` rather than adding them to a session
+  one at a time.  All records must be of the same class.
+
+  By default records that are already stored, i.e. that have the same source,
+  datetime and location as a stored record, are skipped so that re-running
+  an ingester only writes what is new.  *on_conflict* accepts the same values
+  as for ``bulk_import()``.  Returns the number of records written.
+  """
+  records = iter(records)
+  try:
+    first = next(records)
+  except StopIteration:
+    return 0
 
-  csv_file.close()
+  Class = type(first)
+  rows = _record_rows(itertools.chain([first], records), Class.__table__)
 
-  # Import records into database
-  #========================================================================
-  # Create a name for the temporary table padded with some random ASCII
-  # characters in case multiple bulk imports are running at the same time.
-  temp_table = 'bulk_import_' + \
-    ''.join((random.choice(ascii_lowercase) for i in xrange(4)))
+  return bulk_import(rows, Class._template, Class.__tablename__,
+    binary = True, on_conflict = on_conflict)
 
-  # Open a raw database connection using psycopg2.  Stand by for some low-level
-  # voodoo.
-  connection = RawPostgresConnection()
-  cursor = connection.cursor()
 
-  cursor.execute('''
-    CREATE TEMP TABLE {temp_table} ( LIKE {target_table} );
-    '''.format(
-      temp_table = temp_table,
-      target_table = table_name,
-    )
-  )
+#------------------------------------------------------------------
+#  Columnar Loading
+#------------------------------------------------------------------
+# Gridded model output arrives as numpy arrays with one value per cell.
+# Rather than building a record per cell, import_columns() lays the PGCOPY
+# rows out as a numpy structured array, one field per length prefix and
+# value, and fills each field from a whole column at once.  This only works
+# for values of a fixed size, which covers everything but free-form text.
+_UUID_HEX_DIGITS = numpy.frombuffer('0123456789abcdef', dtype = 'S1')
+_UUID_DIGITS = [ i for i in xrange(36) if i not in (8, 13, 18, 23) ]
+
+def _uuid4_array(count):
+  # Random (version 4) UUIDs in their 36 character text form.
+  data = numpy.frombuffer(os.urandom(16 * count), dtype = numpy.uint8)\
+    .reshape(count, 16).copy()
+  data[:, 6] = (data[:, 6] & 0x0f) | 0x40
+  data[:, 8] = (data[:, 8] & 0x3f) | 0x80
+
+  nibbles = numpy.empty((count, 32), dtype = numpy.uint8)
+  nibbles[:, 0::2] = data >> 4
+  nibbles[:, 1::2] = data & 0x0f
+
+  text = numpy.empty((count, 36), dtype = 'S1')
+  text[:] = '-'
+  text[:, _UUID_DIGITS] = _UUID_HEX_DIGITS[nibbles]
+
+  return text.view('S36').ravel()
+
+
+def _timestamp_column(value):
+  # Microseconds since the Postgres epoch, for a datetime or an array of
+  # datetimes or numpy datetime64 values.
+  if isinstance(value, datetime):
+    return _timestamp_micros(value)
+
+  value = numpy.ravel(value)
+  if value.dtype.kind == 'M':
+    return (value - numpy.datetime64(_PG_EPOCH)).astype('timedelta64[us]')\
+      .astype(numpy.int64)
+
+  return numpy.array([ _timestamp_micros(item) for item in value ],
+    dtype = numpy.int64)
+
+
+def _text_column(value):
+  if isinstance(value, basestring):
+    data = _encode_text(value)
+    return len(data), 'S{0}'.format(max(len(data), 1)), data
+
+  value = numpy.ravel(value)
+  if value.dtype.kind == 'U':
+    value = numpy.char.encode(value, 'utf-8')
+  elif value.dtype.kind != 'S':
+    value = value.astype(str)
+
+  # Every value must fill its field, numpy would pad shorter ones with NULs.
+  lengths = numpy.char.str_len(value)
+  if value.size and (lengths != value.itemsize).any():
+    raise ValueError('import_columns() needs text columns whose values all '
+      'have the same length')
+
+  return value.itemsize, value.dtype, value
+
+
+def _array_fields(name, column_type, value):
+  # Every record holds an array of the same shape, so the array header is
+  # shared and the elements of all records fill one block of the rows.
+  if isinstance(column_type.item_type, types.REAL):
+    dtype, oid = '>f4', _FLOAT4_OID
+  else:
+    dtype, oid = '>f8', _FLOAT8_OID
+
+  value = numpy.asarray(value)
+  shape = value.shape[1:]
+  size = int(numpy.prod(shape))
+  header = struct.pack('>iii', len(shape), 0, oid) + \
+    struct.pack('>' + 'ii' * len(shape),
+      *[ n for dim in shape for n in (dim, 1) ])
+
+  element = numpy.dtype([('length', '>i4'), ('value', dtype)])
+  elements = numpy.empty((len(value), size), dtype = element)
+  elements['length'] = element['value'].itemsize
+  elements['value'] = value.reshape(len(value), size)
+
+  return [ (name, '>i4', len(header) + size * element.itemsize),
+    (name + '_header', 'S{0}'.format(len(header)), header),
+    (name + '_elements', (element, (size,)), elements) ]
+
+
+def _column_fields(name, column_type, value):
+  # Returns the fields a column adds to each PGCOPY row as (name, dtype,
+  # value) triples.  Values are either shared by every row or arrays holding
+  # one value per row.
+  if value is None:
+    return [ (name, '>i4', -1) ]
+
+  if isinstance(column_type, ARRAY):
+    return _array_fields(name, column_type, value)
+
+  if isinstance(column_type, Geometry):
+    x, y = [ v if numpy.isscalar(v) else numpy.ravel(v) for v in value ]
+    return [ (name, '>i4', 25), (name + '_order', 'u1', 1),
+      (name + '_type', '<u4', 0x20000001),
+      (name + '_srid', '<u4', getattr(column_type, 'srid', 4326)),
+      (name + '_x', '<f8', x), (name + '_y', '<f8', y) ]
+
+  if isinstance(column_type, types.DateTime):
+    dtype, value = '>i8', _timestamp_column(value)
+  elif isinstance(column_type, types.REAL):
+    dtype = '>f4'
+  elif isinstance(column_type, types.Float):
+    dtype = '>f8'
+  elif isinstance(column_type, types.SmallInteger):
+    dtype = '>i2'
+  elif isinstance(column_type, types.BigInteger):
+    dtype = '>i8'
+  elif isinstance(column_type, types.Integer):
+    dtype = '>i4'
+  else:
+    length, dtype, value = _text_column(value)
+    return [ (name, '>i4', length), (name + '_value', dtype, value) ]
+
+  if not numpy.isscalar(value):
+    value = numpy.ravel(value)
+
+  return [ (name, '>i4', numpy.dtype(dtype).itemsize),
+    (name + '_value', dtype, value) ]
+
+
+def _columnar_chunks(columns, table):
+  fields = []
+  generated = []
+  for column in table.columns:
+    value = columns.get(column.name)
+    if value is None and column.primary_key and \
+      column.server_default is not None:
+      generated.append((len(fields), column))
+      fields.append(None)
+    else:
+      fields.append(_column_fields(column.name, column.type, value))
+
+  count = None
+  for name, dtype, value in itertools.chain(*filter(None, fields)):
+    if not numpy.isscalar(value):
+      if count is None:
+        count = len(value)
+      elif len(value) != count:
+        raise ValueError('Column {0} holds {1} values, expected {2}'.format(
+          name, len(value), count))
+
+  if count is None:
+    count = 1
+
+  for index, column in generated:
+    fields[index] = _column_fields(column.name, column.type,
+      _uuid4_array(count))
+  fields = list(itertools.chain(*fields))
+
+  rows = numpy.empty(count, dtype = [('fields', '>i2')] +
+    [ (name, dtype) for name, dtype, value in fields ])
+  rows['fields'] = len(table.columns)
+  for name, dtype, value in fields:
+    rows[name] = value
+
+  step = max(_COPY_CHUNK_SIZE // rows.itemsize, 1)
+  yield _PGCOPY_HEADER
+  for start in xrange(0, count, step):
+    yield rows[start:start + step].tostring()
+  yield _PGCOPY_TRAILER
+
+
+def import_columns(columns, table_template, table_name = None,
+  on_conflict = 'ignore'):
+  """Loads records held column by column, e.g. a model grid, with a single
+  ``COPY`` in one transaction.
+
+  *columns* maps column names to numpy arrays holding one value per record or
+  to single values shared by every record.  Arrays of any shape are read in
+  C order.  Point columns take an ``(x, y)`` pair and timestamp columns accept
+  ``datetime`` or ``datetime64`` values.  Array columns such as
+  ``wavspectra`` take an array whose first axis runs over the records, e.g.
+  of shape (N, nfreq, ndir).  Text columns must hold values of equal length,
+  such as ids.  Columns that are left out are loaded as ``NULL``, apart from
+  generated ids which are made here::
+
+    DBman.import_columns({
+      'winsourceid' : srcid,
+      'windatetime' : date,
+      'winlocation' : (lons, lats),
+      'winspeed' : speed,
+      'windirection' : direction
+    }, 'tblwind')
+
+  *table_name* and *on_conflict* are as for
+  :py:func:`wavecon.DBman.bulk_import`, except that records that are already
+  stored are skipped by default.  Returns the number of records written.
+  """
+  if table_name is None:
+    table_name = table_template
 
-  csv_file = open(temp_file,'r')
-  cursor.copy_from(csv_file, temp_table, sep = '|', null = '')
-  csv_file.close()
+  table = accessTable(None, table_template, table_name).__table__
+  table_columns = table._columns.keys()
 
-  cursor.execute('''
-    INSERT INTO {target_table} SELECT * FROM {temp_table};
-    DROP TABLE {temp_table};
-    '''.format(
-      temp_table = temp_table,
-      target_table = table_name,
-    )
-  )
+  natural_key = None
+  if on_conflict is not None:
+    natural_key = _NATURAL_KEYS[table_template]
 
-  connection.commit()
+  partition_key = None
+  if _isPartitioned(table_name):
+    partition_key = _PARTITION_KEYS[table_template]
 
-  cursor.close()
-  connection.close()
-  os.unlink(temp_file)
+  return _copy_into(table, table_name, table_columns, 'BINARY',
+    _columnar_chunks(columns, table), True, partition_key, natural_key,
+    on_conflict)
 
-  return None
 
+#------------------------------------------------------------------
+#  Background Loading
+#------------------------------------------------------------------
+# Marks the end of the records handed to a BatchWriter.
+_CLOSE = object()
+
+class _Flush(object):
+  # Asks a BatchWriter to write what it holds and signal once it has.
+  def __init__(self):
+    self.done = threading.Event()
+
+
+class _Columns(object):
+  # Records held column by column, written by a BatchWriter on their own.
+  def __init__(self, columns):
+    self.columns = columns
+
+
+class BatchWriter(object):
+  """Loads records into a table from a background thread so that downloading
+  and parsing can carry on while Postgres is busy::
+
+    with DBman.BatchWriter('tblwind') as writer:
+      for grid in grids:
+        writer.put(parse(grid))
+
+  Records are gathered into batches and each batch is loaded with
+  :py:func:`wavecon.DBman.bulk_import` in its own transaction.  A batch is
+  written once it holds *batch_size* records or its oldest record has waited
+  *flush_interval* seconds.  At most *max_pending* batches wait to be
+  written---beyond that, ``put()`` blocks until the writer catches up, which
+  keeps memory bounded when records are produced faster than they can be
+  stored.
+
+  Records may be dictionaries, as accepted by ``bulk_import()``, or objects
+  of a class returned by :py:func:`wavecon.DBman.accessTable`.  Gridded
+  data can be queued column by column with ``put_columns()`` instead.  They
+  are loaded with *on_conflict* set to ``'ignore'`` by default, see
+  ``bulk_import()`` for the other options.
+
+  If loading a batch fails, the exception is raised again by the next call to
+  ``put()``, ``flush()`` or ``close()`` and every record received after the
+  failure is discarded.  Batches written before the failure stay committed.
+
+  If the ``with`` block ends with an exception, the writer is stopped with
+  ``abort()`` rather than ``close()``: batches that have not been written yet
+  are discarded instead of committed.  A batch already being loaded still
+  commits, so callers that must not keep anything of a failed load should
+  also remove what was written, e.g. with
+  :py:func:`wavecon.DBman.remove_source`.
+  """
+  def __init__(self, table_template, table_name = None, batch_size = 10000,
+    flush_interval = 5.0, max_pending = 4, on_conflict = 'ignore'):
+    if table_name is None:
+      table_name = table_template
+
+    self.table_template = table_template
+    self.table_name = table_name
+    self.batch_size = batch_size
+    self.flush_interval = flush_interval
+    self.on_conflict = on_conflict
+
+    # Number of records loaded and number of bulk_import() calls made.
+    self.written = 0
+    self.batches = 0
+
+    # Reflection is not thread safe, so the table is looked up here rather
+    # than in the writer thread.
+    self._table = accessTable(None, table_template, table_name).__table__
+    self._queue = Queue.Queue(max_pending)
+    self._error = None
+    self._closed = False
+    self._aborted = False
+
+    self._thread = threading.Thread(target = self._run,
+      name = 'BatchWriter-' + table_name)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    if exc_type is None:
+      self.close()
+    else:
+      # Do not let a failure in the writer hide the one that ended the with
+      # block.
+      try:
+        self.abort()
+      except Exception:
+        pass
+
+    return False
+
+  def put(self, records):
+    """Queues records to be loaded.  *records* may be any iterable, it is
+    consumed by the calling thread in slices of *batch_size* records."""
+    records = iter(records)
+    while True:
+      batch = list(itertools.islice(records, self.batch_size))
+      if not batch:
+        break
+      self._enqueue(batch)
+
+  def put_columns(self, columns):
+    """Queues records held column by column, as accepted by
+    :py:func:`wavecon.DBman.import_columns`.  They are loaded with a
+    ``COPY`` of their own once the records queued before them have been
+    written.  The arrays must not be modified until they have been loaded."""
+    self._enqueue(_Columns(columns))
+
+  def flush(self):
+    """Blocks until every record queued so far has been loaded."""
+    request = _Flush()
+    self._enqueue(request)
+    request.done.wait()
+    self._raise()
+
+  def close(self):
+    """Loads any remaining records and stops the writer thread."""
+    if not self._closed:
+      self._closed = True
+      self._queue.put(_CLOSE)
+      self._thread.join()
+
+    self._raise()
+
+  def abort(self):
+    """Discards every record that has not been written yet and stops the
+    writer thread.  A batch that is being loaded when this is called is still
+    committed."""
+    self._aborted = True
+    self.close()
+
+  def _enqueue(self, item):
+    if self._closed:
+      raise RuntimeError('BatchWriter for {0} has been closed'.format(
+        self.table_name))
+    self._raise()
+    self._queue.put(item)
+
+  def _raise(self):
+    if self._error is not None:
+      exc_type, exc_value, traceback = self._error
+      raise exc_type, exc_value, traceback
+
+  def _run(self):
+    pending = []
+    deadline = None
+
+    while True:
+      timeout = None
+      if deadline is not None:
+        timeout = max(deadline - time.time(), 0)
+
+      try:
+        item = self._queue.get(timeout = timeout)
+      except Queue.Empty:
+        item = None
+
+      if isinstance(item, list):
+        if not pending:
+          deadline = time.time() + self.flush_interval
+        pending.extend(item)
+
+      if pending and (not isinstance(item, list) or
+        len(pending) >= self.batch_size or time.time() >= deadline):
+        self._write(pending)
+        pending = []
+        deadline = None
+
+      if isinstance(item, _Columns):
+        self._write_columns(item.columns)
+      elif isinstance(item, _Flush):
+        item.done.set()
+      elif item is _CLOSE:
+        break
+
+  def _write(self, records):
+    if self._error is not None or self._aborted:
+      return
+
+    try:
+      if not isinstance(records[0], dict):
+        records = _record_rows(records, self._table)
+      self.written += bulk_import(records, self.table_template,
+        self.table_name, binary = True, on_conflict = self.on_conflict)
+      self.batches += 1
+    except Exception:
+      self._error = sys.exc_info()
+
+  def _write_columns(self, columns):
+    if self._error is not None or self._aborted:
+      return
+
+    try:
+      self.written += import_columns(columns, self.table_template,
+        self.table_name, on_conflict = self.on_conflict)
+      self.batches += 1
+    except Exception:
+      self._error = sys.exc_info()
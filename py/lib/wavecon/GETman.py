@@ -8,311 +8,202 @@
 import urllib #web support
 import datetime #posix support
 import os,sys,re #argument parsing
-import glob #file wildcards
+import multiprocessing #parallel parsing
+from contextlib import contextmanager
 from numpy import * #math support
 from math import * #pi constant
 from netCDF4 import * #netcdf support
-from geoalchemy import WKTSpatialElement
 from config import CMSconfig
-import DBman,CMSman
+import DBman,CMSman,WW3
+from download import DownloadManager, DownloadError
+from cache import shared_cache
+from pipeline import Pipeline, Stage
 strptime = datetime.datetime.strptime
 
-import tempfile
-
 ################################
-# CREATE DATABASE OBJECTS
+# ADD RECORD TO TBLSOURCE
 ################################
-srctype = DBman.accessTable( None, 'tblsourcetype' )
-src = DBman.accessTable( None, 'tblsource')
-wind = DBman.accessTable( None, 'tblwind' ) 
-wave = DBman.accessTable( None, 'tblwave' ) 
-specbin = DBman.accessTable( None, 'tblspectrabin' )
+def add_source(srctypename,date):
 
-################################
-# ADD RECORD TO TBLSOURCETYPE IF NECESSARY
-################################
-def add_sourcetype(srctypename):
-    
-    #check if sourcetype exists
-    session = DBman.startSession()     
-    existing = session.query(srctype)\
-        .filter( srctype.sourcetypename == srctypename )
-    if ( existing.first() == None ):
-        #if doesn't exist,  add new sourcetype to db
-        record = srctype(srctypename)                              
-        session.add(record)
-        session.commit()
-        srctypeid = record.id
-    else:
-        #if exists, get id for existing sourcetype
-        srctypeid = session.query(srctype)\
-        .filter( srctype.sourcetypename == srctypename )\
-        .first().id
-    session.close()
-    session.bind.dispose()
-    return srctypeid
+    # the run gets a unique number, e.g. NAM12_20101222_00_1042
+    srcname = srctypename+'_'+date.strftime("%Y%m%d_%H")
+    return DBman.register_source(srctypename,srcname)
 
 ################################
-# ADD RECORD TO TBLSOURCE IF NECESSARY
+# REMOVE A RUN THAT FAILS PARTWAY
 ################################
-def add_source(srctypeid,date):
-    
-    # get the source type given an id
-    session = DBman.startSession()
-    srctypename = session.query(srctype)\
-    .filter( srctype.sourcetypeid == srctypeid )\
-    .first().sourcetypename
-    
-    # choose srcname
-    for i in range(1000):
-      srcname = srctypename+'_'+date.strftime("%Y%m%d_%H")+'_'+str(i)
-      existing = session.query(src).filter( src.srcname == srcname )
-      if (existing.first() == None):
-          break
-
-    # prepare record for tblSource
-    record = src(
-    srcName=srcname, 
-    srcConfig='', 
-    srcBeginExecution=date.today(), 
-    srcEndExecution=date.today(), 
-    srcSourceTypeID=srctypeid)
-    
-    # add record to tblSource
-    session.add(record)    
-    session.commit()
-    srcid = record.id
-    session.close()
-    session.bind.dispose()
-    return srcid
+@contextmanager
+def discard_source(srcid):
+
+    # nothing of a partial run is kept: if the block fails, e.g. on a
+    # DownloadError, the source is deleted and its records are deleted
+    # with it, including batches the writer committed before the failure
+    try:
+        yield
+    except BaseException:
+        exc_info = sys.exc_info()
+        try:
+            DBman.remove_source(srcid)
+        except Exception:
+            pass
+        raise exc_info[0], exc_info[1], exc_info[2]
 
 ################################
 # ADD RECORD TO TBLSPECTRABIN IF NECESSARY
 ################################
 def add_spectrabin(freqs,dirs):
 
-    # determine whether bins exist in db 
-    exists = False
-    session = DBman.startSession()
-    for rec in session.query(specbin):
-        dirshape = array(rec.spcdir).size==array(dirs).size
-        freqshape = array(rec.spcfreq).size==array(freqs).size
-        if (dirshape and freqshape):
-          dirval = all((array(rec.spcdir) - array(dirs)) < .01)
-          freqval = all((array(rec.spcfreq) - array(freqs)) < .01)
-          if (dirval and freqval):
-            exists = True
-            specid = rec.id
-            break
-    
-    # if bins don't exist in db, add them
-    if (exists == False):
-        record = specbin(freqs,dirs)
-        session.add(record)
-        session.commit()
-        specid = record.id
-
-    session.close()
-    session.bind.dispose()
-    return specid
+    # bins are matched on their rounded values, see DBman.spectra_bin_id
+    return DBman.spectra_bin_id(freqs,dirs)
 
 ##########################################
-# DOWNLOAD LATEST WW3 DATA
+# LIST LATEST WW3 DATA
 ##########################################
-def ww3_download(wavregion,tmpdir):
+def ww3_urls(wavregion,downloads):
     
     url = 'ftp://polar.ncep.noaa.gov/pub/waves/latest_run/'
-    filename = 'enp.' + wavregion + '*'
-    print '\ndownloading WW3 data...'       
-    command1 = 'rm -f ' + tmpdir + '/' + filename
-    command2 = '{0} {1} {2}/{3}'.format('wget -A.gz -qP',tmpdir,url,filename)
-    command3 = 'gunzip -q ' + tmpdir + '/' + filename  
-    flag = os.system(command1)                              
-    if (flag!=0): quit('\nERROR: COULD NOT REMOVE EXISTING WW3 FILES')
-    flag = os.system(command2)
-    if (flag!=0): quit('\nERROR: COULD NOT DOWNLOAD WW3 DATA')
-    flag = os.system(command3)
-    if (flag!=0): quit('\nERROR: COULD NOT GUNZIP WW3 DATA')
-    print 'done'
-    files = glob(tmpdir + '/' + filename)
-    return files
+    filename = 'enp.' + wavregion + '*.gz'
+    try:
+        urls = downloads.list(url + filename)
+    except DownloadError as e:
+        quit('\nERROR: COULD NOT DOWNLOAD WW3 DATA\n' + str(e))
+    if (len(urls)==0): quit('\nERROR: NO WW3 DATA FOUND FOR ' + wavregion)
+    return urls
 
 ##########################################
-# PARSE SINGLE WW3 DATAFILE
+# DOWNLOAD/PARSE PIPELINE FOR WW3 DATA
 ##########################################
-def ww3_parsefile(file,s):
+def ww3_pipeline(config,downloads,pool,load):
 
-    #read file contents
-    lines = open(file).read()
-    
-    # compile regex patterns
-    freqdir_pat = re.compile("III.*?(\d+).*?(\d+)")
-    num_pat = re.compile("-*\d+\.*\d+E.\d+")
-    timestamp_pat = re.compile("\d{8} \d{6}")
-    latlon_pat = re.compile("\d+.\d+-\d+.\d+")
-    
-    # look for matches
-    freqdir_match = freqdir_pat.search(lines)
-    num_match = num_pat.findall(lines)
-    num_match = map(float,num_match)
-    timestamp_match = timestamp_pat.findall(lines)
-    latlon_match = latlon_pat.findall(lines)
-    
-    # parse lat/lon
-    lat = latlon_match[0][0:5]
-    lon = latlon_match[0][5:]
-    loc = WKTSpatialElement('POINT('+lon+' '+lat+')')
-    lat = float(lat)
-    lon = float(lon)
-    
-    # parse freq/dir bins
-    # NOTE DIRS = DIRECTION OF TRAVEL
-    nfreqs = int(freqdir_match.group(1))
-    ndirs = int(freqdir_match.group(2))
-    freqs = num_match[0:nfreqs]
-    dirs = num_match[nfreqs:(nfreqs+ndirs)]
-    dirs = map(degrees,dirs)
-    
-    # parse dates 
-    timestamps = [strptime( ts, '%Y%m%d %H0000' ) for ts in timestamp_match]
-    for i in range(len(s)):
-        timestamps[i] = s[i]
- 
-    # parse spectra
-    spectra = num_match[(nfreqs+ndirs):]
-    spectra = array(spectra)
-    spectra = spectra * (pi/180) #m^2/Hz/rad to m^2/Hz/degree         
-    spectra = spectra.reshape(len(timestamps),nfreqs,ndirs)
-    spectra = spectra.tolist()  
-  
-    #reorganize into dictionary
-    wavdata={}
-    for i in range(len(timestamps)):
-        wavdata[timestamps[i]] = {
-        'loc':loc,'lat':lat,'lon':lon,
-        'freqs':freqs,'dirs':dirs,
-        'spectra':spectra[i] }
-    return wavdata
+    # files are fetched over reused ftp connections and gunzipped as they
+    # arrive, unchanged files come from the cache
+    download = lambda url: shared_cache().fetch(url,True,downloads)
+
+    # spectra are read on the process pool and come back as pickled numpy
+    # arrays, the parse threads only wait for them. each file holds a
+    # single point
+    parse = lambda file: pool.apply(WW3.read_point_spectra,(file,))[0]
+
+    return make_pipeline(config,download,parse,load,
+                         multiprocessing.cpu_count())
 
 ##########################################
-# ADD RECORDS TO TBLWAVE
+# LABEL WW3 TIME STEPS WITH THE STEERING TIMES
 ##########################################
-def push_wavdata(wavdata,srcid,specbinid):
-
-    session = DBman.startSession()
-    for loc in sort(wavdata.keys()):           
-        
-        for date in sort(wavdata[loc].keys()):
-            
-            # parse dictionary
-            spectra = wavdata[loc][date]['spectra']  
-            # add record to tblwave
-            record = wave(
-            wavSourceID=srcid,
-            wavSpectraBinID=specbinid,
-            wavLocation=loc,
-            wavDateTime=date,
-            wavSpectra=spectra,
-            wavHeight=None,
-            wavPeakDir=None,
-            wavPeakPeriod=None)
-            session.add(record)
-
-    # close session
-    session.commit()
-    session.close()
-    session.bind.dispose()
-    return
+class MissingSteeringTime(Exception):
+    # a ww3 point ends before the last steering time
+    pass
+
+def ww3_times(point,s):
 
+    # the first time steps are labelled with the steering times
+    if len(point.times) < len(s):
+        raise MissingSteeringTime('no ww3 data available for time:'
+                                  + str(s[len(point.times)]))
+    timestamps = list(point.times)
+    timestamps[:len(s)] = s
+    return timestamps
 
 ##########################################
-# RUN DOWNLOADER AND PARSER FOR WW3 DATA
+# ADD RECORDS TO TBLWAVE
 ##########################################
-def getWW3(wavregion,tmpdir,s):
-    wavdata = {}
-    files = ww3_download(wavregion,tmpdir)
-    for file in files:
-        mywavdata = ww3_parsefile(file,s)
-        date = mywavdata.keys()[0]
-        wavdata[mywavdata[date]['loc']] = mywavdata
-    return wavdata
-    
+def push_wavcube(writer,lons,lats,times,spectra,srcid,specbinid):
+
+    # spectra are queued column-wise on a DBman.BatchWriter that loads
+    # them in the background, a few locations at a time so each
+    # transaction holds about batch_size records. records already stored
+    # by an earlier run are skipped
+    times = array(times,dtype='datetime64[us]')
+    step = max(writer.batch_size//len(times),1)
+    for i in range(0,len(lons),step):
+        writer.put_columns(wave_columns(lons[i:i+step],lats[i:i+step],
+            times,spectra[i:i+step],srcid,specbinid))
+    return
+
+def push_wavpoint(writer,point,s,srcid):
+
+    # a single parsed point is queued as soon as it arrives, bins are
+    # looked up once and cached, see DBman.spectra_bin_id
+    specbinid = add_spectrabin(point.freqs.tolist(),point.dirs.tolist())
+    push_wavcube(writer,array([point.lon]),array([point.lat]),
+        ww3_times(point,s),point.spectra[newaxis],srcid,specbinid)
+    return
+
+def wave_columns(lons,lats,times,spectra,srcid,specbinid):
+
+    # one record per location and time, see DBman.import_columns
+    nlocs,ntimes = spectra.shape[:2]
+    return {
+        'wavsourceid':srcid,
+        'wavspectrabinid':specbinid,
+        'wavlocation':(repeat(lons,ntimes),repeat(lats,ntimes)),
+        'wavdatetime':tile(times,nlocs),
+        'wavspectra':spectra.reshape((nlocs*ntimes,)+spectra.shape[2:])}
+
 ################################
-# DOWNLOAD NAM12 FILE 
+# DOWNLOAD/PARSE PIPELINE FOR NAM12 FILES
 ################################
-def nam12_download(date,north,south,east,west,tmpdir):
-    print '\ndownloading NAM12 date: '+str(date)+'...'
-    myurl = nam12_url(date,north,south,east,west)
-    tmpfile = tmpdir + '/tmp.nc'
-    command1 = 'rm -f ' + tmpfile
-    command2 = '{0} {1} \'{2}\''.format('wget -qO',tmpfile,myurl)
-    flag = os.system(command1)
-    if (flag!=0): quit('\nERROR: COULD NOT REMOVE EXISTING NAM12 FILE')
-    flag = os.system(command2)
-    if (flag!=0): quit('\nERROR: COULD NOT DOWNLOAD NAM12 FILE')
-    print 'done'
-    return tmpfile
+def nam12_pipeline(config,downloads,load):
+    north=config['north']
+    south=config['south']
+    east=config['east']
+    west=config['west']
+
+    # each steering time is fetched, parsed and handed to load(date,grid)
+    # on its own, files fetched before come from the cache
+    def download(date):
+        myurl = nam12_url(date,north,south,east,west)
+        return date,shared_cache().fetch(myurl,downloads=downloads)
+
+    def parse(item):
+        return item[0],nam12_parsefile(item[1])
+
+    return make_pipeline(config,download,parse,lambda item: load(*item))
 
 ################################
-# RUN DOWNLOADER AND PARSE NAM12 FILES
+# PARSE SINGLE NAM12 FILE
 ################################
-def getNAM12(dates,north,south,east,west,tmpdir):
+def nam12_parsefile(tmpfile):
+
+    # parse data
+    ncdf = Dataset(tmpfile,'r',format='NETCDF4')
+    ugrid = ncdf.variables['u_wind_height_above_ground'][:][0][0]
+    vgrid = ncdf.variables['v_wind_height_above_ground'][:][0][0]
+    lats = ncdf.variables['lat'][:]
+    lons = ncdf.variables['lon'][:]
+    ncdf.close()
     
-    windata={}
-    for date in dates:
-        # download datafile
-        tmpfile = nam12_download(date,north,south,east,west,tmpdir)    
-        
-        # parse data
-        ncdf = Dataset(tmpfile,'r',format='NETCDF4')
-        ugrid = ncdf.variables['u_wind_height_above_ground'][:][0][0]
-        vgrid = ncdf.variables['v_wind_height_above_ground'][:][0][0]
-        lats = ncdf.variables['lat'][:]
-        lons = ncdf.variables['lon'][:]
-        os.unlink(tmpfile) 
-        
-        # convert from u/v to speed/direction, 
-        # dir = cartesian coordinates 
-        # (0 = traveling east, 90 = traveling north)     
-        spd = (ugrid**2.0 + vgrid**2.0)**(1.0/2.0)
-        dir = arctan2(vgrid,ugrid)   
-        dir = dir*180./pi 
-        
-        # add date to dictionary
-        windata[date] = {'speed':spd,'dir':dir,'lats':lats,'lons':lons}
-    return windata
+    # convert from u/v to speed/direction, 
+    # dir = cartesian coordinates 
+    # (0 = traveling east, 90 = traveling north)     
+    spd = (ugrid**2.0 + vgrid**2.0)**(1.0/2.0)
+    dir = arctan2(vgrid,ugrid)   
+    dir = dir*180./pi 
+    return {'speed':spd,'dir':dir,'lats':lats,'lons':lons}
 
 ################################
 # ADD RECORDS TO TBLWIND 
 ################################
-def push_windata(windata,srcid):
-
-    session = DBman.startSession()
-    for date in windata.keys():
-
-        # parse dictionary
-        lats = windata[date]['lats']
-        lons = windata[date]['lons']
-        spd = windata[date]['speed']
-        dir = windata[date]['dir']
-        
-        # add records to tblwind
-        for i in range(lats.shape[0]):
-            for j in range(lats.shape[1]): 
-                loc = WKTSpatialElement('POINT('+str(lons[i][j])+' '+str(lats[i][j])+')')
-                record = wind(
-                winSourceID=srcid, 
-                winLocation=loc, 
-                winDateTime=date, 
-                winSpeed=float(spd[i][j]), 
-                winDirection=float(dir[i][j]))
-            session.add(record)    
-      
-    # commit and close session
-    session.commit()
-    session.close() 
-    session.bind.dispose()
+def push_windgrid(writer,date,grid,srcid):
+
+    # each steering time is queued on a DBman.BatchWriter as soon as it is
+    # parsed and loaded with a single COPY in the background, records
+    # already stored by an earlier run are skipped
+    writer.put_columns(wind_columns(grid,date,srcid))
     return 
+
+################################
+# ARRANGE A NAM12 GRID AS TBLWIND COLUMNS
+################################
+def wind_columns(mywindata,date,srcid):
+
+    # one record per grid cell, see DBman.import_columns
+    return {
+        'winsourceid':srcid,
+        'windatetime':date,
+        'winlocation':(mywindata['lons'],mywindata['lats']),
+        'winspeed':mywindata['speed'],
+        'windirection':mywindata['dir']}
     
 ################################
 # GENERATE A NAM12 URL STRING
@@ -331,41 +222,62 @@ def nam12_url(date,north,south,east,west):
         '&var=v_wind_height_above_ground'])
     return str         
    
+################################
+# BUILD A DOWNLOAD/PARSE/LOAD PIPELINE
+################################
+def make_pipeline(config,download,parse,load,parse_workers=1):
+
+    # the stages overlap, each on its own threads, and hand items on
+    # through short queues so only a few steering times or points are
+    # held in memory at once, see pipeline.py. worker counts can be set
+    # in the config, e.g. "download_workers" : "4"
+    return Pipeline([
+        Stage('download',download,
+              int(config.get('download_workers',4))),
+        Stage('parse',parse,
+              int(config.get('parse_workers',parse_workers))),
+        Stage('load',load,
+              int(config.get('load_workers',1)))],
+        int(config.get('pipeline_queue',2)))
+
 ################################
 # STRING TOGETHER WIND-RELATED SUBROUTINES 
 ################################
 def getWIND(config, starttime, simduration, steeringinterval):
-  tmpdir=tempfile.gettempdir()
-
-  north=config['north']
-  south=config['south']
-  east=config['east']
-  west=config['west']
   wintype=config['wintype']
   
   # PARSE DATE PARAMATERS
   steeringtimes = CMSman.maketimes(starttime,simduration,steeringinterval)
   
-  # ADD RECORD TO TBLSOURCETYPE
-  srctypeid = add_sourcetype(wintype)    
-  
   # DOWNLOAD AND PUSH TO DATABASE
   if wintype=='NAM12': 
       
-      # RETRIEVE NAM12 DATA FROM WEB
-      windata = getNAM12(steeringtimes,north,south,east,west,tmpdir)
-      
-      # CHECK IF DATA MATCHES STEERINGTIMES
-      wintimes = array(windata.keys())
-      for mytime in steeringtimes:
-          if (not any(wintimes == mytime)):
-              quit('\nERROR: no nam12 data available for time:'+str(mytime))
-
       # ADD NEW SOURCE TO DATABASE
-      srcid = add_source(srctypeid,steeringtimes[0])
+      srcid = add_source(wintype,steeringtimes[0])
+
+      # EACH STEERING TIME GOES TO THE DATABASE AS SOON AS IT IS PARSED,
+      # OR TO A CUBE FILE IF ASKED TO. THE CUBE IS ONLY KEPT IF EVERY
+      # STEERING TIME ARRIVES
+      if config.get('windstore'):
+          import windstore
+          writer = windstore.open_cube(srcid,steeringtimes)
+          load = lambda date,grid: writer.put(date,grid['lats'],
+              grid['lons'],grid['speed'],grid['dir'])
+      else:
+          writer = DBman.BatchWriter('tblwind')
+          load = lambda date,grid: push_windgrid(writer,date,grid,srcid)
 
-      # ADD WIND-DATA TO DATABASE
-      push_windata(windata,srcid)
+      # RETRIEVE NAM12 DATA FROM WEB
+      print '\ndownloading NAM12 data...'
+      try:
+          with discard_source(srcid):
+              with writer, DownloadManager() as downloads:
+                  pipeline = nam12_pipeline(config,downloads,load)
+                  pipeline.run(steeringtimes)
+      except DownloadError as e:
+          quit('\nERROR: no nam12 data available\n'+str(e))
+      print 'done'
+      print pipeline.report()
   
   else: quit('oops, i can only support wintype=NAM12')
   return
@@ -374,40 +286,41 @@ def getWIND(config, starttime, simduration, steeringinterval):
 # STRING TOGETHER WAVE-RELATED SUBROUTINES 
 ################################
 def getWAVE(config, starttime, simduration, steeringinterval):
-    tmpdir=tempfile.gettempdir()
-
     wavtype=config['wavtype']
     wavregion=config['wavregion']
 
     # PARSE DATE PARAMATERS
     steeringtimes = CMSman.maketimes(starttime,simduration,steeringinterval)
     
-    # ADD RECORD TO TBLSOURCETYPE
-    srctypeid = add_sourcetype(wavtype)
-     
     # DOWNLOAD AND PUSH TO DATABASE
     if (wavtype == 'WW3'):
-        # RETREIVE WW3 DATA FROM WEB
-        wavdata = getWW3(wavregion,tmpdir,steeringtimes)
-        
-        # CHECK IF DATA MATCHES STEERINGTIMES
-        wavtimes = array(wavdata.values()[0].keys()) 
-        for mytime in steeringtimes:
-            if (not any(wavtimes == mytime)):
-                quit('\nERROR: no ww3 data available for time:'+str(mytime))
-        
         # ADD NEW SOURCE TO DATABASE
-        srcid = add_source(srctypeid,steeringtimes[0])
-        
-        # ADD SPECTRAL-BINS TO DATABASE 
-        loc = sort(wavdata.keys())[0]
-        date = sort(wavdata[loc].keys())[0]
-        freqs = wavdata[loc][date]['freqs']
-        dirs = wavdata[loc][date]['dirs']
-        specbinid = add_spectrabin(freqs,dirs)
-
-        # ADD SPECTRAL-DATA TO DATABASE        
-        push_wavdata(wavdata,srcid,specbinid)
+        srcid = add_source(wavtype,steeringtimes[0])
+
+        # EACH POINT GOES TO THE DATABASE AS SOON AS IT IS PARSED, THE
+        # POOL IS STARTED BEFORE ANY DOWNLOAD SO THE WORKERS ARE FORKED
+        # BEFORE THE DOWNLOADER AND WRITER THREADS EXIST
+        pool = multiprocessing.Pool()
+        try:
+            writer = DBman.BatchWriter('tblwave')
+            load = lambda point: push_wavpoint(writer,point,steeringtimes,
+                                               srcid)
+
+            # RETREIVE WW3 DATA FROM WEB
+            print '\ndownloading WW3 data...'
+            with discard_source(srcid):
+                with writer, DownloadManager() as downloads:
+                    pipeline = ww3_pipeline(config,downloads,pool,load)
+                    pipeline.run(ww3_urls(wavregion,downloads))
+        except DownloadError as e:
+            quit('\nERROR: COULD NOT DOWNLOAD WW3 DATA\n' + str(e))
+        except MissingSteeringTime as e:
+            quit('\nERROR: ' + str(e))
+        finally:
+            pool.terminate()
+            pool.join()
+        print 'done'
+        print pipeline.report()
 
     else: quit('oops, i can only support wavtype=WW3')
     return
@@ -27,6 +27,9 @@ import re
 import functools
 import itertools
 
+import os
+import tempfile
+
 from geoalchemy import WKTSpatialElement
 
 
@@ -41,6 +44,7 @@ sys.path.insert( 0, waveLibs )
 """
 
 from wavecon import DBman
+from wavecon.cache import shared_cache
 from wavecon.config import DBconfig as _DBconfig
 
 from pydap.client import open_url
@@ -58,12 +62,15 @@ HF_CURRENT_META = {
 
 }
 
+# Subsets are cached an hour at a time.  Hours within SETTLE_SECONDS of the
+# newest data are fetched again on every request rather than cached.
+SLICE_SECONDS = 3600
+SETTLE_SECONDS = 6 * 3600
+
 Source = DBman.accessTable( _DBconfig, 'tblsource' )
 SourceType = DBman.accessTable( _DBconfig, 'tblsourcetype' )
 CurrentRecord = DBman.accessTable( _DBconfig, 'tblcurrent' )
 
-_session = DBman.startSession( _DBconfig )
-
 
 #---------------------------------------------------------------------
 #  Data Retrieval
@@ -75,23 +82,91 @@ def fetchRecords( north, south, west, east, startTime, stopTime, resolution,
   return records
 
 def getData( north, south, west, east, startTime, stopTime, resolution ):
+  # The window is assembled from whole hours of the dataset, each cached on
+  # its own, so windows moved along by the hourly cron job only fetch the
+  # hours they have not seen before.
   url = HF_CURRENT_META[ resolution ]['url']
-  dataset = open_url(url)
-
-  allLons = dataset.lon[:]
-  allLats = dataset.lat[:]
-  allTimes = dataset.time[:]
-  xIndex = array([i for i,lon in enumerate(allLons) if lon>west and lon<east])
-  yIndex = array([i for i,lat in enumerate(allLats) if lat>south and lat<north])
-  tIndex = array([i for i,t in enumerate(allTimes) if t>time.mktime(startTime.timetuple()) and t<time.mktime(stopTime.timetuple()) ])
-  lons = [allLons[i] for i in xIndex]
-  lats = [allLats[i] for i in yIndex]
-  times = [allTimes[i] for i in tIndex]
-
-  u = dataset.u[min(tIndex):max(tIndex),min(yIndex):max(yIndex),min(xIndex):max(xIndex)]
-  v = dataset.v[min(tIndex):max(tIndex),min(yIndex):max(yIndex),min(xIndex):max(xIndex)]
-  
-  return rawToRecords(times,lats,lons,u,v,resolution)
+  start = time.mktime( startTime.timetuple() )
+  stop = time.mktime( stopTime.timetuple() )
+
+  dataset = []
+  def openDataset():
+    # Only opened if an hour is missing from the cache.
+    if not dataset:
+      dataset.append( DatasetAxes( url ) )
+    return dataset[0]
+
+  slices = [ getSlice( url, north, south, west, east, sliceStart,
+    openDataset ) for sliceStart in sliceStarts( start, stop ) ]
+
+  times = concatenate([ subset['times'] for subset in slices ])
+  keep = (times > start) & (times < stop)
+  u = concatenate([ subset['u'] for subset in slices ])[keep]
+  v = concatenate([ subset['v'] for subset in slices ])[keep]
+
+  return rawToRecords( times[keep], slices[0]['lats'], slices[0]['lons'],
+    u, v, resolution )
+
+def sliceStarts( start, stop ):
+  # Whole hours, as seconds since the epoch, that overlap start to stop.
+  # There is always at least one.
+  first = int( floor( start / SLICE_SECONDS ) ) * SLICE_SECONDS
+  return range( first, max( int( ceil( stop ) ), first + 1 ), SLICE_SECONDS )
+
+def getSlice( url, north, south, west, east, sliceStart, openDataset ):
+  # The box over the hour from sliceStart, from the cache when it holds it.
+  # Hours are only cached once the dataset has moved SETTLE_SECONDS past
+  # them, since late radials still revise the recent ones.
+  key = '{0}?north={1}&south={2}&west={3}&east={4}&hour={5}'.format( url,
+    north, south, west, east,
+    datetime.utcfromtimestamp( sliceStart ).strftime( '%Y-%m-%dT%H' ) )
+  cache = shared_cache()
+
+  cachedFile = cache.lookup( key )
+  if cachedFile is not None:
+    saved = load( cachedFile )
+    try:
+      return dict( (name, saved[name]) for name in saved.files )
+    finally:
+      saved.close()
+
+  axes = openDataset()
+  subset = fetchSubset( axes, north, south, west, east, sliceStart,
+    sliceStart + SLICE_SECONDS )
+  if axes.times.max() >= sliceStart + SLICE_SECONDS + SETTLE_SECONDS:
+    handle, subsetFile = tempfile.mkstemp( suffix = '.npz' )
+    os.close( handle )
+    savez( subsetFile, **subset )
+    cache.store( key, subsetFile )
+
+  return subset
+
+class DatasetAxes( object ):
+  # An OPeNDAP dataset along with its coordinates, which are read once.
+  def __init__( self, url ):
+    self.dataset = open_url( url )
+    self.lons = asarray( self.dataset.lon[:] )
+    self.lats = asarray( self.dataset.lat[:] )
+    self.times = asarray( self.dataset.time[:] )
+
+def fetchSubset( axes, north, south, west, east, sliceStart, sliceStop ):
+  # Every time step from sliceStart up to sliceStop.  Along space, u and v
+  # stop one cell short of lats and lons, see rawToRecords().
+  xIndex = array([i for i,lon in enumerate(axes.lons) if lon>west and lon<east])
+  yIndex = array([i for i,lat in enumerate(axes.lats) if lat>south and lat<north])
+  tIndex = flatnonzero( (axes.times >= sliceStart) & (axes.times < sliceStop) )
+  lons = axes.lons[xIndex]
+  lats = axes.lats[yIndex]
+  times = axes.times[tIndex]
+
+  if len( tIndex ):
+    u = axes.dataset.u[min(tIndex):max(tIndex)+1,min(yIndex):max(yIndex),min(xIndex):max(xIndex)]
+    v = axes.dataset.v[min(tIndex):max(tIndex)+1,min(yIndex):max(yIndex),min(xIndex):max(xIndex)]
+  else:
+    u = v = zeros( (0, max(yIndex)-min(yIndex), max(xIndex)-min(xIndex)) )
+
+  return { 'times' : times, 'lats' : lats, 'lons' : lons,
+    'u' : asarray(u, dtype = float), 'v' : asarray(v, dtype = float) }
 
 def rawToRecords(times,lats,longs,u,v,resolution):
   vel = (u**2+v**2)**0.5
@@ -103,18 +178,20 @@ def rawToRecords(times,lats,longs,u,v,resolution):
       curLocation = WKTSpatialElement('POINT('+str(lat)+' '+str(lon)+')'),
       curSpeed = float(vel[t,y,x]),
       curDirection = float(dir[t,y,x])
-    ) for t,time in enumerate(times) if t < len(times)-1
+    ) for t,time in enumerate(times)
     for x,lon in enumerate(longs) if x < len(longs)-1
     for y,lat in enumerate(lats) if y < len(lats)-1 ]
 
-  return [associateWithSource(record,resolution) for record in records if not (isnan(record.curspeed) or isnan(record.curdirection))]
+  # A generator, so commitToDB() can start loading before every record has
+  # been associated with its source.
+  return (associateWithSource(record,resolution) for record in records if not (isnan(record.curspeed) or isnan(record.curdirection)))
 
 
 #---------------------------------------------------------------------
 #  Database Interaction 
 #---------------------------------------------------------------------
-def getSourceTypeFromDB( typeName ):
-  srcType = _session.query(SourceType)\
+def getSourceTypeFromDB( typeName, session ):
+  srcType = session.query(SourceType)\
       .filter( SourceType.sourcetypename == typeName ).first()
 
   if srcType:
@@ -123,29 +200,30 @@ def getSourceTypeFromDB( typeName ):
     # A record for this source type does not exist in the DB. Create it.
     srcType = SourceType( sourceTypeName = typeName)
 
-    _session.add( srcType )
-    _session.commit()
+    session.add( srcType )
+    session.commit()
 
     return srcType
 
-def getSourceFromDB( resolution ):
-  src = _session.query(Source)\
+def getSourceFromDB( resolution, session ):
+  src = session.query(Source)\
       .filter( Source.srcname == 'HFRadar-'+resolution ).first()
 
   if src:
     return src 
   else:
     # A record for this source does not exist in the DB. Create it. First find the source type
-    srcType = getSourceTypeFromDB( 'HFRadar' )
+    srcType = getSourceTypeFromDB( 'HFRadar', session )
     src = Source( srcName = 'HFRadar-'+resolution, srcSourceTypeID=srcType.sourcetypeid )
 
-    _session.add( src )
-    _session.commit()
+    session.add( src )
+    session.commit()
 
     return src
 
 def getSourceID( resolution ):
-  id = getSourceFromDB( resolution ).srcid
+  with DBman.session() as session:
+    id = getSourceFromDB( resolution, session ).srcid
   return id
 
 
@@ -156,8 +234,8 @@ def associateWithSource( record, resolution ):
     
 
 def commitToDB( records ):
-  _session.add_all( records )
-  _session.commit()
+  with DBman.BatchWriter( 'tblcurrent' ) as writer:
+    writer.put( records )
 
   return None
 
@@ -5,9 +5,6 @@ Overview
 This module provides routines for serializing data obtained by the downloader.py
 module to a SQL database.
 
-(Currently, use of the ARRAY and DOUBLE_PRECISION functions limits this to use
-with PostgreSQL databases.)
-
 **Development Status:**
   **Last Modified:** November, 6 2010 by Charlie Sharpsteen
 
@@ -22,9 +19,6 @@ with PostgreSQL databases.)
 #------------------------------------------------------------------------------
 #  Imports from third party libraries
 #------------------------------------------------------------------------------
-from sqlalchemy import and_
-from sqlalchemy.sql.expression import cast
-from sqlalchemy.dialects.postgresql import ARRAY, DOUBLE_PRECISION
 from geoalchemy import WKTSpatialElement
 
 #------------------------------------------------------------------------------
@@ -37,12 +31,8 @@ from wavecon import DBman
 #  Metadata, Object Classes and Other Constants
 #------------------------------------------------------------------------------
 BuoySource = DBman.accessTable(None, 'tblsource')
-SourceTypeRecord = DBman.accessTable(None, 'tblsourcetype')
 WindRecord = DBman.accessTable(None, 'tblwind')
 WaveRecord = DBman.accessTable(None, 'tblwave')
-SpectraRecord = DBman.accessTable(None, 'tblspectrabin')
-
-_session = DBman.startSession()
 
 # Import NDBC global variables
 from .globals import BUOY_META
@@ -148,7 +138,8 @@ def associateWithBuoy( record, buoyID, buoyLocation ):
 
 
 def getBuoyID( buoyNum ):
-  id = getBuoyFromDB( buoyNum ).srcid
+  with DBman.session() as session:
+    id = getBuoyFromDB( buoyNum, session ).srcid
   return id
 
 
@@ -160,8 +151,8 @@ def getBuoyLoc( buoyNum, asWKT = False ):
     return buoyLoc
 
 
-def getBuoyFromDB( buoyNum ):
-  buoy = _session.query(BuoySource).filter( 
+def getBuoyFromDB( buoyNum, session ):
+  buoy = session.query(BuoySource).filter( 
     BuoySource.srcname == getBuoyName( buoyNum ) 
   ).first()
 
@@ -174,8 +165,8 @@ def getBuoyFromDB( buoyNum ):
       srcSourceTypeID = getSourceTypeID( buoyNum )
     )
 
-    _session.add( buoy )
-    _session.commit()
+    session.add( buoy )
+    session.commit()
 
     return buoy
 
@@ -207,49 +198,26 @@ def getBuoySourceType( buoyNum ):
 #  Database SourceType Representation
 #------------------------------------------------------------------------------
 def getSourceTypeID( buoyNum ):
-  buoyType = _session.query(SourceTypeRecord).filter( 
-    SourceTypeRecord.sourcetypename == getBuoySourceType( buoyNum ) 
-  ).first()
-
-  if buoyType:
-    return buoyType.id
-  else:
-    # A record for this buoy does not exist in the DB. Create it.
-    buoyType = SourceTypeRecord( sourceTypeName = getBuoySourceType( buoyNum ) )
-
-    _session.add( buoyType )
-    _session.commit()
-
-    return buoyType.id
+  return DBman.source_type_id( getBuoySourceType( buoyNum ) )
 
 
 #------------------------------------------------------------------------------
 #  Database Spectra Representation
 #------------------------------------------------------------------------------
 def getSpectraBinID( freqBins = None, dirBins = None ):
-  spectra = _session.query(SpectraRecord).filter(and_(
-    SpectraRecord.spcfreq == cast( freqBins, ARRAY(DOUBLE_PRECISION) ),
-    SpectraRecord.spcdir == cast( dirBins, ARRAY(DOUBLE_PRECISION) )
-  )).first()
-
-  if spectra:
-    return spectra.id
-  else:
-    # Create a record for the spectra.
-    spectra = SpectraRecord( spcFreq = freqBins, spcDir = dirBins )
-
-    _session.add( spectra )
-    _session.commit()
-
-    return spectra.id
+  return DBman.spectra_bin_id( freqBins, dirBins )
 
 
 #---------------------------------------------------------------------
 #  Database Interaction
 #---------------------------------------------------------------------
 def commitToDB( records ):
-  _session.add_all( records )
-  _session.commit()
+  if not records:
+    return None
+
+  # Records are either all wind or all wave records, see formDatabaseRecords.
+  with DBman.BatchWriter( records[0].__tablename__ ) as writer:
+    writer.put( records )
 
   return None
 
@@ -20,7 +20,6 @@ Data Center (`NDBC`_).
 from datetime import datetime, timedelta
 
 import urllib
-import urllib2
 
 import re
 
@@ -39,6 +38,12 @@ from math import pi, cos, radians
 from .globals import *
 
 
+#------------------------------------------------------------------------------
+#  Imports from other wavecon modules
+#------------------------------------------------------------------------------
+from ..cache import shared_cache
+
+
 #------------------------------------------------------------------------------
 #  Data Retrieval
 #------------------------------------------------------------------------------
@@ -145,8 +150,7 @@ def fetchBuoyRecords( buoyNum, startTime, stopTime, num_dir_bins, verbose = Fals
 def fetchRecords( timeSpan, buoyNum, dataType ):
   records = [
     rawToRecords( data, buoyNum, dataType )
-    for data in [ fetchData( time, buoyNum, dataType )
-      for time in timeSpan ]
+    for data in fetchData( timeSpan, buoyNum, dataType )
     if NDBCGaveData(data) ]
 
   # The above list comprehension returns a list of lists with each
@@ -155,7 +159,25 @@ def fetchRecords( timeSpan, buoyNum, dataType ):
   return list(chain.from_iterable( records ))
 
 
-def fetchData( time, buoyNum, dataType ):
+def fetchData( timeSpan, buoyNum, dataType ):
+  # Every chunk is downloaded at once.  Historical years never change, so
+  # after the first request they are read from the cache.
+  urls = [ dataURL( time, buoyNum, dataType ) for time in timeSpan ]
+  cache = shared_cache()
+
+  data = []
+  for url, cachedFile in zip( urls, cache.fetch_all( urls ) ):
+    with open( cachedFile ) as NDBC:
+      data.append( NDBC.read() )
+
+    # Don't hand out NDBC's error page in place of the data next time.
+    if not NDBCGaveData( data[-1] ):
+      cache.forget( url )
+
+  return data
+
+
+def dataURL( time, buoyNum, dataType ):
   BASE_URL = "http://www.ndbc.noaa.gov/view_text_file.php"
   PARAMS = {
 
@@ -210,11 +232,7 @@ def fetchData( time, buoyNum, dataType ):
   # E.g slashes, /, will become %2. The urllib.unquote function fixes this.
   urlData = urllib.unquote(urllib.urlencode( dataDict ))
 
-  NDBC = urllib2.urlopen( "{0}?{1}".format( BASE_URL, urlData ) )
-  data = NDBC.read()
-  NDBC.close()
-
-  return data
+  return "{0}?{1}".format( BASE_URL, urlData )
 
 
 def NDBCGaveData( responseString ):
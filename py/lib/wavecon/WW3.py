@@ -0,0 +1,208 @@
+"""
+Overview
+--------
+
+This module reads the point output of the WAVEWATCH III (`WW3`_) model run
+by NCEP, e.g. the ``enp.EKA*`` spectra files published at
+``ftp://polar.ncep.noaa.gov/pub/waves/latest_run/``.
+
+.. _WW3: http://polar.ncep.noaa.gov/waves/
+
+File Format
+-----------
+
+A spectra file written by ``ww3_outp`` holds a header followed by one record
+per output time::
+
+  'WAVEWATCH III SPECTRA'     25    24     1 'spectral resolution for points'
+   0.350E-01 0.385E-01 ...        frequencies in Hz, 8 per line
+   1.571E+00 1.309E+00 ...        directions in radians, 7 per line
+  20101222 000000                 time of the record
+  'EKA01     '  40.84-124.23   ... name, latitude, longitude and depth
+    0.000E+00  1.234E-03 ...      spectral densities in m^2/Hz/rad, 7 per line
+  20101222 030000
+  ...
+
+Records repeat the name line and the densities for every point in the file.
+
+Implementation Details
+----------------------
+
+The file is read one line at a time.  Once the first record has been read
+its length is used to estimate how many records the file holds, and the
+densities are parsed with ``numpy.fromstring`` straight into a preallocated
+array instead of being collected as Python floats first.
+"""
+#------------------------------------------------------------------------------
+#  Imports from Python 2.7 standard library
+#------------------------------------------------------------------------------
+import os
+import re
+from datetime import datetime
+from math import pi
+
+
+#------------------------------------------------------------------------------
+#  Imports from third party libraries
+#------------------------------------------------------------------------------
+import numpy as np
+
+
+#------------------------------------------------------------------------------
+#  Constants
+#------------------------------------------------------------------------------
+# Latitude and longitude are written in F7.2 fields and the depth in an F10.1
+# field, with nothing between them, e.g. "  40.84-124.23    1000.0".
+_POINT_PAT = re.compile( r'\s*(-?\d+\.\d\d)\s*(-?\d+\.\d\d)\s*(-?\d+\.\d)' )
+
+
+#------------------------------------------------------------------------------
+#  Containers
+#------------------------------------------------------------------------------
+class PointSpectra(object):
+  """Directional wave spectra at one WW3 output point.
+
+  Attributes:
+
+    * *name*
+        Name of the output point, e.g. ``'EKA01'``.
+
+    * *lat*, *lon*, *depth*
+        Location of the point in degrees and water depth in meters.
+
+    * *times*
+        ``datetime`` of each record.
+
+    * *freqs*
+        Frequency bins in Hz, a ``float64`` array.
+
+    * *dirs*
+        Direction bins in degrees, a ``float64`` array.  Directions are those
+        the waves travel toward.
+
+    * *spectra*
+        Array of spectral densities in m^2/Hz/degree with shape ``(times,
+        freqs, dirs)``, of the *dtype* given to
+        :py:func:`read_point_spectra`.
+  """
+  def __init__( self, name, lat, lon, depth, times, freqs, dirs, spectra ):
+    self.name = name
+    self.lat = lat
+    self.lon = lon
+    self.depth = depth
+    self.times = times
+    self.freqs = freqs
+    self.dirs = dirs
+    self.spectra = spectra
+
+  def __repr__( self ):
+    return '<PointSpectra {0} ({1}, {2}): {3} times, {4} freqs, {5} dirs>'\
+      .format( self.name, self.lat, self.lon, len(self.times),
+        len(self.freqs), len(self.dirs) )
+
+
+#------------------------------------------------------------------------------
+#  Parsing
+#------------------------------------------------------------------------------
+def read_point_spectra( file_name, dtype = np.float64 ):
+  """Reads a WW3 spectra file and returns a list holding a
+  :py:class:`PointSpectra` for each point in the file.  Spectral densities
+  are stored as *dtype*.  The default keeps the full precision of the
+  ``float8`` columns of tblWave, so it is what loaders must use; callers that
+  only keep the spectra in memory may ask for ``numpy.float32`` to halve the
+  size of the array."""
+  size = os.path.getsize( file_name )
+
+  with open( file_name ) as stream:
+    nfreqs, ndirs, npoints = _read_header( stream )
+    freqs = _read_values( stream, nfreqs )[0]
+    dirs = np.degrees(_read_values( stream, ndirs )[0])
+    header_bytes = stream.tell()
+
+    points = [ None ] * npoints
+    times = []
+    spectra = None
+    lines = None
+
+    while True:
+      stamp = stream.readline()
+      if not stamp.strip():
+        break
+      times.append( _read_time( stamp ) )
+      t = len( times ) - 1
+
+      for p in xrange( npoints ):
+        point = _read_point( stream.readline() )
+        if points[p] is None:
+          points[p] = point
+
+        if lines is None:
+          values, lines = _read_values( stream, nfreqs * ndirs )
+        else:
+          values = np.fromstring( ''.join([ stream.readline()
+            for line in xrange( lines ) ]), dtype = np.float64, sep = ' ' )
+          if values.size != nfreqs * ndirs:
+            raise ValueError( '{0}: expected {1} spectral densities at {2}, '
+              'found {3}'.format( file_name, nfreqs * ndirs, times[-1],
+                values.size ) )
+
+        if spectra is None:
+          # Size the array from the length of the first record.
+          record_bytes = (stream.tell() - header_bytes) * npoints
+          expected = max( 1, (size - header_bytes) // record_bytes )
+          spectra = np.empty( (expected, npoints, nfreqs, ndirs), dtype )
+        elif t >= len( spectra ):
+          spectra = np.resize( spectra,
+            (2 * len(spectra),) + spectra.shape[1:] )
+
+        # Convert from m^2/Hz/rad to m^2/Hz/degree.
+        spectra[t, p] = values.reshape( nfreqs, ndirs ) * (pi / 180)
+
+  if spectra is None:
+    spectra = np.empty( (0, npoints, nfreqs, ndirs), dtype )
+  spectra = spectra[:len(times)]
+
+  return [ PointSpectra( name, lat, lon, depth, times, freqs, dirs,
+      spectra[:, p] )
+    for p, (name, lat, lon, depth) in enumerate( points ) ]
+
+
+def _read_header( stream ):
+  # 'WAVEWATCH III SPECTRA'     25    24     1 'spectral resolution...'
+  line = stream.readline()
+  fields = line.split( "'" )
+  if len( fields ) < 3 or 'WAVEWATCH III SPECTRA' not in fields[1]:
+    raise ValueError( 'Not a WW3 spectra file: {0}'.format( line.strip() ) )
+
+  return [ int(field) for field in fields[2].split()[:3] ]
+
+
+def _read_values( stream, count ):
+  # Reads lines until *count* numbers have been read.  Returns the numbers and
+  # the number of lines they took up.
+  chunks = []
+  found = 0
+  lines = 0
+  while found < count:
+    line = stream.readline()
+    if not line:
+      raise ValueError( 'Unexpected end of WW3 spectra file' )
+    chunks.append( line )
+    found += len( line.split() )
+    lines += 1
+
+  return np.fromstring( ''.join(chunks), dtype = np.float64, sep = ' ' ), lines
+
+
+def _read_time( line ):
+  # 20101222 030000
+  return datetime( int(line[0:4]), int(line[4:6]), int(line[6:8]),
+    int(line[9:11]), int(line[11:13]), int(line[13:15]) )
+
+
+def _read_point( line ):
+  # 'EKA01     '  40.84-124.23    1000.0 ...
+  _, name, rest = line.split( "'", 2 )
+  lat, lon, depth = _POINT_PAT.match( rest ).groups()
+
+  return name.strip(), float(lat), float(lon), float(depth)
@@ -0,0 +1,517 @@
+"""
+Overview
+--------
+
+This module keeps local copies of the files fetched from upstream data
+servers.  Preparing a model run or loading buoy data repeatedly asks for the
+same files, e.g. a whole historical year of observations for an NDBC buoy, and
+a copy on disk saves downloading them again::
+
+  cache = shared_cache()
+  files = cache.fetch_all(urls, gunzip = True)
+
+How long a copy may be used without asking the server again depends on the
+source, see :py:data:`TTL_POLICIES`.  Once a copy is older than that the
+server is asked whether the file has changed, using the ``ETag`` and
+``Last-Modified`` values it reported for the copy, and the file is only
+downloaded again if it has.
+
+Cache Layout
+------------
+
+Files are stored under their SHA-256 digest, so identical files fetched from
+different URLs are stored once::
+
+  cache/
+    index.sqlite            URL -> digest, validators and access times
+    objects/3f/3fa8...      file contents
+
+The index is a SQLite database, so several processes may share a cache.
+When the files in the cache take up more than *max_bytes*, those used least
+recently are removed.
+"""
+#------------------------------------------------------------------------------
+#  Imports from Python 2.7 standard library
+#------------------------------------------------------------------------------
+import os
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import threading
+import time
+import fnmatch
+from os import path
+from contextlib import contextmanager
+from urlparse import urlsplit, urlunsplit
+
+
+#------------------------------------------------------------------------------
+#  Imports from other wavecon modules
+#------------------------------------------------------------------------------
+from .download import DownloadManager, DownloadError, as_completed
+
+
+#------------------------------------------------------------------------------
+#  Constants
+#------------------------------------------------------------------------------
+_scriptLocation = path.dirname(path.abspath( __file__ ))
+CACHE_DIR = path.abspath(path.join( _scriptLocation, '..', '..', '..',
+  'cache' ))
+"""``CACHE_DIR`` holds the path to the top-level ``cache`` directory used by
+:py:func:`shared_cache`."""
+
+TTL_POLICIES = [
+  # Historical NDBC years are never revised once published.
+  ('http://www.ndbc.noaa.gov/view_text_file.php?dir=data/historical/*', None),
+  # Months of the current year grow as observations arrive.
+  ('http://www.ndbc.noaa.gov/*', 3600),
+  # Replaced by each WW3 forecast cycle, four times a day.
+  ('ftp://polar.ncep.noaa.gov/pub/waves/latest_run/*', 1800),
+  # Archived NAM runs, addressed by forecast date.
+  ('http://nomads.ncdc.noaa.gov/thredds/ncss/grid/nam218/*', None),
+  # Hours of HF radar currents, only cached by HFRadar once they have
+  # settled.
+  ('http://sdf.ndbc.noaa.gov/*&hour=*', None),
+  # HF radar currents are revised as late radials come in.
+  ('http://sdf.ndbc.noaa.gov/*', 3600),
+  # Interpolation weights are keyed by the geometry they were built for.
+  ('regrid://*', None),
+  ('*', 3600)
+]
+"""Seconds a cached copy of a file is used before the server is asked whether
+the file has changed, as a list of ``(URL pattern, seconds)`` pairs.  The
+first shell style pattern that matches the normalized URL of a file applies.
+``None`` means a copy never goes stale."""
+
+MAX_BYTES = 2 * 1024 ** 3
+
+_SCHEMA = """
+  CREATE TABLE IF NOT EXISTS entries (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    fetched REAL NOT NULL,
+    used REAL NOT NULL,
+    etag TEXT,
+    last_modified TEXT
+  );
+  CREATE INDEX IF NOT EXISTS entries_used ON entries (used);
+  CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest);
+"""
+
+
+#------------------------------------------------------------------------------
+#  URL Normalization
+#------------------------------------------------------------------------------
+_DEFAULT_PORTS = { 'http' : 80, 'https' : 443, 'ftp' : 21 }
+
+def normalize_url( url ):
+  """Returns *url* in a canonical form, so that requests for the same file
+  share a cache entry.  The scheme and host are lowercased, default ports and
+  fragments removed and query parameters sorted.  Parameter values are left
+  as they are, escaped or not."""
+  parts = urlsplit( url )
+  scheme = parts.scheme.lower()
+
+  netloc = parts.hostname or ''
+  if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+    netloc += ':{0}'.format(parts.port)
+  if parts.username:
+    netloc = '{0}@{1}'.format(parts.username, netloc)
+
+  query = '&'.join(sorted( param for param in parts.query.split('&')
+    if param ))
+
+  return urlunsplit(( scheme, netloc, parts.path or '/', query, '' ))
+
+
+#------------------------------------------------------------------------------
+#  Cache
+#------------------------------------------------------------------------------
+class DataCache(object):
+  """A cache of downloaded files stored in *cache_dir*.
+
+  Argument Info:
+
+    * *cache_dir*
+        Directory holding the cache.  It is created if it does not exist.
+
+    * *max_bytes*
+        Size the files in the cache are trimmed to after each fetch.
+
+    * *policies*
+        How long copies stay fresh, in the form of :py:data:`TTL_POLICIES`.
+
+  Paths returned by the cache point at the cached copies themselves.  They
+  are read only and must not be moved or deleted.
+
+  Counts of cache hits, misses and revalidations made through this object
+  are available from :py:meth:`stats`.
+
+  Fetches may be made from several threads at once.  A file that is already
+  being downloaded for one of them is not downloaded again: the others wait
+  for that download and are handed the same copy.
+  """
+  def __init__( self, cache_dir = CACHE_DIR, max_bytes = MAX_BYTES,
+    policies = TTL_POLICIES ):
+    self.cache_dir = cache_dir
+    self.max_bytes = max_bytes
+    self.policies = policies
+
+    self._objects = path.join( cache_dir, 'objects' )
+    if not path.isdir( self._objects ):
+      os.makedirs( self._objects )
+    self._index_file = path.join( cache_dir, 'index.sqlite' )
+
+    self._lock = threading.Lock()
+    self._counts = { 'hits' : 0, 'revalidated' : 0, 'misses' : 0,
+      'evictions' : 0 }
+    # Key -> _Fetch of every entry being downloaded.
+    self._fetching = {}
+
+    with self._index() as index:
+      index.executescript( _SCHEMA )
+
+  def key( self, url, gunzip = False ):
+    """Returns the key of the entry that holds the file at *url*.  Files
+    fetched with *gunzip* set are stored separately from the compressed
+    ones."""
+    key = normalize_url( url )
+    if gunzip:
+      key += '#gunzip'
+
+    return key
+
+  def ttl( self, key ):
+    """Returns the seconds the entry *key* stays fresh, or ``None`` if it
+    never goes stale."""
+    for pattern, seconds in self.policies:
+      if fnmatch.fnmatchcase( key, pattern ):
+        return seconds
+
+    return 0
+
+  def fetch( self, url, gunzip = False, downloads = None ):
+    """Returns the path of a cached copy of the file at *url*, see
+    :py:meth:`fetch_all`."""
+    return self.fetch_all( [url], gunzip, downloads )[0]
+
+  def fetch_all( self, urls, gunzip = False, downloads = None ):
+    """Returns the paths of cached copies of the files at *urls*, in the same
+    order.  Files that are not cached, or whose copies are stale and have
+    changed upstream, are fetched in parallel through *downloads*, a
+    :py:class:`wavecon.download.DownloadManager`.  A temporary manager is used
+    if none is given.
+
+    Raises :py:class:`wavecon.download.DownloadError` for the first file that
+    could not be fetched, after storing the ones that could."""
+    paths = [ None ] * len(urls)
+    for i, cached_file in self.iter_fetch( urls, gunzip, downloads ):
+      paths[i] = cached_file
+
+    return paths
+
+  def iter_fetch( self, urls, gunzip = False, downloads = None ):
+    """Like :py:meth:`fetch_all`, but yields ``(index, path)`` pairs as soon
+    as each file is available, where *index* is the position of its URL in
+    *urls*.  Fresh copies come first, followed by downloaded files in the
+    order their downloads finish, so the caller can start working on them
+    while the rest are downloading."""
+    now = time.time()
+    keys = [ self.key(url, gunzip) for url in urls ]
+    entries = self._entries( keys )
+
+    pending = []
+    for i, (url, key) in enumerate(zip( urls, keys )):
+      entry = entries.get( key )
+      if entry is not None and not path.exists(self._object( entry['digest'] )):
+        entry = None
+
+      if entry is not None and self._fresh( key, entry, now ):
+        self._count( 'hits' )
+        yield i, self._object( entry['digest'] )
+      else:
+        pending.append(( i, url, key, entry ))
+
+    if pending:
+      owned, waiting = self._claim( pending )
+      manager = None
+      errors = []
+      try:
+        if owned:
+          manager = downloads or DownloadManager()
+          for i, cached_file in self._download( manager, owned, gunzip,
+            errors ):
+            yield i, cached_file
+
+        # Files another fetch was already downloading.
+        for i, fetching in waiting:
+          fetching.done.wait()
+          if fetching.error is not None:
+            errors.append( fetching.error )
+          else:
+            yield i, fetching.path
+      finally:
+        self._release( owned )
+        if manager is not None and downloads is None:
+          manager.close()
+      if errors:
+        raise errors[0]
+
+    self._touch( keys, now )
+    self._trim( keys )
+
+  def lookup( self, url ):
+    """Returns the path of a fresh cached copy of *url*, or ``None``.  Used
+    together with :py:meth:`store` to cache data that is not fetched as a
+    single file, such as a subset of an OPeNDAP dataset."""
+    now = time.time()
+    key = self.key( url )
+    entry = self._entries( [key] ).get( key )
+    if entry is None or not self._fresh( key, entry, now ) or \
+      not path.exists(self._object( entry['digest'] )):
+      self._count( 'misses' )
+      return None
+
+    self._count( 'hits' )
+    self._touch( [key], now )
+
+    return self._object( entry['digest'] )
+
+  def store( self, url, a_file ):
+    """Moves *a_file* into the cache as the copy of *url* and returns its new
+    path."""
+    key = self.key( url )
+    digest, size = self._add_object( a_file )
+    self._set_entry( key, digest, size, {} )
+    self._trim( [key] )
+
+    return self._object( digest )
+
+  def forget( self, url, gunzip = False ):
+    """Drops the entry for *url*, e.g. after finding the cached copy holds an
+    error page instead of data.  The next fetch downloads it again."""
+    with self._index() as index:
+      index.execute( 'DELETE FROM entries WHERE url = ?',
+        (self.key( url, gunzip ),) )
+
+  def stats( self ):
+    """Returns a dictionary with the number of ``hits``, ``misses``,
+    ``revalidated`` copies and ``evictions`` made through this object, along
+    with the number of ``entries`` and ``bytes`` in the cache."""
+    with self._index() as index:
+      entries, size = index.execute(
+        'SELECT count(*), (SELECT coalesce(sum(size), 0) FROM '
+        '(SELECT DISTINCT digest, size FROM entries)) FROM entries'
+      ).fetchone()
+
+    with self._lock:
+      stats = dict( self._counts )
+    stats.update( entries = entries, bytes = size )
+
+    return stats
+
+  #--------------------------------------------------------------------
+  #  Downloads
+  #--------------------------------------------------------------------
+  def _claim( self, pending ):
+    # Splits the entries to fetch into those this call downloads and those
+    # another call, or an earlier URL of this one, is already downloading.
+    owned = []
+    waiting = []
+    with self._lock:
+      for i, url, key, entry in pending:
+        fetching = self._fetching.get( key )
+        if fetching is None:
+          fetching = self._fetching[key] = _Fetch( url )
+          owned.append(( i, url, key, entry, fetching ))
+        else:
+          waiting.append(( i, fetching ))
+
+    return owned, waiting
+
+  def _finish( self, key, fetching, cached_file = None, error = None ):
+    # Hands the outcome of a download to the fetches waiting for it.
+    with self._lock:
+      if self._fetching.get( key ) is fetching:
+        del self._fetching[key]
+
+    fetching.path = cached_file
+    fetching.error = error
+    fetching.done.set()
+
+  def _release( self, owned ):
+    # Fails the downloads that were never finished, e.g. because the caller
+    # stopped iterating, so nobody waits for them forever.
+    for i, url, key, entry, fetching in owned:
+      if not fetching.done.is_set():
+        self._finish( key, fetching, error = DownloadError( url,
+          'the fetch downloading it was abandoned' ) )
+
+  def _download( self, manager, pending, gunzip, errors ):
+    # Yields (index, path) pairs as downloads finish.  Failed downloads are
+    # added to *errors*.
+    queued = {}
+    for i, url, key, entry, fetching in pending:
+      validators = None
+      if entry is not None:
+        validators = { 'etag' : entry['etag'],
+          'last_modified' : entry['last_modified'] }
+      name = hashlib.sha1( key ).hexdigest()
+      download = manager.fetch( url, name, gunzip, validators )
+      queued[download] = ( i, key, entry, fetching )
+
+    for download in as_completed( queued ):
+      i, key, entry, fetching = queued[download]
+      try:
+        new_file = download.result()
+      except DownloadError as error:
+        self._finish( key, fetching, error = error )
+        errors.append( error )
+        continue
+
+      if new_file is None:
+        self._set_entry( key, entry['digest'], entry['size'],
+          download.validators )
+        self._count( 'revalidated' )
+        cached_file = self._object( entry['digest'] )
+      else:
+        digest, size = self._add_object( new_file )
+        self._set_entry( key, digest, size, download.validators )
+        self._count( 'misses' )
+        cached_file = self._object( digest )
+
+      self._finish( key, fetching, cached_file )
+      yield i, cached_file
+
+  #--------------------------------------------------------------------
+  #  Objects
+  #--------------------------------------------------------------------
+  def _object( self, digest ):
+    return path.join( self._objects, digest[:2], digest )
+
+  def _add_object( self, a_file ):
+    sha = hashlib.sha256()
+    with open( a_file, 'rb' ) as contents:
+      for data in iter(lambda: contents.read(1 << 16), ''):
+        sha.update( data )
+    digest = sha.hexdigest()
+    size = os.path.getsize( a_file )
+
+    target = self._object( digest )
+    if path.exists( target ):
+      os.remove( a_file )
+      return digest, size
+
+    if not path.isdir(path.dirname( target )):
+      try:
+        os.makedirs(path.dirname( target ))
+      except OSError:
+        # Made by another process in the meantime.
+        pass
+
+    # Move the file next to its final name first, so other processes never
+    # see a partly copied object.
+    handle, temporary = tempfile.mkstemp( dir = path.dirname(target) )
+    os.close( handle )
+    shutil.move( a_file, temporary )
+    os.chmod( temporary, 0444 )
+    os.rename( temporary, target )
+
+    return digest, size
+
+  #--------------------------------------------------------------------
+  #  Index
+  #--------------------------------------------------------------------
+  @contextmanager
+  def _index( self ):
+    index = sqlite3.connect( self._index_file, timeout = 60 )
+    index.row_factory = sqlite3.Row
+    try:
+      with index:
+        yield index
+    finally:
+      index.close()
+
+  def _entries( self, keys ):
+    entries = {}
+    with self._index() as index:
+      for key in set(keys):
+        row = index.execute( 'SELECT * FROM entries WHERE url = ?',
+          (key,) ).fetchone()
+        if row is not None:
+          entries[key] = row
+
+    return entries
+
+  def _set_entry( self, key, digest, size, validators ):
+    now = time.time()
+    with self._index() as index:
+      index.execute( 'INSERT OR REPLACE INTO entries VALUES (?,?,?,?,?,?,?)',
+        (key, digest, size, now, now, validators.get('etag'),
+          validators.get('last_modified')) )
+
+  def _touch( self, keys, now ):
+    with self._index() as index:
+      index.executemany( 'UPDATE entries SET used = ? WHERE url = ?',
+        [ (now, key) for key in keys ] )
+
+  def _fresh( self, key, entry, now ):
+    ttl = self.ttl( key )
+    return ttl is None or now - entry['fetched'] < ttl
+
+  def _trim( self, keep ):
+    # Drops the least recently used entries until the cache fits, keeping
+    # those just handed out.
+    keep = set( keep )
+    with self._index() as index:
+      size = index.execute( 'SELECT coalesce(sum(size), 0) FROM '
+        '(SELECT DISTINCT digest, size FROM entries)' ).fetchone()[0]
+      if size <= self.max_bytes:
+        return
+
+      for row in index.execute( 'SELECT url, digest, size FROM entries '
+        'ORDER BY used' ).fetchall():
+        if size <= self.max_bytes:
+          break
+        if row['url'] in keep:
+          continue
+
+        index.execute( 'DELETE FROM entries WHERE url = ?', (row['url'],) )
+        self._count( 'evictions' )
+        shared = index.execute( 'SELECT 1 FROM entries WHERE digest = ?',
+          (row['digest'],) ).fetchone()
+        if shared is None:
+          size -= row['size']
+          try:
+            os.remove(self._object( row['digest'] ))
+          except OSError:
+            pass
+
+  def _count( self, name ):
+    with self._lock:
+      self._counts[name] += 1
+
+
+class _Fetch(object):
+  # A download in progress, waited for by other fetches of the same entry.
+  def __init__( self, url ):
+    self.url = url
+    self.done = threading.Event()
+    self.path = None
+    self.error = None
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def shared_cache():
+  """Returns the :py:class:`DataCache` in :py:data:`CACHE_DIR` shared by
+  every module in the process."""
+  global _shared
+  with _shared_lock:
+    if _shared is None:
+      _shared = DataCache()
+
+  return _shared
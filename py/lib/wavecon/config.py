@@ -122,8 +122,27 @@ a python dictionary with the following structure::
     "type" : "postgresql"  
   }
 
+The optional key ``"metadata_cache"`` may name a directory in which
+:py:mod:`wavecon.DBman` will store reflected table definitions.  This saves
+every script from reflecting the schema from the database at startup.  The
+cache is keyed on a fingerprint of the schema, so it is refreshed
+automatically after the schema changes.
+
+Every connection made by :py:mod:`wavecon.DBman` comes out of a single pool
+shared by the whole process.  The optional key ``"pool"`` tunes that pool::
+
+  "pool" : {
+    "size" : 5,           # connections kept open
+    "max_overflow" : 10,  # extra connections allowed under load
+    "timeout" : 30,       # seconds to wait for a free connection
+    "recycle" : 3600      # seconds before a connection is re-opened
+  }
+
+The values shown are the defaults.
+
 Some functions which use this object are: 
 
+  * :py:func:`wavecon.DBman.session`
   * :py:func:`wavecon.DBman.startSession`
   * :py:func:`wavecon.DBman.accessTable`
 
@@ -0,0 +1,588 @@
+"""
+Overview
+--------
+
+This module fetches data files from HTTP and FTP servers on behalf of the
+scripts that load upstream forecasts and observations into the database.
+
+A :py:class:`wavecon.download.DownloadManager` downloads many files at once
+using a pool of threads::
+
+  with DownloadManager() as downloads:
+    files = downloads.fetch_all(downloads.list(
+      'ftp://polar.ncep.noaa.gov/pub/waves/latest_run/enp.EKA*'),
+      gunzip = True)
+    ...
+
+Implementation Details
+----------------------
+
+  * Each thread keeps its connections open between files, so fetching the
+    many small WW3 point files costs one FTP login per thread instead of one
+    per file.
+
+  * No more than *per_host* files are fetched from the same server at once.
+
+  * Transfers that fail with a network error or a server-side (5xx) error are
+    retried with exponential backoff.  Retries pick up where the previous
+    attempt stopped using HTTP ``Range`` requests or the FTP ``REST``
+    command.
+
+  * Gzipped files may be decompressed while they are being downloaded.
+
+  * Files land in a private work directory created for each manager and
+    removed along with it, so concurrent runs never see each other's files.
+"""
+#------------------------------------------------------------------------------
+#  Imports from Python 2.7 standard library
+#------------------------------------------------------------------------------
+import os
+import shutil
+import tempfile
+import threading
+import Queue
+import socket
+import time
+import random
+import zlib
+import httplib
+import ftplib
+import fnmatch
+import posixpath
+from urlparse import urlsplit, urljoin
+
+
+#------------------------------------------------------------------------------
+#  Constants and Exceptions
+#------------------------------------------------------------------------------
+# Files are streamed to disk in pieces of this many bytes.
+_CHUNK_SIZE = 1 << 16
+
+# HTTP statuses worth retrying.  Anything else that is not a success or a
+# redirect will not get better by asking again.
+_RETRY_STATUSES = frozenset([408, 429, 500, 502, 503, 504])
+_REDIRECT_STATUSES = frozenset([301, 302, 303, 307, 308])
+_MAX_REDIRECTS = 5
+
+_TRANSIENT_ERRORS = (socket.error, httplib.HTTPException, EOFError,
+  ftplib.error_temp, ftplib.error_reply, ftplib.error_proto)
+
+
+class DownloadError(Exception):
+  """Raised when a file could not be downloaded.  The ``url`` attribute holds
+  the address of the file and ``reason`` the last error encountered."""
+  def __init__(self, url, reason):
+    Exception.__init__(self, 'Could not download {0}: {1}'.format(url, reason))
+    self.url = url
+    self.reason = reason
+
+
+class _PermanentError(Exception):
+  # A failure that retrying will not fix, e.g. a missing file.
+  pass
+
+
+class _RetryableError(Exception):
+  # A failure reported by the server that may go away, e.g. HTTP 503.
+  pass
+
+
+#------------------------------------------------------------------------------
+#  Writing Downloaded Data
+#------------------------------------------------------------------------------
+def _gunzipper():
+  # Adding 16 to the window size makes zlib expect a gzip header and trailer.
+  return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+class _Sink(object):
+  # Receives the bytes of one transfer.  The raw bytes are appended to a
+  # .part file so an interrupted transfer can be resumed.  When gunzipping,
+  # the decompressed bytes are also written to the output file as they
+  # arrive.
+  def __init__(self, part_file, output_file = None):
+    self.part = open(part_file, 'ab')
+    self.offset = os.path.getsize(part_file)
+    self.output = None
+
+    if output_file is not None:
+      self.output = open(output_file, 'wb')
+      self._decompressor = _gunzipper()
+      # Bring the output up to where the previous attempt stopped.
+      with open(part_file, 'rb') as previous:
+        for data in iter(lambda: previous.read(_CHUNK_SIZE), ''):
+          self._decompress(data)
+
+  def write(self, data):
+    self.part.write(data)
+    self.offset += len(data)
+    if self.output is not None:
+      self._decompress(data)
+
+  def reset(self):
+    # The server ignored a request to resume, start from scratch.
+    self.part.seek(0)
+    self.part.truncate()
+    self.offset = 0
+    if self.output is not None:
+      self.output.seek(0)
+      self.output.truncate()
+      self._decompressor = _gunzipper()
+
+  def finish(self):
+    if self.output is not None:
+      self.output.write(self._decompressor.flush())
+    self.close()
+
+  def close(self):
+    self.part.close()
+    if self.output is not None:
+      self.output.close()
+
+  def _decompress(self, data):
+    while data:
+      self.output.write(self._decompressor.decompress(data))
+      # Files made by concatenating gzip files hold one gzip member after
+      # another.  Whatever follows the end of a member starts the next one.
+      data = self._decompressor.unused_data
+      if data:
+        self._decompressor = _gunzipper()
+
+
+#------------------------------------------------------------------------------
+#  Download Manager
+#------------------------------------------------------------------------------
+class Download(object):
+  """A file queued by :py:meth:`DownloadManager.fetch`.
+
+  Once the download has finished ``validators`` holds the ``'etag'`` and
+  ``'last_modified'`` values the server reported for the file, either of which
+  may be ``None``.  ``not_modified`` is ``True`` when the file was not
+  downloaded because it had not changed since the copy described by the
+  validators passed to :py:meth:`DownloadManager.fetch`.
+  """
+  def __init__(self, url, path, gunzip, conditions = None):
+    self.url = url
+    self.path = path
+    self.gunzip = gunzip
+    self.conditions = conditions or {}
+    self.validators = {}
+    self.not_modified = False
+    self.error = None
+    self._done = threading.Event()
+    self._waiters = []
+    self._lock = threading.Lock()
+
+  def done(self):
+    """Returns ``True`` once the download has finished or failed."""
+    return self._done.is_set()
+
+  def result(self, timeout = None):
+    """Waits for the download to finish and returns the path of the file, or
+    ``None`` if the file had not been modified.  Raises
+    :py:class:`DownloadError` if it failed."""
+    if not self._done.wait(timeout):
+      raise DownloadError(self.url, 'timed out waiting for the download')
+    if self.error is not None:
+      raise self.error
+    if self.not_modified:
+      return None
+
+    return self.path
+
+  def _finish(self):
+    with self._lock:
+      self._done.set()
+      waiters = list(self._waiters)
+    for waiter in waiters:
+      waiter.put(self)
+
+  def _notify(self, waiter):
+    # Puts the download on the *waiter* queue once it has finished.
+    with self._lock:
+      if not self._done.is_set():
+        self._waiters.append(waiter)
+        return
+    waiter.put(self)
+
+
+def as_completed(downloads):
+  """Yields each :py:class:`Download` in *downloads* as soon as it has
+  finished or failed."""
+  downloads = list(downloads)
+  finished = Queue.Queue()
+  for download in downloads:
+    download._notify(finished)
+
+  for i in xrange(len(downloads)):
+    yield finished.get()
+
+
+class DownloadManager(object):
+  """Downloads files in parallel into a private work directory.
+
+  Argument Info:
+
+    * *work_dir*
+        Directory that receives the downloaded files.  By default a new
+        temporary directory is created and removed again by ``close()``.
+        A directory passed in is left in place.
+
+    * *threads*
+        Number of files downloaded at the same time.
+
+    * *per_host*
+        Maximum number of files downloaded from a single server at the same
+        time.  Data servers such as NOMADS throttle or refuse clients that
+        open too many connections.
+
+    * *retries*
+        Number of times a failed transfer is retried.  The wait before retry
+        ``n`` is roughly ``backoff * 2 ** n`` seconds.
+
+    * *timeout*
+        Seconds to wait on an unresponsive server before giving up on an
+        attempt.
+
+  The manager may be used as a context manager, in which case ``close()`` is
+  called at the end of the ``with`` block.
+  """
+  def __init__(self, work_dir = None, threads = 8, per_host = 4, retries = 4,
+    backoff = 1.0, timeout = 60):
+    self._owns_work_dir = work_dir is None
+    if work_dir is None:
+      work_dir = tempfile.mkdtemp(prefix = 'wavecon-download-')
+    elif not os.path.isdir(work_dir):
+      os.makedirs(work_dir)
+
+    self.work_dir = work_dir
+    self.per_host = per_host
+    self.retries = retries
+    self.backoff = backoff
+    self.timeout = timeout
+
+    self._host_slots = {}
+    self._lock = threading.Lock()
+    self._local = threading.local()
+    self._queue = Queue.Queue()
+    self._closed = False
+
+    self._threads = [ threading.Thread(target = self._run,
+      name = 'DownloadManager-{0}'.format(i)) for i in xrange(threads) ]
+    for thread in self._threads:
+      thread.daemon = True
+      thread.start()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+    return False
+
+  def fetch(self, url, name = None, gunzip = False, validators = None):
+    """Queues the file at *url* for download and returns a
+    :py:class:`Download` object whose ``result()`` method waits for it.
+
+    The file is saved in the work directory as *name*, by default the last
+    component of the URL path with any ``.gz`` suffix removed when *gunzip*
+    is ``True``.
+
+    *validators* may hold the ``validators`` of a :py:class:`Download` of an
+    earlier copy of the file.  The file is then only downloaded if it has
+    changed since, using ``If-None-Match`` and ``If-Modified-Since`` requests
+    over HTTP and the ``MDTM`` command over FTP.
+    """
+    if self._closed:
+      raise RuntimeError('DownloadManager has been closed')
+
+    if name is None:
+      name = posixpath.basename(urlsplit(url).path)
+      if gunzip and name.endswith('.gz'):
+        name = name[:-3]
+
+    download = Download(url, os.path.join(self.work_dir, name), gunzip,
+      validators)
+    self._queue.put(download)
+
+    return download
+
+  def fetch_all(self, urls, gunzip = False):
+    """Downloads every URL in *urls* and returns the paths of the files in
+    the same order.  Raises :py:class:`DownloadError` for the first file
+    that could not be downloaded, once all of them have been tried."""
+    downloads = [ self.fetch(url, gunzip = gunzip) for url in urls ]
+    for download in downloads:
+      download._done.wait()
+
+    return [ download.result() for download in downloads ]
+
+  def list(self, url):
+    """Returns the URLs of the files in an FTP directory that match the shell
+    style pattern in the last component of *url*, e.g.
+    ``ftp://polar.ncep.noaa.gov/pub/waves/latest_run/enp.EKA*``."""
+    parts = urlsplit(url)
+    if parts.scheme != 'ftp':
+      raise ValueError('Only FTP directories can be listed, not {0}'.format(
+        url))
+
+    directory, pattern = posixpath.split(parts.path)
+    base = url[:len(url) - len(pattern)]
+
+    for attempt in xrange(self.retries + 1):
+      try:
+        with self._host_slot(parts.netloc):
+          names = self._ftp_connection(parts).nlst(directory)
+        break
+      except ftplib.error_perm as error:
+        # Some servers answer an empty listing with "550 No files found".
+        if str(error).startswith('550'):
+          names = []
+          break
+        raise DownloadError(url, error)
+      except _TRANSIENT_ERRORS as error:
+        self._drop_connection(parts)
+        if attempt == self.retries:
+          raise DownloadError(url, error)
+        self._wait(attempt)
+
+    names = [ posixpath.basename(name) for name in names ]
+
+    return [ base + name for name in sorted(names)
+      if fnmatch.fnmatchcase(name, pattern) ]
+
+  def close(self):
+    """Stops the download threads and, if the manager created it, removes
+    the work directory along with every file in it."""
+    if self._closed:
+      return
+
+    self._closed = True
+    for thread in self._threads:
+      self._queue.put(None)
+    for thread in self._threads:
+      thread.join()
+    # Connections opened by list() belong to the calling thread.
+    for connection in getattr(self._local, 'connections', {}).values():
+      _close_connection(connection)
+
+    if self._owns_work_dir:
+      shutil.rmtree(self.work_dir, ignore_errors = True)
+
+  #--------------------------------------------------------------------
+  #  Worker Threads
+  #--------------------------------------------------------------------
+  def _run(self):
+    self._local.connections = {}
+    try:
+      while True:
+        download = self._queue.get()
+        if download is None:
+          break
+
+        try:
+          self._download(download)
+        except DownloadError as error:
+          download.error = error
+        except Exception as error:
+          download.error = DownloadError(download.url, error)
+        download._finish()
+    finally:
+      for connection in self._local.connections.values():
+        _close_connection(connection)
+
+  def _download(self, download):
+    url = download.url
+    part_file = download.path + '.part'
+    output_file = download.path + '.gunzip' if download.gunzip else None
+
+    for attempt in xrange(self.retries + 1):
+      sink = _Sink(part_file, output_file)
+      try:
+        with self._host_slot(urlsplit(url).netloc):
+          self._transfer(download, sink)
+        if download.not_modified:
+          sink.close()
+          self._remove(part_file, output_file)
+          return
+        sink.finish()
+        break
+      except _PermanentError as error:
+        sink.close()
+        self._remove(part_file, output_file)
+        raise DownloadError(url, error)
+      except (_RetryableError, ) + _TRANSIENT_ERRORS as error:
+        sink.close()
+        self._drop_connection(urlsplit(url))
+        if attempt == self.retries:
+          raise DownloadError(url, error)
+        self._wait(attempt)
+
+    os.rename(output_file or part_file, download.path)
+    self._remove(part_file)
+
+  def _transfer(self, download, sink):
+    parts = urlsplit(download.url)
+    if parts.scheme in ('http', 'https'):
+      return self._http_transfer(download, sink)
+    if parts.scheme == 'ftp':
+      return self._ftp_transfer(download, parts, sink)
+
+    raise _PermanentError('Unsupported URL scheme: {0}'.format(parts.scheme))
+
+  def _http_transfer(self, download, sink):
+    url = download.url
+    for redirect in xrange(_MAX_REDIRECTS + 1):
+      parts = urlsplit(url)
+      connection = self._http_connection(parts)
+
+      path = parts.path or '/'
+      if parts.query:
+        path += '?' + parts.query
+      headers = { 'Accept-Encoding' : 'identity' }
+      if sink.offset:
+        headers['Range'] = 'bytes={0}-'.format(sink.offset)
+        # Ask for the whole file instead if it changed since the last attempt.
+        if download.validators.get('etag'):
+          headers['If-Range'] = download.validators['etag']
+      else:
+        if download.conditions.get('etag'):
+          headers['If-None-Match'] = download.conditions['etag']
+        if download.conditions.get('last_modified'):
+          headers['If-Modified-Since'] = download.conditions['last_modified']
+
+      connection.request('GET', path, headers = headers)
+      response = connection.getresponse()
+
+      if response.status in _REDIRECT_STATUSES:
+        response.read()
+        url = urljoin(url, response.getheader('location'))
+        continue
+
+      if response.status == 304:
+        response.read()
+        download.not_modified = True
+        download.validators = dict(download.conditions)
+        return
+
+      download.validators = {
+        'etag' : response.getheader('etag'),
+        'last_modified' : response.getheader('last-modified')
+      }
+
+      if response.status == 200 and sink.offset:
+        sink.reset()
+      elif response.status not in (200, 206):
+        response.read()
+        if response.status in _RETRY_STATUSES:
+          raise _RetryableError('HTTP {0} {1}'.format(response.status,
+            response.reason))
+        raise _PermanentError('HTTP {0} {1}'.format(response.status,
+          response.reason))
+
+      expected = response.getheader('content-length')
+      received = 0
+      for data in iter(lambda: response.read(_CHUNK_SIZE), ''):
+        sink.write(data)
+        received += len(data)
+
+      if expected is not None and received < int(expected):
+        raise _RetryableError('connection closed after {0} of {1} bytes'\
+          .format(received, expected))
+      if response.will_close:
+        self._drop_connection(parts)
+
+      return
+
+    raise _PermanentError('too many redirects')
+
+  def _ftp_transfer(self, download, parts, sink):
+    connection = self._ftp_connection(parts)
+
+    # FTP has no conditional requests, the closest thing is comparing the
+    # modification time reported by MDTM.
+    if not sink.offset:
+      try:
+        modified = connection.sendcmd('MDTM ' + parts.path).split()[-1]
+      except ftplib.error_perm:
+        # Not every server implements MDTM.
+        modified = None
+      download.validators = { 'etag' : None, 'last_modified' : modified }
+      if modified is not None and \
+        modified == download.conditions.get('last_modified'):
+        download.not_modified = True
+        return
+
+    try:
+      connection.retrbinary('RETR ' + parts.path, sink.write, _CHUNK_SIZE,
+        rest = sink.offset or None)
+    except ftplib.error_perm as error:
+      raise _PermanentError(error)
+
+  #--------------------------------------------------------------------
+  #  Connections
+  #--------------------------------------------------------------------
+  def _http_connection(self, parts):
+    key = (parts.scheme, parts.netloc)
+    connection = self._local.connections.get(key)
+    if connection is None:
+      if parts.scheme == 'https':
+        connection = httplib.HTTPSConnection(parts.netloc,
+          timeout = self.timeout)
+      else:
+        connection = httplib.HTTPConnection(parts.netloc,
+          timeout = self.timeout)
+      self._local.connections[key] = connection
+
+    return connection
+
+  def _ftp_connection(self, parts):
+    # list() runs on the calling thread, which has no connections of its own
+    # until now.
+    if not hasattr(self._local, 'connections'):
+      self._local.connections = {}
+
+    key = (parts.scheme, parts.netloc)
+    connection = self._local.connections.get(key)
+    if connection is None:
+      connection = ftplib.FTP(timeout = self.timeout)
+      connection.connect(parts.hostname, parts.port or ftplib.FTP_PORT)
+      connection.login(parts.username or 'anonymous', parts.password or '')
+      self._local.connections[key] = connection
+
+    return connection
+
+  def _drop_connection(self, parts):
+    connections = getattr(self._local, 'connections', {})
+    connection = connections.pop((parts.scheme, parts.netloc), None)
+    if connection is not None:
+      _close_connection(connection)
+
+  def _host_slot(self, host):
+    with self._lock:
+      if host not in self._host_slots:
+        self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+
+      return self._host_slots[host]
+
+  #--------------------------------------------------------------------
+  #  Utilities
+  #--------------------------------------------------------------------
+  def _wait(self, attempt):
+    # Jitter keeps threads that failed together from retrying together.
+    time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+  def _remove(self, *paths):
+    for path in paths:
+      if path is not None and os.path.exists(path):
+        os.remove(path)
+
+
+def _close_connection(connection):
+  try:
+    if isinstance(connection, ftplib.FTP):
+      connection.quit()
+    else:
+      connection.close()
+  except Exception:
+    connection.close()
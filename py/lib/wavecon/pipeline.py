@@ -0,0 +1,225 @@
+"""
+Overview
+--------
+
+This module runs work through a chain of stages, such as download, parse and
+load, with every stage working on a different item at the same time::
+
+  pipeline = Pipeline([
+    Stage('download', fetch, workers = 4),
+    Stage('parse', parse, workers = 2),
+    Stage('load', load)
+  ])
+  pipeline.run(steering_times)
+  print pipeline.report()
+
+Each stage runs its function on a pool of threads and hands the result to the
+next stage through a queue holding at most *queue_size* items.  When a stage
+falls behind, the stages before it block instead of piling up results, so the
+number of items held in memory at once is bounded by the queue sizes and
+worker counts no matter how many items go through.
+
+Threads suit stages that wait on the network, the disk or the database.  A
+stage that is bound by Python code can hand its work to a
+``multiprocessing.Pool`` and wait for the result.
+
+If a stage raises an exception, no further items are started, the items
+already queued are dropped and :py:meth:`Pipeline.run` raises the exception.
+"""
+#------------------------------------------------------------------------------
+#  Imports from Python 2.7 standard library
+#------------------------------------------------------------------------------
+import sys
+import time
+import threading
+import Queue
+
+
+#------------------------------------------------------------------------------
+#  Constants
+#------------------------------------------------------------------------------
+# Marks the end of the items handed to a stage.
+_DONE = object()
+
+
+#------------------------------------------------------------------------------
+#  Stages
+#------------------------------------------------------------------------------
+class Stage(object):
+  """One step of a :py:class:`Pipeline`, which calls *function* with each
+  item on *workers* threads.  The value it returns is the item handed to the
+  next stage.
+
+  Once the pipeline has run, these attributes describe where the stage spent
+  its time:
+
+    * *items*
+        Number of items processed.
+
+    * *busy*
+        Seconds spent in *function*, summed over the workers.
+
+    * *waiting*
+        Seconds the workers spent waiting for items from the stage before.
+
+    * *blocked*
+        Seconds the workers spent waiting for the next stage to take their
+        results.  A stage that is often blocked is faster than the ones after
+        it.
+
+    * *elapsed*
+        Seconds from the first worker starting to the last one finishing.
+  """
+  def __init__( self, name, function, workers = 1 ):
+    if workers < 1:
+      raise ValueError( 'Stage {0} needs at least one worker'.format( name ) )
+
+    self.name = name
+    self.function = function
+    self.workers = workers
+    self._reset()
+
+  def __repr__( self ):
+    return '<Stage {0}: {1} workers>'.format( self.name, self.workers )
+
+  def _reset( self ):
+    self.items = 0
+    self.busy = 0.0
+    self.waiting = 0.0
+    self.blocked = 0.0
+    self.elapsed = 0.0
+    self._lock = threading.Lock()
+    self._running = self.workers
+    self._started = None
+
+
+class Pipeline(object):
+  """Runs items through *stages*, a list of :py:class:`Stage` objects or
+  ``(name, function, workers)`` tuples.  At most *queue_size* results wait
+  between any two stages."""
+  def __init__( self, stages, queue_size = 2 ):
+    self.stages = [ stage if isinstance(stage, Stage) else Stage( *stage )
+      for stage in stages ]
+    self.queue_size = queue_size
+    self.elapsed = 0.0
+    self._error = None
+
+  def run( self, items ):
+    """Runs every item of the iterable *items* through the stages and returns
+    the values returned by the last stage, in the order they were finished.
+    *items* is consumed as the first stage takes them, so it may be a
+    generator."""
+    for stage in self.stages:
+      stage._reset()
+    self._error = None
+    self._results = []
+
+    queues = [ Queue.Queue( self.queue_size ) for stage in self.stages ]
+    threads = [ threading.Thread( target = self._feed,
+      args = (items, queues[0], self.stages[0].workers),
+      name = 'Pipeline-feed' ) ]
+
+    for index, stage in enumerate( self.stages ):
+      if index + 1 < len( self.stages ):
+        outbox = queues[index + 1]
+      else:
+        outbox = None
+      threads.extend( threading.Thread( target = self._work,
+        args = (index, queues[index], outbox),
+        name = 'Pipeline-{0}-{1}'.format( stage.name, worker ) )
+        for worker in xrange( stage.workers ) )
+
+    start = time.time()
+    for thread in threads:
+      thread.daemon = True
+      thread.start()
+    for thread in threads:
+      # A timeout keeps the main thread responsive to KeyboardInterrupt.
+      while thread.is_alive():
+        thread.join( 1.0 )
+    self.elapsed = time.time() - start
+
+    if self._error is not None:
+      exc_type, exc_value, traceback = self._error
+      raise exc_type, exc_value, traceback
+
+    return self._results
+
+  def report( self ):
+    """Returns a summary of the time spent in each stage of the last run."""
+    lines = [ '{0:>10}  {1:>6}  {2:>8}  {3:>8}  {4:>8}  {5:>8}'.format(
+      'stage', 'items', 'busy', 'waiting', 'blocked', 'elapsed' ) ]
+    for stage in self.stages:
+      lines.append( '{0:>10}  {1:>6d}  {2:>7.2f}s  {3:>7.2f}s  {4:>7.2f}s  '
+        '{5:>7.2f}s'.format( stage.name, stage.items, stage.busy,
+          stage.waiting, stage.blocked, stage.elapsed ) )
+    lines.append( 'total {0:.2f}s'.format( self.elapsed ) )
+
+    return '\n'.join( lines )
+
+  def _fail( self ):
+    if self._error is None:
+      self._error = sys.exc_info()
+
+  def _feed( self, items, queue, workers ):
+    try:
+      for item in items:
+        if self._error is not None:
+          break
+        queue.put( item )
+    except Exception:
+      self._fail()
+
+    for worker in xrange( workers ):
+      queue.put( _DONE )
+
+  def _work( self, index, inbox, outbox ):
+    stage = self.stages[index]
+    with stage._lock:
+      if stage._started is None:
+        stage._started = time.time()
+
+    while True:
+      started = time.time()
+      item = inbox.get()
+      waited = time.time() - started
+      if item is _DONE:
+        break
+
+      # After a failure the remaining items are only drained, so that no
+      # stage is left blocked on a full queue.
+      if self._error is not None:
+        continue
+
+      started = time.time()
+      try:
+        result = stage.function( item )
+      except Exception:
+        self._fail()
+        continue
+      busy = time.time() - started
+
+      started = time.time()
+      if outbox is None:
+        with stage._lock:
+          self._results.append( result )
+      else:
+        outbox.put( result )
+      blocked = time.time() - started
+
+      with stage._lock:
+        stage.items += 1
+        stage.waiting += waited
+        stage.busy += busy
+        stage.blocked += blocked
+
+    # The last worker of a stage to finish tells the next stage's workers.
+    with stage._lock:
+      stage._running -= 1
+      last = stage._running == 0
+      if last:
+        stage.elapsed = time.time() - stage._started
+
+    if last and outbox is not None:
+      for worker in xrange( self.stages[index + 1].workers ):
+        outbox.put( _DONE )
@@ -0,0 +1,145 @@
+"""
+Overview
+--------
+
+This module projects coordinates between coordinate reference systems named
+by their EPSG codes, such as the WGS84 longitudes and latitudes data is stored
+in and the state plane coordinates a CMS model runs in::
+
+  x, y = projection.project(lons, lats, 26941)
+  lons, lats = projection.unproject(x, y, 'epsg:26941')
+
+Coordinates may be single numbers or numpy arrays of any shape, which are
+transformed in a single call.  No database is needed.
+
+Transformers are built once per pair of codes and kept for the life of the
+process, one set per thread, so repeated calls only pay for the arithmetic.
+"""
+#------------------------------------------------------------------------------
+#  Imports from Python 2.7 standard library
+#------------------------------------------------------------------------------
+import re
+import threading
+
+
+#------------------------------------------------------------------------------
+#  Imports from third party libraries
+#------------------------------------------------------------------------------
+import numpy as np
+import pyproj
+
+
+#------------------------------------------------------------------------------
+#  Constants
+#------------------------------------------------------------------------------
+WGS84 = 4326
+"""EPSG code of the longitudes and latitudes stored in the database."""
+
+_EPSG_PATTERN = re.compile( r'^\s*(?:epsg:)?\s*(\d+)\s*$', re.IGNORECASE )
+
+# Transformers are not safe to share between threads, so each thread keeps
+# its own, keyed by (source, target).
+_LOCAL = threading.local()
+
+
+#------------------------------------------------------------------------------
+#  Transformers
+#------------------------------------------------------------------------------
+def epsg_code( crs ):
+  """Returns the EPSG code of *crs* as an integer.  *crs* may be a number or
+  a string such as ``'26941'`` or ``'epsg:26941'``."""
+  if isinstance( crs, (int, long, np.integer) ):
+    return int( crs )
+
+  match = _EPSG_PATTERN.match( str(crs) )
+  if match is None:
+    raise ValueError( 'Not an EPSG code: {0!r}'.format( crs ) )
+
+  return int( match.group(1) )
+
+
+def transformer( source, target ):
+  """Returns a cached function ``f(x, y)`` that transforms coordinates from
+  the EPSG code *source* to *target*, taking and returning longitude before
+  latitude."""
+  key = (epsg_code( source ), epsg_code( target ))
+  cache = getattr( _LOCAL, 'transformers', None )
+  if cache is None:
+    cache = _LOCAL.transformers = {}
+
+  if key not in cache:
+    cache[key] = _make_transformer( *key )
+
+  return cache[key]
+
+
+def _make_transformer( source, target ):
+  if hasattr( pyproj, 'Transformer' ):
+    return pyproj.Transformer.from_crs( 'epsg:{0}'.format( source ),
+      'epsg:{0}'.format( target ), always_xy = True ).transform
+
+  # pyproj 1.x has no Transformer.  Its Proj objects always take longitude
+  # first.
+  source_proj = pyproj.Proj( init = 'epsg:{0}'.format( source ) )
+  target_proj = pyproj.Proj( init = 'epsg:{0}'.format( target ) )
+  return lambda x, y: pyproj.transform( source_proj, target_proj, x, y )
+
+
+#------------------------------------------------------------------------------
+#  Transforms
+#------------------------------------------------------------------------------
+def transform( x, y, source, target ):
+  """Transforms the coordinates *x* and *y* from the EPSG code *source* to
+  *target*.  Longitudes come before latitudes.  Arrays keep their shape and
+  single numbers come back as floats."""
+  if epsg_code( source ) == epsg_code( target ):
+    return _like( x, np.asarray(x, dtype = float) ), \
+      _like( y, np.asarray(y, dtype = float) )
+
+  xs = np.asarray( x, dtype = float )
+  ys = np.asarray( y, dtype = float )
+  if xs.shape != ys.shape:
+    raise ValueError( 'Coordinates do not match: x {0}, y {1}'.format(
+      xs.shape, ys.shape ) )
+
+  new_x, new_y = transformer( source, target )( xs.ravel(), ys.ravel() )
+  return _like( x, np.asarray(new_x).reshape(xs.shape) ), \
+    _like( y, np.asarray(new_y).reshape(ys.shape) )
+
+
+def _like( value, array ):
+  if np.ndim( value ) == 0:
+    return float( array )
+
+  return array
+
+
+def project( lons, lats, target ):
+  """Projects WGS84 *lons* and *lats* to the EPSG code *target*."""
+  return transform( lons, lats, WGS84, target )
+
+
+def unproject( x, y, source ):
+  """Returns the WGS84 longitudes and latitudes of *x* and *y*, given in the
+  EPSG code *source*."""
+  return transform( x, y, source, WGS84 )
+
+
+def project_corners( west, south, east, north, target ):
+  """Projects the south west and north east corners of a WGS84 box to the
+  EPSG code *target* and returns them as ``(x0, y0, x1, y1)``."""
+  x, y = project( [float(west), float(east)], [float(south), float(north)],
+    target )
+
+  return x[0], y[0], x[1], y[1]
+
+
+def polygon_wkt( x, y ):
+  """Returns the well known text of the polygon through the points *x* and
+  *y*, closed if it is not already."""
+  points = zip( np.ravel(x).tolist(), np.ravel(y).tolist() )
+  if points[0] != points[-1]:
+    points.append( points[0] )
+
+  return 'POLYGON(({0}))'.format( ','.join( '{0!r} {1!r}'.format( *point )
+    for point in points ) )
@@ -0,0 +1,174 @@
+"""
+Overview
+--------
+
+This module interpolates values given at scattered points, such as NAM12
+wind cells projected to model coordinates, onto the regular grid of a model
+run::
+
+  operator = regrid.grid_operator(x, y, gridx, gridy)
+  u_grid, v_grid = operator.apply([u, v])
+
+The weights of the interpolation only depend on where the points and grid
+cells are.  They are worked out once as a sparse matrix holding a row per
+grid cell, and every field given at the same points is then interpolated by
+a single sparse product, however many fields there are.
+
+A cell inside the convex hull of the points is interpolated linearly from the
+corners of the Delaunay triangle that holds it.  A cell outside of it takes
+the value of the nearest point.
+
+Operators are kept in memory for the life of the process and in the shared
+file cache, see :py:mod:`wavecon.cache`, under a hash of the point and grid
+coordinates.  Setting up the same model against the same wind source again
+reuses them.
+"""
+#------------------------------------------------------------------------------
+#  Imports from Python 2.7 standard library
+#------------------------------------------------------------------------------
+import os
+import hashlib
+import tempfile
+import threading
+
+
+#------------------------------------------------------------------------------
+#  Imports from third party libraries
+#------------------------------------------------------------------------------
+import numpy as np
+from scipy import sparse
+from scipy.spatial import Delaunay, cKDTree
+
+
+#------------------------------------------------------------------------------
+#  Imports from other wavecon modules
+#------------------------------------------------------------------------------
+from .cache import shared_cache
+
+
+#------------------------------------------------------------------------------
+#  Constants
+#------------------------------------------------------------------------------
+# Part of every cache key, so that operators built by a different method are
+# never mistaken for these.
+_METHOD = 'linear-nearest-1'
+
+_OPERATORS = {}
+_OPERATORS_LOCK = threading.Lock()
+
+
+#------------------------------------------------------------------------------
+#  Operators
+#------------------------------------------------------------------------------
+class GridOperator(object):
+  """Interpolates fields given at a fixed set of points onto a grid of shape
+  *shape*.  *matrix* is a sparse matrix with one row per grid cell, in C
+  order, and one column per point."""
+  def __init__( self, matrix, shape ):
+    self.matrix = sparse.csr_matrix( matrix )
+    self.shape = tuple( shape )
+
+  def __repr__( self ):
+    return '<GridOperator: {0} points onto {1}>'.format( self.matrix.shape[1],
+      'x'.join( str(n) for n in self.shape ) )
+
+  def apply( self, values ):
+    """Returns *values*, an array whose last axis runs over the points,
+    interpolated onto the grid.  The last axis is replaced by the two axes of
+    the grid, so a ``(field, time, point)`` array comes back as ``(field,
+    time, y, x)``."""
+    values = np.asarray( values, dtype = float )
+    npoints = self.matrix.shape[1]
+    if values.shape[-1:] != (npoints,):
+      raise ValueError( 'Expected values at {0} points, got shape {1}'.format(
+        npoints, values.shape ) )
+
+    fields = values.reshape( -1, npoints )
+    grids = self.matrix.dot( fields.T ).T
+
+    return grids.reshape( values.shape[:-1] + self.shape )
+
+
+def interpolation_matrix( x, y, gridx, gridy ):
+  """Returns the sparse matrix interpolating values at the points *x*, *y*
+  onto the grid cells *gridx*, *gridy*, see :py:class:`GridOperator`."""
+  points = np.column_stack(( np.ravel(x), np.ravel(y) )).astype( float )
+  cells = np.column_stack(( np.ravel(gridx), np.ravel(gridy) )).astype( float )
+  ncells = len( cells )
+
+  # Barycentric coordinates of each cell in the triangle holding it.
+  triangulation = Delaunay( points )
+  simplex = triangulation.find_simplex( cells )
+  inside = simplex >= 0
+  transform = triangulation.transform[simplex[inside]]
+  offset = cells[inside] - transform[:, 2]
+  weights = np.einsum( 'ijk,ik->ij', transform[:, :2], offset )
+  weights = np.column_stack(( weights, 1 - weights.sum(axis = 1) ))
+
+  rows = [ np.repeat( np.flatnonzero(inside), 3 ) ]
+  columns = [ triangulation.simplices[simplex[inside]].ravel() ]
+  data = [ weights.ravel() ]
+
+  # Cells outside of the hull take their nearest point.
+  outside = np.flatnonzero( ~inside )
+  if len( outside ):
+    distance, nearest = cKDTree( points ).query( cells[outside] )
+    rows.append( outside )
+    columns.append( nearest )
+    data.append( np.ones(len( outside )) )
+
+  return sparse.csr_matrix( (np.concatenate(data), (np.concatenate(rows),
+    np.concatenate(columns))), shape = (ncells, len(points)) )
+
+
+def geometry_key( x, y, gridx, gridy ):
+  """Returns the cache key of the operator from the points *x*, *y* onto the
+  grid *gridx*, *gridy*."""
+  digest = hashlib.sha1( _METHOD )
+  for coordinates in (x, y, gridx, gridy):
+    coordinates = np.ascontiguousarray( coordinates, dtype = np.float64 )
+    digest.update( str(coordinates.shape) )
+    digest.update( coordinates.data )
+
+  return 'regrid://operators/{0}'.format( digest.hexdigest() )
+
+
+def grid_operator( x, y, gridx, gridy, cache = None ):
+  """Returns the :py:class:`GridOperator` from the points *x*, *y* onto the
+  grid *gridx*, *gridy*, which are arrays of the same shape such as those
+  returned by ``numpy.meshgrid``.
+
+  The operator is looked up in memory, then in *cache*, by default the
+  :py:func:`wavecon.cache.shared_cache`, and only built if neither holds
+  it."""
+  key = geometry_key( x, y, gridx, gridy )
+  operator = _OPERATORS.get( key )
+  if operator is not None:
+    return operator
+
+  with _OPERATORS_LOCK:
+    if key in _OPERATORS:
+      return _OPERATORS[key]
+
+    if cache is None:
+      cache = shared_cache()
+
+    cached_file = cache.lookup( key )
+    if cached_file is None:
+      matrix = interpolation_matrix( x, y, gridx, gridy )
+      handle, operator_file = tempfile.mkstemp( suffix = '.npz' )
+      os.close( handle )
+      np.savez( operator_file, data = matrix.data, indices = matrix.indices,
+        indptr = matrix.indptr, shape = matrix.shape )
+      cache.store( key, operator_file )
+    else:
+      saved = np.load( cached_file )
+      try:
+        matrix = sparse.csr_matrix( (saved['data'], saved['indices'],
+          saved['indptr']), shape = tuple(saved['shape']) )
+      finally:
+        saved.close()
+
+    _OPERATORS[key] = GridOperator( matrix, np.shape(gridx) )
+
+  return _OPERATORS[key]
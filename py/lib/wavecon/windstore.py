@@ -0,0 +1,409 @@
+"""
+Overview
+--------
+
+This module stores gridded wind forcing, such as NAM12, as one compressed
+HDF5 file per wind source and forecast cycle instead of one ``tblWind`` row
+per grid cell and time::
+
+  path = windstore.write_cube(srcid, times, lats, lons, speed, direction)
+
+  cube = windstore.read_wind(steeringtimes, west, south, east, north, 'NAM12')
+  cube['speed'].shape   # (time, y, x)
+
+Every stored cube is listed in ``tblWindCube`` along with the times and area
+it covers, so :py:func:`read_wind` can find the newest cube that holds the
+steering times of a model run.
+
+File Layout
+-----------
+
+::
+
+  windstore/
+    <srcid>.h5
+      time          seconds since 1970-01-01, one per time step
+      lat, lon      (y, x) location of every grid cell in degrees
+      speed         (time, y, x) wind speed in m/s
+      direction     (time, y, x) direction the wind blows toward in degrees,
+                    counterclockwise from east as in tblWind
+
+``speed`` and ``direction`` are stored as 32-bit floats in chunks of one time
+step by a square block of cells, compressed with gzip.  Reading the cells
+around a model box at the steering times therefore only decompresses the
+chunks that overlap them.
+
+The files can be written and read where no database is configured.  Only
+:py:func:`write_cube` and :py:func:`read_wind`, which use the catalog, need
+one.
+"""
+#------------------------------------------------------------------------------
+#  Imports from Python 2.7 standard library
+#------------------------------------------------------------------------------
+import os
+import tempfile
+import threading
+from os import path
+from datetime import datetime, timedelta
+
+
+#------------------------------------------------------------------------------
+#  Imports from third party libraries
+#------------------------------------------------------------------------------
+import numpy as np
+import h5py
+
+
+#------------------------------------------------------------------------------
+#  Constants
+#------------------------------------------------------------------------------
+_scriptLocation = path.dirname(path.abspath( __file__ ))
+STORE_DIR = path.abspath(path.join( _scriptLocation, '..', '..', '..',
+  'windstore' ))
+"""``STORE_DIR`` holds the path to the top-level ``windstore`` directory in
+which cubes are written by default."""
+
+# Cells along each side of a chunk.
+CHUNK_CELLS = 64
+
+_EPOCH = datetime(1970, 1, 1)
+
+_REGISTER_CUBE = '''
+  INSERT INTO tblwindcube (wcbsourceid, wcbpath, wcbfirsttime, wcblasttime,
+    wcbextent)
+  VALUES (%s, %s, %s, %s, ST_MakeEnvelope(%s, %s, %s, %s, 4326))
+  ON CONFLICT (wcbsourceid) DO UPDATE SET
+    wcbpath = EXCLUDED.wcbpath,
+    wcbfirsttime = EXCLUDED.wcbfirsttime,
+    wcblasttime = EXCLUDED.wcblasttime,
+    wcbextent = EXCLUDED.wcbextent
+  '''
+
+_FIND_CUBES = '''
+  SELECT c.wcbpath FROM tblwindcube c
+    JOIN tblsource s ON s.srcid = c.wcbsourceid
+    JOIN tblsourcetype t ON t.sourcetypeid = s.srcsourcetypeid
+  WHERE c.wcbfirsttime <= %(first)s AND c.wcblasttime >= %(last)s
+    AND ST_Covers(c.wcbextent, ST_MakeEnvelope(%(west)s, %(south)s,
+      %(east)s, %(north)s, 4326))
+    AND (%(source_type)s IS NULL OR t.sourcetypename = %(source_type)s)
+  ORDER BY s.srcbeginexecution DESC, c.wcblasttime DESC
+  '''
+
+
+#------------------------------------------------------------------------------
+#  Cube Files
+#------------------------------------------------------------------------------
+def save_cube( file_name, times, lats, lons, speed, direction ):
+  """Writes a wind cube to the HDF5 file *file_name*.  *times* is a sequence
+  of ``datetime``, *lats* and *lons* are (y, x) arrays and *speed* and
+  *direction* are (time, y, x) arrays.
+
+  The file is written under a temporary name and moved into place, so
+  readers never see a partial cube."""
+  speed = np.asarray( speed, dtype = np.float32 )
+  direction = np.asarray( direction, dtype = np.float32 )
+  ntimes, ny, nx = speed.shape
+  if direction.shape != speed.shape or np.shape( lats ) != (ny, nx) or \
+    np.shape( lons ) != (ny, nx) or len( times ) != ntimes:
+    raise ValueError( 'Wind cube arrays do not match: {0} times, lat {1}, '
+      'lon {2}, speed {3}, direction {4}'.format( len(times), np.shape(lats),
+        np.shape(lons), speed.shape, direction.shape ) )
+
+  with CubeWriter( file_name, times ) as writer:
+    for step, value in enumerate( times ):
+      writer.put( value, lats, lons, speed[step], direction[step] )
+
+  return file_name
+
+
+class CubeWriter(object):
+  """Writes a wind cube one time step at a time, so that a long run never
+  has to be held in memory::
+
+    with CubeWriter(file_name, times) as writer:
+      for time in times:
+        writer.put(time, lats, lons, speed, direction)
+
+  *times* lists every time step the cube will hold.  Steps may be written in
+  any order and from several threads.  The file is written under a
+  temporary name and only moved into place by :py:meth:`close` once every
+  step has been written.  *on_close*, if given, is then called with the
+  writer, and if it raises the file is removed again.
+  """
+  def __init__( self, file_name, times, on_close = None ):
+    self.file_name = file_name
+    self.times = list( times )
+    self.lats = None
+    self.lons = None
+    self._index = dict( (t, i) for i, t in enumerate(self.times) )
+    self._written = set()
+    self._on_close = on_close
+    self._lock = threading.Lock()
+
+    handle, self._temp_name = tempfile.mkstemp( suffix = '.h5',
+      dir = path.dirname(path.abspath( file_name )) )
+    os.close( handle )
+
+    self._file = h5py.File( self._temp_name, 'w' )
+    self._file.create_dataset( 'time', data = np.array([ _seconds(t)
+      for t in self.times ], dtype = np.int64) )
+    self._file['time'].attrs['units'] = 'seconds since 1970-01-01 00:00:00'
+
+  def __enter__( self ):
+    return self
+
+  def __exit__( self, exc_type, exc_value, traceback ):
+    if exc_type is None:
+      self.close()
+    else:
+      self.abort()
+
+    return False
+
+  def put( self, time, lats, lons, speed, direction ):
+    """Writes the (y, x) arrays *speed* and *direction* of the step *time*.
+    Every step must have the same *lats* and *lons*."""
+    step = self._index[time]
+    with self._lock:
+      if self.lats is None:
+        self._create( np.asarray(lats, np.float64),
+          np.asarray(lons, np.float64) )
+      elif np.shape( speed ) != self.lats.shape or \
+        np.shape( direction ) != self.lats.shape:
+        raise ValueError( 'Wind at {0} has shape {1}, the cube holds {2}'\
+          .format( time, np.shape(speed), self.lats.shape ) )
+
+      self._file['speed'][step] = speed
+      self._file['direction'][step] = direction
+      self._written.add( step )
+
+  def extent( self ):
+    """Returns the ``(west, south, east, north)`` box of the cells in
+    degrees."""
+    return (float(self.lons.min()), float(self.lats.min()),
+      float(self.lons.max()), float(self.lats.max()))
+
+  def close( self ):
+    """Moves the finished cube into place.  Raises ``ValueError`` if any of
+    the steps has not been written, in which case nothing is kept."""
+    missing = len( self.times ) - len( self._written )
+    if missing:
+      self.abort()
+      raise ValueError( '{0} of the {1} steps of {2} were not written'\
+        .format( missing, len(self.times), self.file_name ) )
+
+    self._file.close()
+    os.rename( self._temp_name, self.file_name )
+    if self._on_close is not None:
+      try:
+        self._on_close( self )
+      except:
+        # A cube that was never listed would never be read or cleaned up.
+        os.unlink( self.file_name )
+        raise
+
+    return self.file_name
+
+  def abort( self ):
+    """Discards the cube."""
+    if self._file:
+      self._file.close()
+    if path.exists( self._temp_name ):
+      os.unlink( self._temp_name )
+
+  def _create( self, lats, lons ):
+    ny, nx = lats.shape
+    chunks = (1, min(ny, CHUNK_CELLS), min(nx, CHUNK_CELLS))
+    for name, data in (('lat', lats), ('lon', lons)):
+      self._file.create_dataset( name, data = data, chunks = chunks[1:],
+        compression = 'gzip', shuffle = True )
+    for name in ('speed', 'direction'):
+      self._file.create_dataset( name, (len(self.times), ny, nx),
+        dtype = np.float32, chunks = chunks, compression = 'gzip',
+        shuffle = True )
+    self.lats = lats
+    self.lons = lons
+
+
+class WindCube(object):
+  """A wind cube written by :py:func:`save_cube`, opened for reading.  Only
+  the times and cell locations are read when the cube is opened, wind is
+  read on demand by :py:meth:`read`.
+
+  Attributes:
+
+    * *times*
+        ``datetime`` of each time step.
+
+    * *lats*, *lons*
+        (y, x) arrays holding the location of every cell in degrees.
+  """
+  def __init__( self, file_name ):
+    self.file_name = file_name
+    self._file = h5py.File( file_name, 'r' )
+    self.times = [ _EPOCH + timedelta(seconds = int(seconds))
+      for seconds in self._file['time'][:] ]
+    self.lats = self._file['lat'][:]
+    self.lons = self._file['lon'][:]
+    self._index = dict( (t, i) for i, t in enumerate(self.times) )
+
+  def __enter__( self ):
+    return self
+
+  def __exit__( self, exc_type, exc_value, traceback ):
+    self.close()
+    return False
+
+  def __repr__( self ):
+    return '<WindCube {0}: {1} times, {2} x {3} cells>'.format(
+      self.file_name, len(self.times), self.lats.shape[0],
+      self.lats.shape[1] )
+
+  def close( self ):
+    self._file.close()
+
+  def window( self, west, south, east, north, pad = 2 ):
+    """Returns the ``(rows, columns)`` slices of the smallest block of cells
+    holding every cell inside the box, widened by *pad* cells on each side so
+    that interpolation near the edges of the box has neighbours.  Returns
+    ``None`` if no cell lies inside the box."""
+    inside = (self.lats >= south) & (self.lats <= north) & \
+      (self.lons >= west) & (self.lons <= east)
+    rows = np.flatnonzero( inside.any(axis = 1) )
+    columns = np.flatnonzero( inside.any(axis = 0) )
+    if not rows.size:
+      return None
+
+    ny, nx = self.lats.shape
+    return (slice( max(rows[0] - pad, 0), min(rows[-1] + pad + 1, ny) ),
+      slice( max(columns[0] - pad, 0), min(columns[-1] + pad + 1, nx) ))
+
+  def read( self, times = None, box = None ):
+    """Returns the wind at *times*, or at every time if ``None``, as a
+    dictionary holding ``'time'``, ``'lat'``, ``'lon'``, ``'speed'`` and
+    ``'dir'``.  Wind is returned as (time, y, x) arrays.
+
+    *box* may be a ``(west, south, east, north)`` tuple in degrees, in which
+    case only the cells around it are read, see :py:meth:`window`.  Raises
+    ``KeyError`` if the cube does not hold one of *times*."""
+    if times is None:
+      times = self.times
+    steps = [ self._index[t] for t in times ]
+
+    rows, columns = slice(None), slice(None)
+    if box is not None:
+      window = self.window( *box )
+      if window is None:
+        raise ValueError( 'No cells of {0} lie inside {1}'.format(
+          self.file_name, box ) )
+      rows, columns = window
+
+    # h5py only reads the chunks the selection touches.  Fancy indexing
+    # needs the steps in increasing order and each of them once, so a time
+    # asked for twice is read once and repeated afterwards.
+    unique, restore = np.unique( steps, return_inverse = True )
+    selection = (unique.tolist(), rows, columns)
+    speed = self._file['speed'][selection]
+    direction = self._file['direction'][selection]
+
+    return {
+      'time' : list(times),
+      'lat' : self.lats[rows, columns],
+      'lon' : self.lons[rows, columns],
+      'speed' : speed[restore],
+      'dir' : direction[restore]
+    }
+
+
+def _seconds( value ):
+  delta = value - _EPOCH
+
+  return delta.days * 86400 + delta.seconds
+
+
+#------------------------------------------------------------------------------
+#  Catalog
+#------------------------------------------------------------------------------
+# DBman is imported by these functions only, so cube files can be handled on
+# machines that have no database configured.
+def open_cube( srcid, times, store_dir = None ):
+  """Returns a :py:class:`CubeWriter` for a cube of the source *srcid* in
+  *store_dir*, by default :py:data:`STORE_DIR`.  The cube is listed in
+  ``tblWindCube`` once the writer is closed."""
+  if store_dir is None:
+    store_dir = STORE_DIR
+  if not path.isdir( store_dir ):
+    os.makedirs( store_dir )
+
+  return CubeWriter( path.join(store_dir, '{0}.h5'.format( srcid )), times,
+    lambda writer: _register_cube( srcid, writer ) )
+
+
+def write_cube( srcid, times, lats, lons, speed, direction, store_dir = None ):
+  """Saves a wind cube for the source *srcid* in *store_dir*, by default
+  :py:data:`STORE_DIR`, and lists it in ``tblWindCube``.  Arguments are as
+  for :py:func:`save_cube`.  Returns the path of the cube file."""
+  with open_cube( srcid, times, store_dir ) as writer:
+    for step, value in enumerate( times ):
+      writer.put( value, lats, lons, speed[step], direction[step] )
+
+  return writer.file_name
+
+
+def _register_cube( srcid, writer ):
+  from wavecon import DBman
+
+  connection = DBman.RawPostgresConnection()
+  cursor = connection.cursor()
+
+  try:
+    cursor.execute( _REGISTER_CUBE, (srcid, path.abspath(writer.file_name),
+      min(writer.times), max(writer.times)) + writer.extent() )
+    connection.commit()
+  except:
+    connection.rollback()
+    raise
+  finally:
+    cursor.close()
+    connection.close()
+
+
+def find_cubes( first, last, west, south, east, north, source_type = None ):
+  """Returns the paths of the cubes in ``tblWindCube`` that cover the times
+  *first* to *last* and the box, newest run first.  *source_type* may name
+  the source type of the runs, e.g. ``'NAM12'``."""
+  from wavecon import DBman
+
+  connection = DBman.RawPostgresConnection()
+  cursor = connection.cursor()
+
+  try:
+    cursor.execute( _FIND_CUBES, { 'first' : first, 'last' : last,
+      'west' : west, 'south' : south, 'east' : east, 'north' : north,
+      'source_type' : source_type } )
+    paths = [ row[0] for row in cursor.fetchall() ]
+    connection.commit()
+  finally:
+    cursor.close()
+    connection.close()
+
+  return paths
+
+
+def read_wind( times, west, south, east, north, source_type = None ):
+  """Reads the wind at *times* around the box from the newest cube that
+  holds all of them, see :py:meth:`WindCube.read`.  Returns ``None`` if no
+  stored cube does."""
+  for file_name in find_cubes( min(times), max(times), west, south, east,
+    north, source_type ):
+    if not path.exists( file_name ):
+      continue
+
+    with WindCube( file_name ) as cube:
+      try:
+        return cube.read( times, (west, south, east, north) )
+      except (KeyError, ValueError):
+        continue
+
+  return None
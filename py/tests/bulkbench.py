@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+Compares the speed of the ways DBman.bulk_import() can load CMS postprocessing
+output.  Synthetic wave records shaped like CMS output are loaded into a
+scratch copy of tblwave using:
+
+  * *tempfile*: the original implementation, which dumped records to a
+    temporary CSV file before copying them into a staging table.
+  * *staging*: records streamed straight to COPY via a staging table.
+  * *direct*: records streamed straight to COPY into the target table.
+  * *binary*: records encoded in the binary COPY format, no staging table.
+
+Usage::
+
+  bulkbench.py [number of records]
+"""
+
+# Make sure the WaveConnect py/lib folder is on the search path so
+# modules can be retrieved.
+import sys
+from os import path
+scriptLocation = path.dirname(path.abspath( __file__ ))
+waveLibs = path.abspath(path.join( scriptLocation, '..', 'lib' ))
+sys.path.insert( 0, waveLibs )
+
+import csv
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from numpy import random
+
+from wavecon import DBman
+from wavecon.CMS.DB import WaveDBrecordGenerator
+
+BENCH_TABLE = 'bench_tblwave'
+
+# Roughly the size of the spectra written by a CMS run.
+NFREQS = 30
+NDIRS = 35
+
+
+def wave_records(count):
+  start = datetime(2011, 1, 1)
+  records = (
+    {
+      'timestamp': start + timedelta(hours = i % 240),
+      'spectra': random.random((NFREQS, NDIRS)),
+      'height': 1.0,
+      'direction': 270.0,
+      'period': 12.0,
+      'location': (-124.2 + (i // 240) * 1e-3, 40.8)
+    }
+    for i in xrange(count)
+  )
+
+  # The scratch table has no foreign keys, so any source/bin ids will do.
+  return WaveDBrecordGenerator(records, 'bench', 'bench')
+
+
+def as_text(records):
+  # The text COPY format needs spectra and locations formatted as strings.
+  for record in records:
+    record['wavspectra'] = '{' + ','.join(( '{' + ','.join(map(str, row)) + '}'
+      for row in record['wavspectra'] )) + '}'
+    record['wavlocation'] = 'SRID=4326;POINT({0} {1})'.format(
+      *record['wavlocation'])
+    yield record
+
+
+def tempfile_import(records, table_name):
+  # The bulk_import() implementation prior to streaming COPY.
+  table = DBman.accessTable(None, 'tblwave', table_name)
+  table_columns = table.__table__._columns.keys()
+
+  fd, temp_file = tempfile.mkstemp()
+  csv_file = os.fdopen(fd, 'wb')
+  csv_writer = csv.DictWriter(csv_file, fieldnames = table_columns,
+    delimiter='|')
+  for record in as_text(records):
+    csv_writer.writerow(record)
+  csv_file.close()
+
+  connection = DBman.RawPostgresConnection()
+  cursor = connection.cursor()
+  cursor.execute('CREATE TEMP TABLE bench_temp ( LIKE {0} )'.format(table_name))
+  with open(temp_file, 'r') as csv_file:
+    cursor.copy_from(csv_file, 'bench_temp', sep = '|', null = '')
+  cursor.execute('''
+    INSERT INTO {0} SELECT * FROM bench_temp;
+    DROP TABLE bench_temp;
+    '''.format(table_name))
+  connection.commit()
+  cursor.close()
+  connection.close()
+  os.unlink(temp_file)
+
+
+def run(method, count):
+  start = time.time()
+  method(wave_records(count))
+  return time.time() - start
+
+
+if __name__ == '__main__':
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+  with DBman.session() as session:
+    session.execute('CREATE TABLE {0} ( LIKE tblwave INCLUDING DEFAULTS )'\
+      .format(BENCH_TABLE))
+
+  try:
+    methods = [
+      ('tempfile', lambda records: tempfile_import(records, BENCH_TABLE)),
+      ('staging', lambda records: DBman.bulk_import(as_text(records),
+        'tblwave', BENCH_TABLE)),
+      ('direct', lambda records: DBman.bulk_import(as_text(records),
+        'tblwave', BENCH_TABLE, staging = False)),
+      ('binary', lambda records: DBman.bulk_import(records, 'tblwave',
+        BENCH_TABLE, staging = False, binary = True))
+    ]
+
+    for name, method in methods:
+      elapsed = run(method, count)
+      print '{0:>8}: {1:.2f}s  ({2:.0f} records/s)'.format(name, elapsed,
+        count / elapsed)
+
+      with DBman.session() as session:
+        session.execute('TRUNCATE {0}'.format(BENCH_TABLE))
+
+  finally:
+    with DBman.session() as session:
+      session.execute('DROP TABLE {0}'.format(BENCH_TABLE))
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""
+Checks wavecon.cache.DataCache against the HTTP and FTP servers from
+downloadtest.py, using a throwaway cache directory.  Usage::
+
+  cachetest.py
+"""
+
+# Make sure the WaveConnect py/lib folder is on the search path so
+# modules can be retrieved.
+import sys
+from os import path
+scriptLocation = path.dirname(path.abspath( __file__ ))
+waveLibs = path.abspath(path.join( scriptLocation, '..', 'lib' ))
+sys.path.insert( 0, waveLibs )
+
+import os
+import shutil
+import tempfile
+import threading
+
+from wavecon.cache import DataCache, normalize_url
+from wavecon.download import DownloadManager, DownloadError
+
+from downloadtest import (serve, HTTPServer, HTTPHandler, FTPServer,
+  FTPHandler, FILES, SPECTRA, requests, read)
+
+
+CACHE_DIRS = []
+
+def fresh_cache(**kwargs):
+  CACHE_DIRS.append(tempfile.mkdtemp(prefix = 'wavecon-cachetest-'))
+  return DataCache(CACHE_DIRS[-1], **kwargs)
+
+
+def check_normalize():
+  assert normalize_url('HTTP://Example.COM:80/a?b=2&a=1#top') == \
+    'http://example.com/a?a=1&b=2'
+  assert normalize_url('http://example.com:8080') == 'http://example.com:8080/'
+  assert normalize_url('ftp://host:21/x?dir=a/b&var=v&var=u') == \
+    'ftp://host/x?dir=a/b&var=u&var=v'
+
+
+def check_hits(downloads, http, ftp):
+  cache = fresh_cache(policies = [('*', None)])
+  urls = ['http://{0}/data/enp.EKA01.spec.gz'.format(http),
+    'ftp://{0}/pub/waves/latest_run/enp.EKA02.spec.gz'.format(ftp)]
+
+  files = cache.fetch_all(urls, gunzip = True, downloads = downloads)
+  assert read(files[0]) == SPECTRA['enp.EKA01.spec']
+  assert read(files[1]) == SPECTRA['enp.EKA02.spec']
+
+  before = dict(requests)
+  assert cache.fetch_all(urls, gunzip = True, downloads = downloads) == files
+  assert requests == before
+
+  # The compressed file is a separate entry.
+  assert read(cache.fetch(urls[1], downloads = downloads)) == \
+    FILES['enp.EKA02.spec.gz']
+
+  stats = cache.stats()
+  assert (stats['misses'], stats['hits'], stats['entries']) == (3, 2, 3)
+
+  # Cached files are handed out before the downloads finish.
+  more = ['http://{0}/data/enp.EKA08.spec.gz'.format(http)] + urls
+  order = [ i for i, cached_file in cache.iter_fetch(more, gunzip = True,
+    downloads = downloads) ]
+  assert order == [1, 2, 0]
+
+
+def check_revalidation(downloads, http, ftp):
+  cache = fresh_cache(policies = [('*', 0)])
+  urls = ['http://{0}/data/nam12.nc'.format(http),
+    'ftp://{0}/pub/waves/latest_run/enp.EKA04.spec.gz'.format(ftp)]
+
+  files = cache.fetch_all(urls, downloads = downloads)
+  assert cache.fetch_all(urls, downloads = downloads) == files
+  assert cache.stats()['revalidated'] == 2
+
+  # A file that changed upstream is downloaded again.
+  original = FILES['nam12.nc']
+  FILES['nam12.nc'] = original[::-1]
+  try:
+    changed = cache.fetch(urls[0], downloads = downloads)
+    assert read(changed) == FILES['nam12.nc']
+    assert changed != files[0]
+  finally:
+    FILES['nam12.nc'] = original
+  assert cache.stats()['misses'] == 3
+
+
+def check_shared_content(downloads, http):
+  # Two URLs serving the same bytes share one stored file.
+  cache = fresh_cache()
+  files = cache.fetch_all(['http://{0}/data/nam12.nc'.format(http),
+    'http://{0}/other/nam12.nc?copy=1'.format(http)], downloads = downloads)
+  assert files[0] == files[1]
+  assert cache.stats()['bytes'] == len(FILES['nam12.nc'])
+
+
+def check_eviction(downloads, http):
+  names = sorted(name for name in FILES if name.startswith('enp.EKA'))[:4]
+  size = max(len(FILES[name]) for name in names)
+  cache = fresh_cache(max_bytes = 2 * size)
+
+  files = [ cache.fetch('http://{0}/{1}'.format(http, name),
+    downloads = downloads) for name in names ]
+  stats = cache.stats()
+  assert stats['entries'] == 2 and stats['evictions'] == 2
+  assert stats['bytes'] <= 2 * size
+  # The least recently used files went first.
+  assert [ path.exists(name) for name in files ] == [False, False, True, True]
+
+
+def check_forget(downloads, http):
+  cache = fresh_cache(policies = [('*', None)])
+  url = 'http://{0}/data/nam12.nc'.format(http)
+  cache.fetch(url, downloads = downloads)
+  cache.forget(url)
+  cache.fetch(url, downloads = downloads)
+  assert cache.stats()['misses'] == 2
+
+  try:
+    cache.fetch('http://{0}/missing'.format(http), downloads = downloads)
+  except DownloadError:
+    pass
+  else:
+    raise AssertionError('missing file should not be cached')
+  assert cache.stats()['entries'] == 1
+
+
+def check_shared_downloads(downloads, http):
+  # The same file asked for twice in one call, or by several threads at
+  # once, is downloaded once and handed to all of them.
+  cache = fresh_cache(policies = [('*', None)])
+  url = 'http://{0}/data/enp.EKA10.spec.gz?var=u'.format(http)
+  files = cache.fetch_all([url, url.replace('?var=u', '?var=u#top')],
+    gunzip = True, downloads = downloads)
+  assert files[0] == files[1]
+  assert read(files[0]) == SPECTRA['enp.EKA10.spec']
+  assert requests['enp.EKA10.spec.gz'] == 1
+
+  url = 'http://{0}/data/enp.EKA11.spec.gz'.format(http)
+  fetched = []
+  def fetch():
+    fetched.append(cache.fetch(url, True, downloads))
+  threads = [ threading.Thread(target = fetch) for i in xrange(4) ]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  assert len(set(fetched)) == 1 and len(fetched) == 4
+  assert read(fetched[0]) == SPECTRA['enp.EKA11.spec']
+  assert requests['enp.EKA11.spec.gz'] == 1
+
+
+def check_store():
+  cache = fresh_cache()
+  key = 'http://example.com/dataset?north=42&south=38'
+  assert cache.lookup(key) is None
+
+  handle, subset = tempfile.mkstemp()
+  os.write(handle, 'subset')
+  os.close(handle)
+  stored = cache.store(key, subset)
+
+  assert not path.exists(subset)
+  assert cache.lookup(key) == stored
+  assert read(stored) == 'subset'
+  assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+if __name__ == '__main__':
+  http_server, http = serve(HTTPServer, HTTPHandler)
+  ftp_server, ftp = serve(FTPServer, FTPHandler)
+
+  checks = [
+    ('url normalization', check_normalize, ()),
+    ('cache hits', check_hits, (http, ftp)),
+    ('revalidation', check_revalidation, (http, ftp)),
+    ('shared content', check_shared_content, (http,)),
+    ('lru eviction', check_eviction, (http,)),
+    ('forget', check_forget, (http,)),
+    ('shared downloads', check_shared_downloads, (http,)),
+    ('store and lookup', check_store, ()),
+  ]
+
+  with DownloadManager(threads = 4, backoff = 0.01, timeout = 5) as downloads:
+    for name, check, args in checks:
+      if args:
+        check(downloads, *args)
+      else:
+        check()
+      print '  ok {0}'.format(name)
+
+  http_server.shutdown()
+  ftp_server.shutdown()
+  for cache_dir in CACHE_DIRS:
+    shutil.rmtree(cache_dir)
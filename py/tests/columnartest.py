@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Checks how DBman.fetch_arrays() turns the values psycopg2 returns for a
+column into a numpy array, NULLs included.  No database is used, only a
+configuration to import DBman with.  Usage::
+
+  columnartest.py
+"""
+
+# Make sure the WaveConnect py/lib folder is on the search path so
+# modules can be retrieved.
+import sys
+from os import path
+scriptLocation = path.dirname(path.abspath( __file__ ))
+waveLibs = path.abspath(path.join( scriptLocation, '..', 'lib' ))
+sys.path.insert( 0, waveLibs )
+
+from datetime import datetime
+
+import numpy as np
+
+from wavecon.DBman import _column_array
+
+# Postgres type OIDs, as reported in cursor.description.
+BOOLEAN, BIGINT, INTEGER, DOUBLE, TIMESTAMP, TEXT, FLOAT_ARRAY = \
+  16, 20, 23, 701, 1114, 25, 1022
+
+
+def check_typed():
+  column = _column_array((3, 1, 2), INTEGER)
+  assert column.dtype == np.int32 and column.tolist() == [3, 1, 2]
+  assert _column_array((1.5, 2.5), DOUBLE).dtype == np.float64
+  assert _column_array((datetime(2010, 12, 22),), TIMESTAMP).dtype == \
+    np.dtype('datetime64[us]')
+  assert _column_array(('a', 'b'), TEXT).dtype == object
+
+
+def check_nulls():
+  # Integers holding NULL come back as floats with NaN.
+  for type_code in (INTEGER, BIGINT):
+    column = _column_array((3, None, 2), type_code)
+    assert column.dtype == np.float64
+    assert column[0] == 3 and np.isnan(column[1]) and column[2] == 2
+
+  column = _column_array((True, None, False), BOOLEAN)
+  assert column.dtype == object and column.tolist() == [True, None, False]
+
+  assert np.isnan(_column_array((1.5, None), DOUBLE)[1])
+  assert np.isnat(_column_array((datetime(2010, 12, 22), None),
+    TIMESTAMP)[1])
+  assert _column_array(('a', None), TEXT).tolist() == ['a', None]
+
+
+def check_spectra():
+  # Spectra of a common shape are stacked, others kept one by one.
+  spectra = (np.zeros((3, 4)), np.ones((3, 4)))
+  assert _column_array(spectra, FLOAT_ARRAY).shape == (2, 3, 4)
+
+  ragged = _column_array((np.zeros((3, 4)), np.ones((2, 4))), FLOAT_ARRAY)
+  assert ragged.dtype == object and ragged[1].shape == (2, 4)
+
+
+if __name__ == '__main__':
+  for name, check in [
+    ('typed columns', check_typed),
+    ('NULL values', check_nulls),
+    ('spectra', check_spectra)
+  ]:
+    check()
+    print '  ok {0}'.format(name)
@@ -29,3 +29,14 @@ if len(records) == 0:
 record = records[0]
 
 print record
+
+# Coordinates decoded locally should match the ones the database reports.
+x, y = DBman.coordinates(records)
+for record, local_x, local_y in zip(records[:100], x, y):
+  assert (local_x, local_y) == record.recoverXY()
+  assert local_x == session.scalar(record.location.x)
+  assert local_y == session.scalar(record.location.y)
+
+print '{0} locations decoded'.format(len(x))
+
+session.close()
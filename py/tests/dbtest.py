@@ -16,7 +16,6 @@ from datetime import datetime
 from geoalchemy import WKTSpatialElement
 
 Wind = DBman.accessTable(None, template = 'tblwind')
-session = DBman.startSession()
 
 buoyID = getBuoyID( 46022 )
 
@@ -25,10 +24,12 @@ time = datetime.strptime( "4/20/2010 4:20:00","%m/%d/%Y %H:%M:%S" )
 windTest = Wind( buoyID, WKTSpatialElement('POINT(40.86 -124.08)'), time, 12.0, 120.0 )
 print windTest
 
-session.add(windTest)
-session.commit()
+# The session is committed and closed at the end of the with block.
+with DBman.session() as session:
+  session.add(windTest)
 
-for record in session.query(Wind).all():
-  print record
+with DBman.session() as session:
+  for record in session.query(Wind).all():
+    print record
 
-session.close()
+print DBman.pool_stats()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+"""
+Checks wavecon.download.DownloadManager against small HTTP and FTP servers
+run by this script on localhost, so no network access or database is needed.
+The servers drop connections and report errors on request to exercise
+retries and resumed transfers.  Usage::
+
+  downloadtest.py
+"""
+
+# Make sure the WaveConnect py/lib folder is on the search path so
+# modules can be retrieved.
+import sys
+from os import path
+scriptLocation = path.dirname(path.abspath( __file__ ))
+waveLibs = path.abspath(path.join( scriptLocation, '..', 'lib' ))
+sys.path.insert( 0, waveLibs )
+
+import fnmatch
+import gzip
+import hashlib
+import os
+import posixpath
+import socket
+import threading
+import BaseHTTPServer
+import SocketServer
+from StringIO import StringIO
+
+from numpy import random
+
+from wavecon.download import DownloadManager, DownloadError
+
+
+def gzipped(data):
+  buffer = StringIO()
+  with gzip.GzipFile(fileobj = buffer, mode = 'wb') as output:
+    output.write(data)
+  return buffer.getvalue()
+
+
+# Files served by both servers, looked up by the last component of the path.
+random.seed(0)
+SPECTRA = dict(('enp.EKA{0:02d}.spec'.format(i),
+  ' '.join('{0:.3E}'.format(x) for x in random.rand(5000)))
+  for i in xrange(12))
+FILES = dict((name + '.gz', gzipped(data)) for name, data in SPECTRA.items())
+FILES['enp.CRM01.spec.gz'] = gzipped('not a match')
+FILES['nam12.nc'] = random.bytes(300000)
+# Two gzip files run together, as `cat a.gz b.gz` would produce.
+FILES['multi.gz'] = gzipped('first member, ') + gzipped('second member')
+
+# Number of times each file has been requested, and the files that should
+# fail the first time they are requested.
+requests = {}
+flaky = set()
+lock = threading.Lock()
+
+
+def first_request(name):
+  with lock:
+    requests[name] = requests.get(name, 0) + 1
+    return requests[name] == 1 and name in flaky
+
+
+#------------------------------------------------------------------------------
+#  HTTP Server
+#------------------------------------------------------------------------------
+class HTTPHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def log_message(self, *args):
+    pass
+
+  def do_GET(self):
+    name = posixpath.basename(self.path.split('?')[0])
+    fail = first_request(name)
+
+    if name == 'busy' and fail:
+      return self.reply(503, '')
+    if name == 'busy':
+      name = 'nam12.nc'
+    if name == 'moved':
+      self.send_response(302)
+      self.send_header('Location', '/data/nam12.nc')
+      self.send_header('Content-Length', '0')
+      return self.end_headers()
+    if name not in FILES:
+      return self.reply(404, '')
+
+    data = FILES[name]
+    etag = '"{0}"'.format(hashlib.md5(data).hexdigest())
+    if self.headers.get('If-None-Match') == etag:
+      self.send_response(304)
+      self.send_header('ETag', etag)
+      self.send_header('Content-Length', '0')
+      return self.end_headers()
+
+    offset = 0
+    if self.headers.get('Range'):
+      offset = int(self.headers['Range'].split('=')[1].rstrip('-'))
+
+    self.send_response(206 if offset else 200)
+    self.send_header('Content-Length', str(len(data) - offset))
+    self.send_header('ETag', etag)
+    self.end_headers()
+
+    if fail:
+      # Send half of the file and hang up.
+      self.wfile.write(data[offset:offset + (len(data) - offset) // 2])
+      self.close_connection = 1
+      return
+    self.wfile.write(data[offset:])
+
+  def reply(self, status, body):
+    self.send_response(status)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+
+class HTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+  daemon_threads = True
+
+
+#------------------------------------------------------------------------------
+#  FTP Server
+#------------------------------------------------------------------------------
+class FTPHandler(SocketServer.StreamRequestHandler):
+  # Just enough of RFC 959 for ftplib: passive mode binary transfers and
+  # name listings.
+
+  def handle(self):
+    self.offset = 0
+    self.passive = None
+    self.reply('220 ready')
+
+    for line in iter(self.rfile.readline, ''):
+      command, _, argument = line.strip().partition(' ')
+      command = command.upper()
+
+      if command == 'USER':
+        self.reply('331 password please')
+      elif command == 'PASS':
+        self.reply('230 logged in')
+      elif command == 'TYPE':
+        self.reply('200 type set')
+      elif command == 'PASV':
+        self.passive = socket.socket()
+        self.passive.bind(('127.0.0.1', 0))
+        self.passive.listen(1)
+        port = self.passive.getsockname()[1]
+        self.reply('227 Entering Passive Mode (127,0,0,1,{0},{1})'.format(
+          port // 256, port % 256))
+      elif command == 'REST':
+        self.offset = int(argument)
+        self.reply('350 restarting at {0}'.format(self.offset))
+      elif command == 'MDTM':
+        name = posixpath.basename(argument)
+        if name in FILES:
+          # Stands in for the modification time, changes with the file.
+          self.reply('213 ' + hashlib.md5(FILES[name]).hexdigest()[:14])
+        else:
+          self.reply('550 no such file')
+      elif command == 'NLST':
+        names = sorted(name for name in FILES
+          if fnmatch.fnmatch(name, 'enp.*'))
+        self.transfer('\r\n'.join(names) + '\r\n')
+      elif command == 'RETR':
+        name = posixpath.basename(argument)
+        if name not in FILES:
+          self.reply('550 no such file')
+          continue
+        fail = first_request(name)
+        data = FILES[name][self.offset:]
+        if fail:
+          self.transfer(data[:len(data) // 2], '426 transfer aborted')
+        else:
+          self.transfer(data)
+      elif command == 'QUIT':
+        self.reply('221 bye')
+        return
+      else:
+        self.reply('502 not implemented')
+
+  def transfer(self, data, result = '226 done'):
+    self.offset = 0
+    self.reply('150 opening data connection')
+    connection, _ = self.passive.accept()
+    connection.sendall(data)
+    connection.close()
+    self.passive.close()
+    self.reply(result)
+
+  def reply(self, line):
+    self.wfile.write(line + '\r\n')
+    self.wfile.flush()
+
+
+class FTPServer(SocketServer.ThreadingTCPServer):
+  daemon_threads = True
+  allow_reuse_address = True
+
+
+def serve(server_class, handler_class):
+  server = server_class(('127.0.0.1', 0), handler_class)
+  thread = threading.Thread(target = server.serve_forever)
+  thread.daemon = True
+  thread.start()
+  return server, 'localhost:{0}'.format(server.server_address[1])
+
+
+#------------------------------------------------------------------------------
+#  Tests
+#------------------------------------------------------------------------------
+def read(name):
+  with open(name, 'rb') as f:
+    return f.read()
+
+
+def check_ftp_listing(downloads, ftp):
+  urls = downloads.list('ftp://{0}/pub/waves/latest_run/enp.EKA*'.format(ftp))
+  assert [ posixpath.basename(url) for url in urls ] == \
+    sorted(name + '.gz' for name in SPECTRA)
+  return urls
+
+
+def check_ftp_gunzip(downloads, ftp):
+  # Two of the files are cut off half way through and must be resumed.
+  flaky.update(['enp.EKA03.spec.gz', 'enp.EKA07.spec.gz'])
+  urls = check_ftp_listing(downloads, ftp)
+  files = downloads.fetch_all(urls, gunzip = True)
+  for name in files:
+    assert read(name) == SPECTRA[path.basename(name)]
+    assert path.dirname(name) == downloads.work_dir
+  assert requests['enp.EKA03.spec.gz'] == requests['enp.EKA07.spec.gz'] == 2
+  assert not [ name for name in os.listdir(downloads.work_dir)
+    if name.endswith(('.part', '.gunzip')) ]
+
+
+def check_http_resume(downloads, http):
+  flaky.add('nam12.nc')
+  name = downloads.fetch('http://{0}/data/nam12.nc'.format(http),
+    'resumed.nc').result()
+  assert read(name) == FILES['nam12.nc']
+
+
+def check_http_gunzip(downloads, http):
+  flaky.add('enp.EKA05.spec.gz')
+  name = downloads.fetch(
+    'http://{0}/data/enp.EKA05.spec.gz?x=1'.format(http), gunzip = True)\
+    .result()
+  assert path.basename(name) == 'enp.EKA05.spec'
+  assert read(name) == SPECTRA['enp.EKA05.spec']
+
+  name = downloads.fetch('http://{0}/multi.gz'.format(http),
+    gunzip = True).result()
+  assert read(name) == 'first member, second member'
+
+
+def check_http_retry(downloads, http):
+  flaky.add('busy')
+  name = downloads.fetch('http://{0}/busy'.format(http)).result()
+  assert read(name) == FILES['nam12.nc']
+  assert requests['busy'] == 2
+
+
+def check_http_redirect(downloads, http):
+  name = downloads.fetch('http://{0}/moved'.format(http), 'moved.nc')\
+    .result()
+  assert read(name) == FILES['nam12.nc']
+
+
+def check_conditional(downloads, http, ftp):
+  for url in ('http://{0}/data/nam12.nc'.format(http),
+    'ftp://{0}/pub/waves/latest_run/enp.EKA01.spec.gz'.format(ftp)):
+    first = downloads.fetch(url, 'first')
+    first.result()
+    assert first.validators
+
+    again = downloads.fetch(url, 'again', validators = first.validators)
+    assert again.result() is None
+    assert again.not_modified
+    assert not path.exists(again.path)
+
+    changed = downloads.fetch(url, 'changed',
+      validators = { 'etag' : '"old"', 'last_modified' : '19700101000000' })
+    assert read(changed.result()) == FILES[posixpath.basename(url)]
+
+
+def check_missing(downloads, http, ftp):
+  for url in ('http://{0}/missing'.format(http),
+    'ftp://{0}/missing'.format(ftp)):
+    try:
+      downloads.fetch(url).result()
+    except DownloadError as error:
+      assert error.url == url
+      # Missing files are not retried.
+      assert requests.get('missing', 0) <= 1
+    else:
+      raise AssertionError('{0} should not download'.format(url))
+
+
+def check_work_dir():
+  with DownloadManager() as downloads:
+    work_dir = downloads.work_dir
+    assert path.isdir(work_dir)
+  assert not path.exists(work_dir)
+
+
+if __name__ == '__main__':
+  http_server, http = serve(HTTPServer, HTTPHandler)
+  ftp_server, ftp = serve(FTPServer, FTPHandler)
+
+  checks = [
+    ('ftp listing', check_ftp_listing, (ftp,)),
+    ('ftp gunzip and resume', check_ftp_gunzip, (ftp,)),
+    ('http resume', check_http_resume, (http,)),
+    ('http gunzip', check_http_gunzip, (http,)),
+    ('http retry', check_http_retry, (http,)),
+    ('http redirect', check_http_redirect, (http,)),
+    ('conditional requests', check_conditional, (http, ftp)),
+    ('missing files', check_missing, (http, ftp)),
+  ]
+
+  with DownloadManager(threads = 4, per_host = 2, backoff = 0.01,
+    timeout = 5) as downloads:
+    for name, check, args in checks:
+      check(downloads, *args)
+      print '  ok {0}'.format(name)
+
+  check_work_dir()
+  print '  ok work directory'
+
+  http_server.shutdown()
+  ftp_server.shutdown()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Compares the ways CMSman can write the per-location spec files of a wave nest
+from a synthetic set of tblwave records:
+
+  * *masks*: the gen_wavefiles() loop prior to the spectra cube, which built
+    a boolean mask over every record for each location and steering time and
+    formatted each value with str().
+  * *cube*: the records grouped once by CMSman.wavecube() and each file laid
+    out by CMSman.englines().
+
+The nest is written at doubling sizes, so the time per location shows how
+each approach scales.  Files go to a scratch directory and the two approaches
+are checked to write the same bytes.  Usage::
+
+  engbench.py [largest number of locations]
+"""
+
+# Make sure the WaveConnect py/lib folder is on the search path so
+# modules can be retrieved.
+import sys
+from os import path
+scriptLocation = path.dirname(path.abspath( __file__ ))
+waveLibs = path.abspath(path.join( scriptLocation, '..', 'lib' ))
+sys.path.insert( 0, waveLibs )
+
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from wavecon import CMSman
+
+# 48 hours of WW3 spectra every 3 hours.
+NTIMES = 17
+FREQS = np.linspace(0.035, 0.5, 25)
+DIRS = np.arange(0, 360, 15.0)
+
+
+def nest_records(nlocs):
+  rng = np.random.RandomState(0)
+  times = [ datetime(2010, 12, 22) + timedelta(hours = 3 * i)
+    for i in xrange(NTIMES) ]
+  locs = np.array([ '0101000020E6100000{0:032x}'.format(i)
+    for i in xrange(nlocs) ], dtype = object)
+  order = rng.permutation(nlocs * NTIMES)
+
+  result = {
+    'spec': rng.random_sample((nlocs * NTIMES, len(FREQS), len(DIRS)))[order],
+    'time': np.tile(np.array(times, dtype = 'datetime64[us]'), nlocs)[order],
+    'loc': np.repeat(locs, NTIMES)[order],
+    'x': np.repeat(np.arange(nlocs) * 1000.0, NTIMES)[order],
+    'y': np.repeat(np.arange(nlocs) * 500.0, NTIMES)[order]
+  }
+  win_dat = [ ('5.0', '270.0') ] * NTIMES
+
+  return result, times, win_dat
+
+
+def write_masks(result, times, win_dat, out_dir):
+  # gen_wavefiles() prior to the spectra cube, spectra as they are after
+  # interpolatespectra() and the peak frequency taken as it is now.
+  loc = result['loc']
+  wavtime = result['time'].astype(object)
+  spec = result['spec']
+  peakfreq = FREQS[spec.max(2).argmax(1)]
+  freq = np.array([ FREQS.tolist() ] * len(loc))
+
+  locset = np.array(sorted(set(loc)))
+  for counter, myloc in enumerate(locset):
+    wind = iter(win_dat)
+    filter = (loc == myloc)
+    myfreq = freq[filter].tolist()
+    myfreqstr = [ ' '.join([ str(i) for i in f ]) for f in myfreq ]
+    file = open(path.join(out_dir, 'WAVE.{0}.eng'.format(counter)), 'w')
+    file.write(str(len(myfreq[0])) + ' ' + str(len(DIRS)) + '\n')
+    file.write(myfreqstr[0] + '\n')
+    for mytime in times:
+      filter = np.logical_and(loc == myloc, wavtime == mytime)
+      filter = filter.tolist().index(True)
+      win_speed, win_dir = wind.next()
+      file.write(' '.join([ mytime.strftime('%m%d%H'), win_speed, win_dir,
+        str(peakfreq[filter]), '0' ]) + '\n')
+      for f in range(len(FREQS)):
+        file.write('\t' + ' '.join([ str(d) for d in spec[filter][f] ]) +
+          '\n')
+    file.close()
+
+  return len(locset)
+
+
+def write_cube(result, times, win_dat, out_dir):
+  wavdata = CMSman.calculatepeakfreq(CMSman.wavecube(result, FREQS, DIRS))
+  steps = CMSman.engsteps(wavdata, times)
+  freq = wavdata['freq'].tolist()
+
+  for i in xrange(len(wavdata['loc'])):
+    file = open(path.join(out_dir, 'WAVE.{0}.eng'.format(i)), 'w')
+    file.write(''.join(CMSman.englines(freq, DIRS, wavdata['spec'][i][steps],
+      wavdata['peakfreq'][i][steps].tolist(), times, win_dat)))
+    file.close()
+
+  return len(wavdata['loc'])
+
+
+def same_files(first, second):
+  names = sorted(os.listdir(first))
+  return names == sorted(os.listdir(second)) and all(
+    open(path.join(first, name)).read() == open(path.join(second,
+      name)).read() for name in names )
+
+
+if __name__ == '__main__':
+  largest = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+  sizes = [ largest >> shift for shift in (3, 2, 1, 0) if largest >> shift ]
+
+  print '{0} steering times of {1} x {2} spectra'.format(NTIMES, len(FREQS),
+    len(DIRS))
+  for nlocs in sizes:
+    result, times, win_dat = nest_records(nlocs)
+    out_dirs = []
+    try:
+      for name, method in (('masks', write_masks), ('cube', write_cube)):
+        out_dirs.append(tempfile.mkdtemp(prefix = 'wavecon-engbench-'))
+        start = time.time()
+        assert method(result, times, win_dat, out_dirs[-1]) == nlocs
+        elapsed = time.time() - start
+
+        print '{0:>5} locations {1:>6}: {2:.2f}s  ({3:.1f} ms/location)'\
+          .format(nlocs, name, elapsed, 1000 * elapsed / nlocs)
+
+      assert same_files(*out_dirs)
+    finally:
+      for out_dir in out_dirs:
+        shutil.rmtree(out_dir)
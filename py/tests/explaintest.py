@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Checks that the queries CMSman uses to pull wave and wind data for a model run
+can be answered from indexes.  Each query is run through ``EXPLAIN`` with
+sequential scans disabled, so Postgres only plans a sequential scan of a fact
+table when no index applies to the query.  Any such scan fails the test.
+
+Partitions covering the requested times are created for the test and rolled
+back afterwards, so the database is left untouched.  Usage::
+
+  explaintest.py [model config.json]
+"""
+
+# Make sure the WaveConnect py/lib folder is on the search path so
+# modules can be retrieved.
+import sys
+from os import path
+scriptLocation = path.dirname(path.abspath( __file__ ))
+waveLibs = path.abspath(path.join( scriptLocation, '..', 'lib' ))
+sys.path.insert( 0, waveLibs )
+
+import json
+from datetime import datetime
+
+from wavecon import DBman, CMSman
+
+DEFAULT_CONFIG = path.abspath(path.join( scriptLocation, '..', '..', 'cms',
+  'simulations', 'humboldt-example', 'config.json' ))
+
+FACT_TABLES = ('tblwave', 'tblwind')
+
+
+def plan_nodes(plan):
+  yield plan
+  for child in plan.get('Plans', []):
+    for node in plan_nodes(child):
+      yield node
+
+
+def sequential_scans(cursor, query):
+  cursor.execute('EXPLAIN (FORMAT JSON) ' + query)
+  plan = cursor.fetchone()[0]
+  if isinstance(plan, basestring):
+    plan = json.loads(plan)
+
+  return [ node['Relation Name'] for node in plan_nodes(plan[0]['Plan'])
+    if node['Node Type'] == 'Seq Scan' and
+      node['Relation Name'].startswith(FACT_TABLES) ]
+
+
+if __name__ == '__main__':
+  config_file = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CONFIG
+  with open(config_file) as config:
+    model_config = json.load(config)
+
+  now = datetime.utcnow().replace(minute = 0, second = 0, microsecond = 0)
+  steeringtimes = CMSman.maketimes(now, 72, 3)
+  box = CMSman.makebox(model_config)
+
+  queries = [
+    ('getwavedata', CMSman.wavequery(box, steeringtimes, model_config)),
+    ('getwinddata', CMSman.windquery(box, steeringtimes, model_config)),
+    ('getwinddata, no box', CMSman.windquery(None, steeringtimes,
+      model_config))
+  ]
+
+  connection = DBman.RawPostgresConnection()
+  cursor = connection.cursor()
+  failures = 0
+
+  try:
+    cursor.execute('SET LOCAL enable_seqscan = off')
+    for table in FACT_TABLES:
+      cursor.execute('SELECT create_monthly_partitions(%s, %s, %s)',
+        (table, steeringtimes[0], steeringtimes[-1]))
+
+    for name, query in queries:
+      scans = sequential_scans(cursor, query)
+      if scans:
+        failures += 1
+        print 'FAIL {0}: sequential scan of {1}'.format(name, ', '.join(scans))
+      else:
+        print '  ok {0}'.format(name)
+  finally:
+    connection.rollback()
+    cursor.close()
+    connection.close()
+
+  sys.exit(1 if failures else 0)
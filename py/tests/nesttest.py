@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""
+Checks the spec files and nest.dat CMSman writes against the golden files in
+golden/.  WAVE.0.eng and WAVE.1.eng hold the spec files of the two locations
+of the nest.  WAVE.ww3.eng holds a spec file with WW3 frequency bins, whose
+peak frequency needs all 17 digits.  nest.dat and nest-edges.dat were merged
+by mergeENG from spec files englines() wrote, and gen_wavefiles() must write
+them byte for byte.  Usage::
+
+  nesttest.py
+"""
+
+# Make sure the WaveConnect py/lib folder is on the search path so
+# modules can be retrieved.
+import sys
+from os import path
+scriptLocation = path.dirname(path.abspath( __file__ ))
+waveLibs = path.abspath(path.join( scriptLocation, '..', 'lib' ))
+sys.path.insert( 0, waveLibs )
+
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from wavecon import CMSman
+
+GOLDEN = path.join(scriptLocation, 'golden')
+
+FREQS = np.array([0.05, 0.1, 0.15])
+# Already on the half plane CMS expects, so interpolatespectra() keeps the
+# values as they are.
+DIRS = np.array([-90.0, -30.0, 30.0, 90.0])
+TIMES = [ datetime(2010, 12, 22) + timedelta(hours = 6 * i) for i in xrange(3) ]
+# The first WW3 bins, growing by 10%.
+WW3_FREQS = 0.0418 * 1.1 ** np.arange(3)
+WINDS = [ ('5.5', '270.0'), ('6.25', '265.5'), ('7.0', '250.0') ]
+
+
+def nest_records():
+  # Two locations, three times and spectra with exact decimal values.
+  spectra = np.arange(2 * 3 * 3 * 4).reshape((6, 3, 4)) / 1000.0
+  spectra[:, 1, 2] += 1
+
+  return {
+    'spec': spectra,
+    'time': np.array(TIMES * 2, dtype = 'datetime64[us]'),
+    'loc': np.array(['0101000020E6100000A', '0101000020E6100000B'] * 3,
+      dtype = object)[[0, 2, 4, 1, 3, 5]],
+    'x': np.array([1801000.5] * 3 + [1802500.0] * 3),
+    'y': np.array([654000.25] * 3 + [655000.0] * 3)
+  }
+
+
+def golden(name):
+  with open(path.join(GOLDEN, name)) as golden_file:
+    return golden_file.read()
+
+
+def nest_wavdata():
+  return CMSman.calculatepeakfreq(CMSman.interpolatespectra(
+    CMSman.wavecube(nest_records(), FREQS, DIRS)))
+
+
+def check_engfiles():
+  wavdata = nest_wavdata()
+  steps = CMSman.engsteps(wavdata, TIMES)
+  for i in xrange(2):
+    lines = CMSman.englines(wavdata['freq'].tolist(), wavdata['dir'],
+      wavdata['spec'][i][steps], wavdata['peakfreq'][i][steps].tolist(),
+      TIMES, WINDS)
+    assert ''.join(lines) == golden('WAVE.{0}.eng'.format(i))
+
+
+def check_peakfreq_digits():
+  # The peak is the last bin, 0.050578000000000005, which str() would cut
+  # down to 12 digits.
+  records = nest_records()
+  records['spec'][:, 2, 1] += 2
+  wavdata = CMSman.calculatepeakfreq(CMSman.interpolatespectra(
+    CMSman.wavecube(records, WW3_FREQS, DIRS)))
+  steps = CMSman.engsteps(wavdata, TIMES)
+  lines = CMSman.englines(wavdata['freq'].tolist(), wavdata['dir'],
+    wavdata['spec'][0][steps], wavdata['peakfreq'][0][steps].tolist(),
+    TIMES, WINDS)
+  assert ''.join(lines) == golden('WAVE.ww3.eng')
+
+
+def check_nestfile():
+  # gen_wavefiles() reads the winds from the .ave file next to its output.
+  run_dir = tempfile.mkdtemp(prefix = 'wavecon-nesttest-')
+  try:
+    with open(path.join(run_dir, 'WIND.ave'), 'w') as wind_file:
+      wind_file.write(''.join('{0} {1}\n'.format(*wind) for wind in WINDS))
+    nest_name = path.join(run_dir, 'nest.dat')
+    CMSman.gen_wavefiles(CMSman.wavecube(nest_records(), FREQS, DIRS),
+      TIMES, None, nest_name)
+
+    with open(nest_name) as nest_file:
+      assert nest_file.read() == golden('nest.dat')
+    assert sorted(os.listdir(run_dir)) == ['WIND.ave', 'nest.dat']
+  finally:
+    shutil.rmtree(run_dir)
+
+
+def check_nestfile_edges():
+  # Six WW3 bins and 18 directions wrap the frequency and spectrum lines.
+  # The first spectrum holds halves, negative values that round to zero,
+  # values that overflow f8.3 and a double halfway between two singles;
+  # the third sums to a negative energy, whose wave height is NaN.
+  freq = (0.0418 * 1.1 ** np.arange(6)).tolist()
+  spec = np.tile(np.linspace(0, 0.05, 18), (2, 2, 6, 1))
+  spec[0, 0, 0, :8] = [0.0625, 0.3125, -0.0004, -0.0005, 9999.9994,
+    12.0625, 1.0005, 2.5e-7]
+  spec[0, 1, 1, :3] = [10000.0, -1000.0, 0.1]
+  single = np.float32(0.3)
+  spec[0, 1, 2, 0] = (np.float64(single) +
+    np.float64(np.nextafter(single, np.float32(1)))) / 2
+  spec[1, 0] = -spec[1, 0]
+  peakfreq = [[freq[5], freq[0]], [freq[2], freq[3]]]
+  times = [datetime(2010, 12, 31, 18), datetime(2011, 1, 1)]
+  winds = [('0.125', '-0.125'), ('12.345', '359.995')]
+
+  nest_file = StringIO()
+  CMSman.write_nestfile(nest_file, freq, spec, peakfreq,
+    np.array([1801000.123456789, -5.5]), np.array([-654000.987654321, 0.1]),
+    times, winds)
+  assert nest_file.getvalue() == golden('nest-edges.dat')
+
+
+def check_nestfile_errors():
+  for freq, spec in [
+    (FREQS[:2].tolist(), np.zeros((1, 1, 2, 4))),
+    (FREQS.tolist(), np.array([np.nan, 0, 0, 0] * 3).reshape((1, 1, 3, 4)))
+  ]:
+    try:
+      CMSman.write_nestfile(StringIO(), freq, spec, [[0.1]], np.zeros(1),
+        np.zeros(1), TIMES[:1], WINDS[:1])
+    except ValueError:
+      pass
+    else:
+      raise AssertionError('accepted input mergeENG cannot merge')
+
+
+if __name__ == '__main__':
+  for name, check in [
+    ('spec files', check_engfiles),
+    ('peak frequency digits', check_peakfreq_digits),
+    ('nest.dat', check_nestfile),
+    ('nest.dat edge cases', check_nestfile_edges),
+    ('nest.dat errors', check_nestfile_errors)
+  ]:
+    check()
+    print '  ok {0}'.format(name)
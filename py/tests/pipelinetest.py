@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+Checks wavecon.pipeline.Pipeline with stages that sleep in place of
+downloading, parsing and loading.  No network or database is needed.
+Usage::
+
+  pipelinetest.py
+"""
+
+# Make sure the WaveConnect py/lib folder is on the search path so
+# modules can be retrieved.
+import sys
+from os import path
+scriptLocation = path.dirname(path.abspath( __file__ ))
+waveLibs = path.abspath(path.join( scriptLocation, '..', 'lib' ))
+sys.path.insert( 0, waveLibs )
+
+import threading
+import time
+
+from wavecon.pipeline import Pipeline, Stage
+
+
+class InFlight(object):
+  # Counts the items taken from the source that the last stage has not
+  # finished with yet.
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.count = 0
+    self.peak = 0
+
+  def source(self, count):
+    for i in xrange(count):
+      with self.lock:
+        self.count += 1
+        self.peak = max(self.peak, self.count)
+      yield i
+
+  def finish(self, item):
+    with self.lock:
+      self.count -= 1
+    return item
+
+
+def sleeper(seconds, then = None):
+  def work(item):
+    time.sleep(seconds)
+    return then(item) if then else item
+  return work
+
+
+def check_results():
+  pipeline = Pipeline([
+    ('download', lambda i: i * 2, 3),
+    ('parse', lambda i: i + 1, 2),
+    ('load', lambda i: -i)
+  ])
+  results = pipeline.run(xrange(100))
+  assert sorted(results) == sorted( -(i * 2 + 1) for i in xrange(100) )
+  assert [ stage.items for stage in pipeline.stages ] == [100, 100, 100]
+
+
+def check_overlap():
+  # Each stage has 1s of work, 0.5s with two workers.  Run one after the
+  # other the stages would take 1.5s.
+  pipeline = Pipeline([
+    Stage('download', sleeper(0.05), workers = 2),
+    Stage('parse', sleeper(0.05), workers = 2),
+    Stage('load', sleeper(0.05), workers = 2)
+  ])
+  pipeline.run(xrange(20))
+  assert pipeline.elapsed < 1.0
+  for stage in pipeline.stages:
+    assert 0.9 < stage.busy < 1.5
+
+
+def check_bounded():
+  # A slow last stage holds the others back rather than letting items pile
+  # up in between.
+  in_flight = InFlight()
+  pipeline = Pipeline([
+    ('download', sleeper(0.001), 4),
+    ('parse', sleeper(0.001), 2),
+    ('load', sleeper(0.01, in_flight.finish), 1)
+  ], queue_size = 2)
+  pipeline.run(in_flight.source(200))
+
+  # Queued, being worked on or waiting to be queued by each stage.
+  bound = sum( pipeline.queue_size + 2 * stage.workers
+    for stage in pipeline.stages ) + 1
+  assert in_flight.peak <= bound, (in_flight.peak, bound)
+  assert pipeline.stages[0].blocked > pipeline.stages[2].blocked
+
+
+def check_error():
+  seen = []
+
+  def parse(item):
+    if item == 5:
+      raise ValueError('bad file {0}'.format(item))
+    return item
+
+  pipeline = Pipeline([
+    ('download', sleeper(0.001), 2),
+    ('parse', parse, 2),
+    ('load', seen.append, 1)
+  ])
+  try:
+    pipeline.run(xrange(1000))
+  except ValueError as e:
+    assert str(e) == 'bad file 5'
+  else:
+    raise AssertionError('the parse error should be raised')
+  assert len(seen) < 1000
+
+
+def check_report():
+  pipeline = Pipeline([('download', sleeper(0.001)), ('load', len)])
+  pipeline.run([ 'a', 'bb' ])
+  report = pipeline.report().splitlines()
+  assert len(report) == 4
+  assert report[1].split()[:2] == ['download', '2']
+
+
+if __name__ == '__main__':
+  for name, check in [
+    ('results', check_results),
+    ('stages overlap', check_overlap),
+    ('bounded queues', check_bounded),
+    ('errors', check_error),
+    ('report', check_report)
+  ]:
+    check()
+    print '  ok {0}'.format(name)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Checks that DBman.decode_point() and DBman.coordinates() decode point
+locations in every form the database and the loaders hand them over.  No
+database is used, only a configuration to import DBman with.  Usage::
+
+  pointtest.py
+"""
+
+# Make sure the WaveConnect py/lib folder is on the search path so
+# modules can be retrieved.
+import sys
+from os import path
+scriptLocation = path.dirname(path.abspath( __file__ ))
+waveLibs = path.abspath(path.join( scriptLocation, '..', 'lib' ))
+sys.path.insert( 0, waveLibs )
+
+import struct
+
+from geoalchemy import WKTSpatialElement, WKBSpatialElement
+
+from wavecon import DBman
+
+# POINT(1 2) as little-endian WKB, and as EWKB with SRID 4326.
+WKB = struct.pack('<BIdd', 1, 1, 1.0, 2.0)
+EWKB = struct.pack('<BIIdd', 1, 0x20000001, 4326, 1.0, 2.0)
+
+
+def check_wkb():
+  assert DBman.decode_point(WKB) == (1.0, 2.0)
+  assert DBman.decode_point(EWKB) == (1.0, 2.0)
+  assert DBman.decode_point(buffer(WKB)) == (1.0, 2.0)
+  assert DBman.decode_point(WKBSpatialElement(buffer(WKB))) == (1.0, 2.0)
+
+  # Big-endian byte order.
+  assert DBman.decode_point(struct.pack('>BIdd', 0, 1, 1.0, 2.0)) == \
+    (1.0, 2.0)
+
+
+def check_hex():
+  # What a raw query selecting a geometry column returns, in either case.
+  assert DBman.decode_point(WKB.encode('hex').upper()) == (1.0, 2.0)
+  assert DBman.decode_point(EWKB.encode('hex')) == (1.0, 2.0)
+  assert DBman.decode_point(
+    '0101000000000000000000F03F0000000000000040') == (1.0, 2.0)
+
+
+def check_wkt():
+  assert DBman.decode_point('POINT(1 2)') == (1.0, 2.0)
+  assert DBman.decode_point('SRID=4326;POINT(-124.5 40.75)') == \
+    (-124.5, 40.75)
+  assert DBman.decode_point(WKTSpatialElement('POINT(1 2)')) == (1.0, 2.0)
+  assert DBman.decode_point((1, 2)) == (1.0, 2.0)
+
+
+def check_errors():
+  for value in ('', 'LINESTRING(0 0, 1 1)', struct.pack('<BI', 1, 2), None):
+    try:
+      DBman.decode_point(value)
+    except ValueError:
+      pass
+    else:
+      raise AssertionError('decoded {0!r}'.format(value))
+
+
+def check_coordinates():
+  # All WKB takes the numpy path, anything mixed in decodes point by point.
+  x, y = DBman.coordinates([WKB, struct.pack('<BIdd', 1, 1, 3.0, 4.0)])
+  assert x.tolist() == [1.0, 3.0] and y.tolist() == [2.0, 4.0]
+
+  x, y = DBman.coordinates([EWKB.encode('hex'), WKB.encode('hex').upper(),
+    'POINT(3 4)'])
+  assert x.tolist() == [1.0, 1.0, 3.0] and y.tolist() == [2.0, 2.0, 4.0]
+
+
+if __name__ == '__main__':
+  for name, check in [
+    ('WKB', check_wkb),
+    ('hex WKB', check_hex),
+    ('WKT', check_wkt),
+    ('errors', check_errors),
+    ('coordinates', check_coordinates)
+  ]:
+    check()
+    print '  ok {0}'.format(name)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Checks wavecon.projection against pyproj and the corner projections CMSman
+used to ask PostGIS for.  No database is needed.  Usage::
+
+  projectiontest.py
+"""
+
+# Make sure the WaveConnect py/lib folder is on the search path so
+# modules can be retrieved.
+import sys
+from os import path
+scriptLocation = path.dirname(path.abspath( __file__ ))
+waveLibs = path.abspath(path.join( scriptLocation, '..', 'lib' ))
+sys.path.insert( 0, waveLibs )
+
+import time
+
+import numpy as np
+import pyproj
+
+from wavecon import projection
+
+# California zone 1 state plane, as used by the humboldt example.
+STATE_PLANE = 26941
+
+
+def check_codes():
+  for crs in [26941, '26941', 'epsg:26941', 'EPSG:26941', np.int64(26941)]:
+    assert projection.epsg_code(crs) == STATE_PLANE
+  try:
+    projection.epsg_code('+proj=longlat')
+  except ValueError:
+    pass
+  else:
+    raise AssertionError('proj strings are not EPSG codes')
+
+
+def check_arrays():
+  lons, lats = np.meshgrid(np.linspace(-125, -123, 40),
+    np.linspace(40, 42, 30))
+  x, y = projection.project(lons, lats, STATE_PLANE)
+  assert x.shape == lons.shape and y.shape == lats.shape
+
+  # The same numbers as a transformer built by hand.
+  state_plane = pyproj.Proj(init = 'epsg:26941')
+  expected_x, expected_y = state_plane(lons, lats)
+  assert np.allclose(x, expected_x, atol = 1e-3)
+  assert np.allclose(y, expected_y, atol = 1e-3)
+
+  back_lons, back_lats = projection.unproject(x, y, 'epsg:26941')
+  assert np.allclose(back_lons, lons) and np.allclose(back_lats, lats)
+
+  # Single numbers come back as floats.
+  point = projection.project(-124.0, 41.0, STATE_PLANE)
+  assert all(isinstance(value, float) for value in point)
+  assert np.allclose(point, state_plane(-124.0, 41.0), atol = 1e-3)
+
+
+def check_corners():
+  west, south, east, north = '-124.3', '40.7', '-124.1', '40.9'
+  x0, y0, x1, y1 = projection.project_corners(west, south, east, north,
+    '26941')
+  assert (x0, y0) == projection.project(-124.3, 40.7, STATE_PLANE)
+  assert (x1, y1) == projection.project(-124.1, 40.9, STATE_PLANE)
+  assert x0 < x1 and y0 < y1
+
+  wkt = projection.polygon_wkt([x0, x1, x1, x0], [y0, y0, y1, y1])
+  assert wkt.startswith('POLYGON((') and wkt.count(',') == 4
+  assert wkt[len('POLYGON(('):].split(',')[0] == \
+    wkt[:-len('))')].split(',')[-1]
+
+
+def check_cache():
+  assert projection.transformer(4326, STATE_PLANE) is \
+    projection.transformer('epsg:4326', '26941')
+
+  # Once built, small transforms cost microseconds rather than a round trip.
+  started = time.time()
+  for i in xrange(1000):
+    projection.project(-124.0, 41.0, STATE_PLANE)
+  print '  1000 single point projections in {0:.3f}s'.format(
+    time.time() - started)
+
+
+if __name__ == '__main__':
+  for name, check in [
+    ('epsg codes', check_codes),
+    ('array transforms', check_arrays),
+    ('box corners', check_corners),
+    ('cached transformers', check_cache)
+  ]:
+    check()
+    print '  ok {0}'.format(name)
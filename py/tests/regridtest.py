@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+"""
+Checks the interpolation operators of wavecon.regrid on a scattered point
+cloud like a projected NAM12 grid, using a throwaway cache directory, and
+the wind files CMSman.gen_windfiles() writes with them.
+Usage::
+
+  regridtest.py
+"""
+
+# Make sure the WaveConnect py/lib folder is on the search path so
+# modules can be retrieved.
+import sys
+from os import path
+scriptLocation = path.dirname(path.abspath( __file__ ))
+waveLibs = path.abspath(path.join( scriptLocation, '..', 'lib' ))
+sys.path.insert( 0, waveLibs )
+
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+from math import atan2, degrees
+
+import numpy as np
+from scipy.interpolate import griddata
+
+from wavecon import regrid
+from wavecon import CMSman
+from wavecon.cache import DataCache
+
+NTIMES = 17
+
+
+def wind_points():
+  # A rotated, slightly jittered grid of points, as NAM12 cells look once
+  # projected to state plane coordinates.
+  rng = np.random.RandomState(0)
+  u, v = np.meshgrid(np.arange(60.0), np.arange(50.0))
+  angle = np.radians(12)
+  x = 12000 * (u * np.cos(angle) - v * np.sin(angle)) + rng.normal(0, 500,
+    u.shape)
+  y = 12000 * (u * np.sin(angle) + v * np.cos(angle)) + rng.normal(0, 500,
+    u.shape)
+
+  return x.ravel(), y.ravel()
+
+
+def model_grid(nx = 156, ny = 191):
+  return np.meshgrid(np.linspace(-60e3, 500e3, nx),
+    np.linspace(100e3, 600e3, ny))
+
+
+def check_linear(cache):
+  x, y = wind_points()
+  gridx, gridy = model_grid()
+  operator = regrid.grid_operator(x, y, gridx, gridy, cache)
+
+  # Linear fields come back exactly inside the hull.
+  field = 3 * x - 2 * y + 7
+  grid = operator.apply(field)
+  assert grid.shape == gridx.shape
+  expected = griddata((x, y), field, (gridx, gridy), method = 'linear')
+  inside = ~np.isnan(expected)
+  assert inside.any() and (~inside).any()
+  assert np.allclose(grid[inside], (3 * gridx - 2 * gridy + 7)[inside])
+  assert np.allclose(grid[inside], expected[inside])
+
+  # Cells outside take the nearest point.
+  nearest = griddata((x, y), field, (gridx, gridy), method = 'nearest')
+  assert np.allclose(grid[~inside], nearest[~inside])
+
+  # Every row of weights sums to one.
+  assert np.allclose(np.asarray(operator.matrix.sum(axis = 1)).ravel(), 1)
+
+
+def check_stacked(cache):
+  x, y = wind_points()
+  gridx, gridy = model_grid()
+  operator = regrid.grid_operator(x, y, gridx, gridy, cache)
+
+  rng = np.random.RandomState(1)
+  fields = rng.normal(0, 10, (2, NTIMES, len(x)))
+  grids = operator.apply(fields)
+  assert grids.shape == (2, NTIMES) + gridx.shape
+  assert np.allclose(grids[1, 5], operator.apply(fields[1, 5]))
+
+  try:
+    operator.apply(fields[..., 1:])
+  except ValueError:
+    pass
+  else:
+    raise AssertionError('values at the wrong points should raise ValueError')
+
+
+def check_cache(cache):
+  x, y = wind_points()
+  gridx, gridy = model_grid()
+  first = regrid.grid_operator(x, y, gridx, gridy, cache)
+  assert regrid.grid_operator(x, y, gridx, gridy, cache) is first
+
+  # A new process finds the weights in the cache instead of building them.
+  regrid._OPERATORS.clear()
+  hits = cache.stats()['hits']
+  started = time.time()
+  loaded = regrid.grid_operator(x, y, gridx, gridy, cache)
+  elapsed = time.time() - started
+  assert cache.stats()['hits'] == hits + 1
+  assert loaded is not first
+  assert (loaded.matrix != first.matrix).nnz == 0
+  print '  operator loaded from the cache in {0:.3f}s'.format(elapsed)
+
+  # Moving the grid makes a new operator.
+  moved = regrid.grid_operator(x, y, gridx + 1, gridy, cache)
+  assert regrid.geometry_key(x, y, gridx + 1, gridy) != \
+    regrid.geometry_key(x, y, gridx, gridy)
+  assert moved is not loaded
+
+
+def check_speed(cache):
+  # One product for both components at every steering time, against two
+  # griddata() calls per steering time.
+  x, y = wind_points()
+  gridx, gridy = model_grid()
+  rng = np.random.RandomState(2)
+  fields = rng.normal(0, 10, (2, NTIMES, len(x)))
+
+  regrid._OPERATORS.clear()
+  fresh = DataCache(path.join(cache.cache_dir, 'speed'))
+  started = time.time()
+  regrid.grid_operator(x, y, gridx, gridy, fresh).apply(fields)
+  operator_time = time.time() - started
+
+  started = time.time()
+  for k in xrange(NTIMES):
+    for component in xrange(2):
+      griddata((x, y), fields[component, k], (gridx, gridy),
+        method = 'linear')
+  griddata_time = time.time() - started
+
+  print '  {0} steering times: operator {1:.2f}s, griddata {2:.2f}s'.format(
+    NTIMES, operator_time, griddata_time)
+
+
+def wind_records():
+  # Three steering times of wind at the points, sorted by time and location
+  # as gen_windfiles() sorts them.
+  x, y = wind_points()
+  order = np.lexsort((y, x))
+  x, y = x[order], y[order]
+  times = [ datetime(2010, 12, 22) + timedelta(hours = 6 * k)
+    for k in xrange(3) ]
+  rng = np.random.RandomState(3)
+
+  return times, {
+    'time': np.repeat(np.array(times, dtype = 'datetime64[us]'), len(x)),
+    'x': np.tile(x, len(times)),
+    'y': np.tile(y, len(times)),
+    'speed': rng.uniform(0, 20, len(x) * len(times)),
+    'dir': rng.uniform(-np.pi, np.pi, len(x) * len(times))
+  }
+
+
+def baseline_windfiles(windata, grid, steeringtimes, nx, ny):
+  # The wind.dat and .ave lines gen_windfiles() wrote before the operators,
+  # with scipy's linear griddata() standing in for the natgrid one.
+  gridx, gridy = grid
+  wintime = windata['time'].tolist()
+  wind = [ '{0} {1}\n'.format(nx, ny) ]
+  ave = []
+  for mytime in steeringtimes:
+    filter = np.array([ t == mytime for t in wintime ])
+    vel_x = windata['speed'][filter] * map(np.cos, windata['dir'][filter])
+    vel_y = windata['speed'][filter] * map(np.sin, windata['dir'][filter])
+    points = (windata['x'][filter], windata['y'][filter])
+    newvel_x = griddata(points, vel_x, (gridx, gridy), method = 'linear')
+    newvel_y = griddata(points, vel_y, (gridx, gridy), method = 'linear')
+    avevel_x = np.mean(newvel_x)
+    avevel_y = np.mean(newvel_y)
+    win_speed = np.sqrt(avevel_x**2 + avevel_y**2)
+    win_dir = degrees(atan2(avevel_y, avevel_x))
+    wind.append(mytime.strftime('%m%d%H') + '\n')
+    for i in range(ny)[::-1]:
+      wind.append(' '.join([ str(newvel_x[i][j]) + ' ' + str(newvel_y[i][j])
+        for j in range(nx) ]) + '\n')
+    ave.append('{0} {1}\n'.format(win_speed, win_dir))
+
+  return wind, ave
+
+
+def same_lines(lines, expected):
+  # Lines holding numbers match to rounding, every other line exactly.
+  assert len(lines) == len(expected)
+  for line, expected_line in zip(lines, expected):
+    words, expected_words = line.split(), expected_line.split()
+    assert len(words) == len(expected_words)
+    if len(words) > 1:
+      assert np.allclose(map(float, words), map(float, expected_words))
+    else:
+      assert line == expected_line
+
+
+def check_gen_windfiles(cache):
+  # A grid inside the hull of the points, where both interpolate linearly.
+  nx, ny = 31, 23
+  gridx, gridy = np.meshgrid(np.linspace(100e3, 400e3, nx),
+    np.linspace(150e3, 450e3, ny))
+  times, windata = wind_records()
+  points = slice(0, len(windata['x']) // len(times))
+
+  # The operator comes from the test cache, not the shared one.
+  regrid._OPERATORS.clear()
+  regrid.grid_operator(windata['x'][points], windata['y'][points], gridx,
+    gridy, cache)
+
+  run_dir = tempfile.mkdtemp(prefix = 'wavecon-regridtest-')
+  try:
+    output_path = path.join(run_dir, 'wind.dat')
+    CMSman.gen_windfiles(windata, (gridx, gridy), times,
+      {'nx': nx, 'ny': ny}, output_path)
+    with open(output_path) as wind_file:
+      wind = wind_file.readlines()
+    with open(output_path + '.ave') as ave_file:
+      ave = ave_file.readlines()
+  finally:
+    shutil.rmtree(run_dir)
+
+  expected_wind, expected_ave = baseline_windfiles(windata, (gridx, gridy),
+    times, nx, ny)
+  assert len(wind) == 1 + len(times) * (ny + 1)
+  same_lines(wind, expected_wind)
+  same_lines(ave, expected_ave)
+
+
+if __name__ == '__main__':
+  cache_dir = tempfile.mkdtemp(prefix = 'wavecon-regridtest-')
+  cache = DataCache(cache_dir)
+  try:
+    for name, check in [
+      ('linear weights', check_linear),
+      ('stacked fields', check_stacked),
+      ('cached operators', check_cache),
+      ('speed', check_speed),
+      ('gen_windfiles', check_gen_windfiles)
+    ]:
+      check(cache)
+      print '  ok {0}'.format(name)
+  finally:
+    shutil.rmtree(cache_dir)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Checks that the partitioned tables, which DBman declares rather than reflects,
+can be accessed without a database and match db/design/wave.psql.  No
+database is used, only a configuration to import DBman with.  Usage::
+
+  schematest.py
+"""
+
+# Make sure the WaveConnect py/lib folder is on the search path so
+# modules can be retrieved.
+import sys
+from os import path
+scriptLocation = path.dirname(path.abspath( __file__ ))
+waveLibs = path.abspath(path.join( scriptLocation, '..', 'lib' ))
+sys.path.insert( 0, waveLibs )
+
+from wavecon import DBman
+
+TABLES = {
+  'tblwave' : ['wavid', 'wavsourceid', 'wavspectrabinid', 'wavdatetime',
+    'wavspectra', 'wavheight', 'wavpeakdir', 'wavpeakperiod', 'wavlocation'],
+  'tblwind' : ['winid', 'winsourceid', 'windatetime', 'winspeed',
+    'windirection', 'winlocation'],
+  'tblcurrent' : ['curid', 'cursourceid', 'curdatetime', 'curspeed',
+    'curdirection', 'curlocation']
+}
+
+
+def check_columns():
+  # Columns come in the order COPY sends them, and the primary key holds the
+  # partition key.
+  for template, columns in TABLES.items():
+    table = DBman.accessTable(None, template).__table__
+    assert table._columns.keys() == columns
+    assert [ column.name for column in table.primary_key ] == \
+      [columns[0], DBman._PARTITION_KEYS[template]]
+
+
+def check_repeated():
+  # Asking again, or for a copy under another name, gives the same columns.
+  for template, columns in TABLES.items():
+    for name in (None, template + 'schematest'):
+      table = DBman.accessTable(None, template, name).__table__
+      assert table._columns.keys() == columns
+      assert len(table.primary_key) == 2
+
+
+def check_records():
+  # Records get an id, as the server default is not applied by COPY.
+  Wave = DBman.accessTable(None, 'tblwave')
+  record = Wave(wavSourceID = 'source', wavSpectraBinID = 'bin',
+    wavLocation = DBman.WKTSpatialElement('POINT(-124.5 40.75)'))
+  row, = DBman._record_rows([record], Wave.__table__)
+  assert row['wavid'] and row['wavlocation'] == (-124.5, 40.75)
+
+
+if __name__ == '__main__':
+  for name, check in [
+    ('declared columns', check_columns),
+    ('repeated access', check_repeated),
+    ('record rows', check_records)
+  ]:
+    check()
+    print '  ok {0}'.format(name)
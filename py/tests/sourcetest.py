@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Registers several runs of a throwaway source type with
+DBman.register_source() and checks that every run gets a name of its own
+while the source type is only added once, and that DBman.remove_source()
+deletes a run.  The runs and the source type are deleted again afterwards.
+Usage::
+
+  sourcetest.py
+"""
+
+# Make sure the WaveConnect py/lib folder is on the search path so
+# modules can be retrieved.
+import sys
+from os import path
+scriptLocation = path.dirname(path.abspath( __file__ ))
+waveLibs = path.abspath(path.join( scriptLocation, '..', 'lib' ))
+sys.path.insert( 0, waveLibs )
+
+import threading
+from datetime import datetime
+
+from wavecon import DBman
+
+SOURCE_TYPE = 'SOURCETEST'
+RUN_NAME = SOURCE_TYPE + '_' + datetime(2010, 12, 22).strftime('%Y%m%d_%H')
+
+
+def stored_runs(srcids):
+  return DBman.fetch_arrays('''
+    SELECT srcid, srcname, srcsourcetypeid FROM tblsource
+    WHERE srcid = ANY(%s) ORDER BY srcid
+    ''', (list(srcids),))
+
+
+def stored_types():
+  return DBman.fetch_arrays('''
+    SELECT sourcetypeid FROM tblsourcetype WHERE sourcetypename = %s
+    ''', (SOURCE_TYPE,))['sourcetypeid']
+
+
+def check_runs(srcids):
+  # Two runs of the same type and date.
+  first = DBman.register_source(SOURCE_TYPE, RUN_NAME)
+  second = DBman.register_source(SOURCE_TYPE, RUN_NAME)
+  srcids.extend([first, second])
+
+  runs = stored_runs([first, second])
+  names = runs['srcname'].tolist()
+  assert first != second
+  assert len(set(names)) == 2
+  assert all( name.startswith(RUN_NAME + '_') for name in names )
+  assert set(runs['srcsourcetypeid']) == \
+    set([DBman.source_type_id(SOURCE_TYPE)])
+
+
+def check_concurrent_runs(srcids):
+  # Loaders starting at the same time still get names of their own.
+  added = []
+  def register():
+    added.append(DBman.register_source(SOURCE_TYPE, RUN_NAME))
+
+  threads = [ threading.Thread(target = register) for i in xrange(4) ]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  srcids.extend(added)
+
+  assert len(added) == 4
+  assert len(set(stored_runs(added)['srcname'])) == 4
+
+
+def check_remove_source(srcids):
+  # A failed load removes its run, other runs stay.
+  kept = DBman.register_source(SOURCE_TYPE, RUN_NAME)
+  removed = DBman.register_source(SOURCE_TYPE, RUN_NAME)
+  srcids.extend([kept, removed])
+
+  DBman.remove_source(removed)
+  assert stored_runs([kept, removed])['srcid'].tolist() == [kept]
+
+
+def check_source_type():
+  # The id is cached, and a new process finds the same row.
+  sourcetypeid = DBman.source_type_id(SOURCE_TYPE)
+  assert DBman.source_type_id(SOURCE_TYPE) == sourcetypeid
+
+  DBman._SOURCE_TYPES.clear()
+  assert DBman.source_type_id(SOURCE_TYPE) == sourcetypeid
+  assert stored_types().tolist() == [sourcetypeid]
+
+
+if __name__ == '__main__':
+  srcids = []
+  try:
+    for name, check, args in [
+      ('distinct run names', check_runs, (srcids,)),
+      ('concurrent runs', check_concurrent_runs, (srcids,)),
+      ('run removed', check_remove_source, (srcids,)),
+      ('source type reused', check_source_type, ())
+    ]:
+      check(*args)
+      print '  ok {0}'.format(name)
+
+  finally:
+    with DBman.session() as session:
+      if srcids:
+        session.execute('DELETE FROM tblsource WHERE srcid IN :srcids',
+          {'srcids' : tuple(srcids)})
+      session.execute('''
+        DELETE FROM tblsourcetype WHERE sourcetypename = :name
+        ''', {'name' : SOURCE_TYPE})
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+Checks the fingerprints DBman gives sets of spectral bins.  No database is
+used, only a configuration to import DBman with.  Usage::
+
+  spectrabintest.py
+"""
+
+# Make sure the WaveConnect py/lib folder is on the search path so
+# modules can be retrieved.
+import sys
+from os import path
+scriptLocation = path.dirname(path.abspath( __file__ ))
+waveLibs = path.abspath(path.join( scriptLocation, '..', 'lib' ))
+sys.path.insert( 0, waveLibs )
+
+import numpy as np
+
+from wavecon.DBman import spectra_bin_fingerprint, spectra_bin_fingerprints
+
+# WW3 bins: 25 frequencies growing by 10% and 24 directions.
+FREQS = 0.0418 * 1.1 ** np.arange(25)
+DIRS = np.arange(7.5, 360, 15.0)
+
+
+def check_noise():
+  # Bins parsed from text or stored as 32-bit floats share a fingerprint.
+  fingerprint = spectra_bin_fingerprint(FREQS, DIRS)
+  rng = np.random.RandomState(0)
+  for noise in (1e-9, 1e-7):
+    noisy = FREQS + rng.uniform(-noise, noise, FREQS.shape)
+    assert spectra_bin_fingerprint(noisy, DIRS) == fingerprint
+  assert spectra_bin_fingerprint(FREQS.astype(np.float32),
+    DIRS.astype(np.float32)) == fingerprint
+  assert spectra_bin_fingerprint([ '%.6f' % f for f in FREQS ],
+    DIRS.tolist()) == fingerprint
+
+  # Different bins do not.
+  assert spectra_bin_fingerprint(FREQS[:-1], DIRS) != fingerprint
+  assert spectra_bin_fingerprint(FREQS + 0.002, DIRS) != fingerprint
+  assert spectra_bin_fingerprint(DIRS, FREQS) != fingerprint
+
+
+def check_halfway():
+  # Values either side of halfway between two steps round apart, but each
+  # set also tries the rounding of the other.
+  below = spectra_bin_fingerprints([0.0384999999, 0.05], DIRS)
+  above = spectra_bin_fingerprints([0.0385000001, 0.05], DIRS)
+  assert below[0] != above[0]
+  assert below[0] in above and above[0] in below
+
+  # Values clear of halfway have a single fingerprint.
+  assert spectra_bin_fingerprints(FREQS, DIRS) == \
+    [spectra_bin_fingerprint(FREQS, DIRS)]
+
+
+def check_negative_zero():
+  assert spectra_bin_fingerprint([0.05], [-0.0, 90.0]) == \
+    spectra_bin_fingerprint([0.05], [0.0, 90.0])
+  assert spectra_bin_fingerprint([0.05], [-0.0000001, 90.0]) == \
+    spectra_bin_fingerprint([0.05], [0.0, 90.0])
+
+
+def check_none():
+  # Missing bins are allowed, and are not mistaken for the other axis.
+  assert spectra_bin_fingerprint(FREQS, None) == \
+    spectra_bin_fingerprint(FREQS, [])
+  assert spectra_bin_fingerprint(FREQS, None) != \
+    spectra_bin_fingerprint(None, FREQS)
+  assert spectra_bin_fingerprints(None, None) == \
+    [spectra_bin_fingerprint(None, None)]
+
+
+if __name__ == '__main__':
+  for name, check in [
+    ('parsing noise', check_noise),
+    ('halfway values', check_halfway),
+    ('negative zero', check_negative_zero),
+    ('missing bins', check_none)
+  ]:
+    check()
+    print '  ok {0}'.format(name)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+Times how long it takes a fresh Python process to get from ``import DBman`` to
+having a handful of table classes ready to use.  Three cases are measured:
+
+  * *eager*: the old behavior, reflecting the entire schema up front.
+  * *lazy*: tables are reflected one at a time by accessTable().
+  * *cached*: the same as *lazy* but with the on-disk metadata cache enabled.
+    The first run populates the cache and is not counted.
+
+Each case runs in its own interpreter so that nothing is shared between runs.
+Usage::
+
+  startupbench.py [repetitions]
+"""
+
+# Make sure the WaveConnect py/lib folder is on the search path so
+# modules can be retrieved.
+import sys
+from os import path
+scriptLocation = path.dirname(path.abspath( __file__ ))
+waveLibs = path.abspath(path.join( scriptLocation, '..', 'lib' ))
+sys.path.insert( 0, waveLibs )
+
+import subprocess
+import tempfile
+import shutil
+
+TABLES = ['tblsourcetype', 'tblsource', 'tblspectrabin', 'tblwave', 'tblwind',
+  'tblcurrent']
+
+CHILD = '''
+import sys, time
+sys.path.insert(0, {libs!r})
+start = time.time()
+from wavecon import DBman
+if {cache_dir!r}:
+  DBman.DB_CONFIG['metadata_cache'] = {cache_dir!r}
+if {mode!r} == 'eager':
+  DBman.DB_META.reflect()
+for table in {tables!r}:
+  DBman.accessTable(None, table)
+print time.time() - start
+'''
+
+def time_startup(mode, cache_dir = None):
+  code = CHILD.format(libs = waveLibs, mode = mode, cache_dir = cache_dir,
+    tables = TABLES)
+  output = subprocess.check_output([sys.executable, '-c', code])
+
+  return float(output.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+  repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+  cache_dir = tempfile.mkdtemp()
+
+  try:
+    # Prime the metadata cache.
+    time_startup('lazy', cache_dir)
+
+    for mode in ('eager', 'lazy', 'cached'):
+      times = [ time_startup(mode, cache_dir if mode == 'cached' else None)
+        for i in xrange(repetitions) ]
+      print '{0:>8}: best {1:.3f}s  mean {2:.3f}s'.format(mode, min(times),
+        sum(times) / len(times))
+  finally:
+    shutil.rmtree(cache_dir)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Checks that CMSman.wavecube() groups wave records into a (loc x time x freq x
+dir) cube and that the spectra are reworked for CMS in place.  The records are
+laid out like those returned by CMSman.wavequery(), so no wave data needs to
+be loaded.  Usage::
+
+  wavecubetest.py
+"""
+
+# Make sure the WaveConnect py/lib folder is on the search path so
+# modules can be retrieved.
+import sys
+from os import path
+scriptLocation = path.dirname(path.abspath( __file__ ))
+waveLibs = path.abspath(path.join( scriptLocation, '..', 'lib' ))
+sys.path.insert( 0, waveLibs )
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from wavecon import CMSman
+
+NLOCS = 5
+NTIMES = 9
+FREQS = np.linspace(0.04, 0.5, 25)
+DIRS = np.arange(0, 360, 15.0)
+
+
+def records():
+  # Records come back in no particular order and one of them is missing.
+  rng = np.random.RandomState(0)
+  locs = [ '0101000020E6100000{0:032x}'.format(i) for i in xrange(NLOCS) ]
+  times = [ datetime(2010, 12, 22) + timedelta(hours = 3 * i)
+    for i in xrange(NTIMES) ]
+  spectra = rng.random_sample((NLOCS, NTIMES, len(FREQS), len(DIRS)))
+
+  cells = [ (i, j) for i in xrange(NLOCS) for j in xrange(NTIMES) ][1:]
+  order = rng.permutation(len(cells))
+  cells = [ cells[k] for k in order ]
+
+  result = {
+    'spec': np.array([ spectra[i, j] for i, j in cells ]),
+    'specid': np.array([ 'bins' ] * len(cells), dtype = object),
+    'time': np.array([ times[j] for i, j in cells ], dtype = 'datetime64[us]'),
+    'loc': np.array([ locs[i] for i, j in cells ], dtype = object),
+    'x': np.array([ 1000.0 * i for i, j in cells ]),
+    'y': np.array([ -500.0 * i for i, j in cells ])
+  }
+
+  return result, locs, times, spectra
+
+
+def check_cube():
+  result, locs, times, spectra = records()
+  wavdata = CMSman.wavecube(result, FREQS, DIRS)
+
+  assert wavdata['loc'].tolist() == locs
+  assert wavdata['time'].tolist() == times
+  assert wavdata['spec'].shape == (NLOCS, NTIMES, len(FREQS), len(DIRS))
+  assert not wavdata['mask'][0, 0] and wavdata['mask'].sum() == \
+    NLOCS * NTIMES - 1
+  assert np.isnan(wavdata['spec'][0, 0]).all()
+  assert np.array_equal(wavdata['spec'][wavdata['mask']],
+    spectra[wavdata['mask']])
+  assert np.array_equal(wavdata['x'], 1000.0 * np.arange(NLOCS))
+  assert np.array_equal(wavdata['y'], -500.0 * np.arange(NLOCS))
+
+
+def check_directions():
+  result, locs, times, spectra = records()
+  wavdata = CMSman.interpolatespectra(CMSman.wavecube(result, FREQS, DIRS))
+
+  # The half plane from traveling south to traveling north, as np.interp
+  # gives it for each frequency row.
+  dirs = np.where(DIRS > 90, DIRS - 360, DIRS)
+  order = np.argsort(dirs)
+  mydirs = np.linspace(-90, 90, len(DIRS))
+  expected = np.array([ np.interp(mydirs, dirs[order], row[order])
+    for row in spectra[2, 4] ])
+
+  assert np.array_equal(wavdata['dir'], mydirs)
+  assert np.allclose(wavdata['spec'][2, 4], expected)
+
+
+def check_peak():
+  result, locs, times, spectra = records()
+  wavdata = CMSman.calculatepeakfreq(CMSman.wavecube(result, FREQS, DIRS))
+  assert wavdata['peakfreq'].shape == (NLOCS, NTIMES)
+  assert wavdata['peakfreq'][3, 5] == \
+    FREQS[spectra[3, 5].max(1).argmax()]
+
+
+if __name__ == '__main__':
+  for name, check in [
+    ('cube', check_cube),
+    ('direction bins', check_directions),
+    ('peak frequency', check_peak)
+  ]:
+    check()
+    print '  ok {0}'.format(name)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+Compares the ways GETman can load NAM12 wind grids.  Synthetic grids the size
+of the full NAM 218 domain are loaded into a scratch copy of tblwind using:
+
+  * *records*: the original push_windata() approach, which built a
+    WKTSpatialElement and a ``wind`` object for every cell and handed them
+    to a BatchWriter.  Unlike the original, every cell is kept.
+  * *columns*: the grids handed to BatchWriter.put_columns() as arrays by
+    GETman.push_windgrid(), as getWIND() loads them, one COPY per timestep.
+
+Usage::
+
+  windbench.py [number of timesteps]
+"""
+
+# Make sure the WaveConnect py/lib folder is on the search path so
+# modules can be retrieved.
+import sys
+from os import path
+scriptLocation = path.dirname(path.abspath( __file__ ))
+waveLibs = path.abspath(path.join( scriptLocation, '..', 'lib' ))
+sys.path.insert( 0, waveLibs )
+
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from geoalchemy import WKTSpatialElement
+
+from wavecon import DBman, GETman
+
+BENCH_TABLE = 'bench_tblwind'
+
+# The NAM 218 grid covers CONUS with 614 x 428 cells.
+NY = 428
+NX = 614
+
+
+def nam12_grids(count):
+  lats, lons = np.meshgrid(np.linspace(12.2, 57.3, NY),
+    np.linspace(-152.9, -49.4, NX), indexing = 'ij')
+  start = datetime(2010, 12, 22)
+  rng = np.random.RandomState(0)
+
+  return dict( (start + timedelta(hours = 3 * i), {
+      'speed' : rng.random_sample((NY, NX)) * 20,
+      'dir' : rng.random_sample((NY, NX)) * 360 - 180,
+      'lats' : lats,
+      'lons' : lons
+    }) for i in xrange(count) )
+
+
+def load_records(windata, srcid):
+  # push_windata() prior to columnar loading, less the indentation bug.
+  wind = DBman.accessTable(None, 'tblwind', BENCH_TABLE)
+  with DBman.BatchWriter('tblwind', BENCH_TABLE) as writer:
+    for date in windata.keys():
+      lats = windata[date]['lats']
+      lons = windata[date]['lons']
+      spd = windata[date]['speed']
+      dir = windata[date]['dir']
+
+      records = []
+      for i in range(lats.shape[0]):
+        for j in range(lats.shape[1]):
+          loc = WKTSpatialElement('POINT(' + str(lons[i][j]) + ' ' +
+            str(lats[i][j]) + ')')
+          records.append(wind(winSourceID = srcid, winLocation = loc,
+            winDateTime = date, winSpeed = float(spd[i][j]),
+            winDirection = float(dir[i][j])))
+      writer.put(records)
+
+  return writer.written
+
+
+def load_columns(windata, srcid):
+  with DBman.BatchWriter('tblwind', BENCH_TABLE) as writer:
+    for date in sorted(windata.keys()):
+      GETman.push_windgrid(writer, date, windata[date], srcid)
+
+  return writer.written
+
+
+if __name__ == '__main__':
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+  windata = nam12_grids(count)
+  cells = count * NY * NX
+
+  # The scratch table has no foreign keys, so any source id will do.
+  with DBman.session() as session:
+    session.execute('CREATE TABLE {0} ( LIKE tblwind INCLUDING ALL )'\
+      .format(BENCH_TABLE))
+
+  try:
+    print '{0} timesteps of {1} x {2} cells'.format(count, NY, NX)
+    for name, method in (('records', load_records),
+      ('columns', load_columns)):
+      start = time.time()
+      written = method(windata, 'bench')
+      elapsed = time.time() - start
+      assert written == cells
+
+      print '{0:>8}: {1:.2f}s  ({2:.0f} cells/s)'.format(name, elapsed,
+        cells / elapsed)
+
+      with DBman.session() as session:
+        session.execute('TRUNCATE {0}'.format(BENCH_TABLE))
+
+  finally:
+    with DBman.session() as session:
+      session.execute('DROP TABLE {0}'.format(BENCH_TABLE))
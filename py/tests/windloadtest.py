@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Loads a synthetic NAM12 wind grid with GETman.push_windgrid(), as
+GETman.getWIND() loads each steering time, and checks that every cell of
+every timestep is stored with its own location, speed and direction.  The
+run is deleted again afterwards.  Usage::
+
+  windloadtest.py
+"""
+
+# Make sure the WaveConnect py/lib folder is on the search path so
+# modules can be retrieved.
+import sys
+from os import path
+scriptLocation = path.dirname(path.abspath( __file__ ))
+waveLibs = path.abspath(path.join( scriptLocation, '..', 'lib' ))
+sys.path.insert( 0, waveLibs )
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from wavecon import DBman, GETman
+
+# Unequal sides, so a transposed grid does not go unnoticed.
+NY = 37
+NX = 53
+
+
+def nam12_grid(seed):
+  # Laid out like the grids returned by GETman.nam12_parsefile().
+  lats, lons = np.meshgrid(np.linspace(35, 50, NY),
+    np.linspace(-130, -120, NX), indexing = 'ij')
+  rng = np.random.RandomState(seed)
+
+  return {
+    'speed' : rng.random_sample((NY, NX)) * 20,
+    'dir' : rng.random_sample((NY, NX)) * 360 - 180,
+    'lats' : lats,
+    'lons' : lons
+  }
+
+
+def stored_wind(srcid):
+  return DBman.fetch_arrays('''
+    SELECT windatetime, winspeed, windirection,
+      ST_X(winlocation) AS lon, ST_Y(winlocation) AS lat
+    FROM tblwind WHERE winsourceid = %s
+    ORDER BY windatetime, lat, lon
+    ''', (srcid,))
+
+
+def load_wind(windata, srcid):
+  # Steering times go to the writer one by one, as they leave the NAM12
+  # pipeline.
+  with DBman.BatchWriter('tblwind') as writer:
+    for date in sorted(windata):
+      GETman.push_windgrid(writer, date, windata[date], srcid)
+
+
+if __name__ == '__main__':
+  start = datetime(2010, 12, 22)
+  dates = [ start + timedelta(hours = 3 * i) for i in xrange(3) ]
+  windata = dict( (date, nam12_grid(i)) for i, date in enumerate(dates) )
+
+  srcid = GETman.add_source('NAM12', start)
+  try:
+    load_wind(windata, srcid)
+
+    stored = stored_wind(srcid)
+    cells = NY * NX
+    assert len(stored['winspeed']) == len(dates) * cells
+
+    for i, date in enumerate(dates):
+      rows = slice(i * cells, (i + 1) * cells)
+      grid = windata[date]
+
+      assert (stored['windatetime'][rows] == np.datetime64(date)).all()
+      assert np.allclose(stored['lat'][rows], grid['lats'].ravel())
+      assert np.allclose(stored['lon'][rows], grid['lons'].ravel())
+      assert np.allclose(stored['winspeed'][rows], grid['speed'].ravel())
+      assert np.allclose(stored['windirection'][rows], grid['dir'].ravel())
+    print '  ok every cell stored'
+
+    # Loading the same run again writes nothing new.
+    load_wind(windata, srcid)
+    assert len(stored_wind(srcid)['winspeed']) == len(dates) * cells
+    print '  ok reload skipped'
+
+  finally:
+    with DBman.session() as session:
+      session.execute('DELETE FROM tblsource WHERE srcid = :srcid',
+        {'srcid' : srcid})
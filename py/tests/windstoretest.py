@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+Writes a synthetic wind cube with wavecon.windstore.save_cube() and
+CubeWriter and checks what WindCube reads back from it.  No database is needed.  Usage::
+
+  windstoretest.py
+"""
+
+# Make sure the WaveConnect py/lib folder is on the search path so
+# modules can be retrieved.
+import sys
+from os import path
+scriptLocation = path.dirname(path.abspath( __file__ ))
+waveLibs = path.abspath(path.join( scriptLocation, '..', 'lib' ))
+sys.path.insert( 0, waveLibs )
+
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from wavecon.windstore import save_cube, CubeWriter, WindCube
+
+NY = 90
+NX = 140
+NTIMES = 8
+
+
+def cube_data():
+  lats, lons = np.meshgrid(np.linspace(35, 50, NY),
+    np.linspace(-130, -115, NX), indexing = 'ij')
+  times = [ datetime(2010, 12, 22) + timedelta(hours = 3 * i)
+    for i in xrange(NTIMES) ]
+  rng = np.random.RandomState(0)
+  speed = rng.random_sample((NTIMES, NY, NX)) * 20
+  direction = rng.random_sample((NTIMES, NY, NX)) * 360 - 180
+
+  return times, lats, lons, speed, direction
+
+
+def check_round_trip(file_name):
+  times, lats, lons, speed, direction = cube_data()
+  with WindCube(file_name) as cube:
+    assert cube.times == times
+    assert np.array_equal(cube.lats, lats)
+    assert np.array_equal(cube.lons, lons)
+
+    wind = cube.read()
+    assert wind['speed'].shape == (NTIMES, NY, NX)
+    assert np.allclose(wind['speed'], speed, rtol = 1e-6)
+    assert np.allclose(wind['dir'], direction, rtol = 1e-6, atol = 1e-4)
+
+
+def check_window(file_name):
+  times, lats, lons, speed, direction = cube_data()
+  box = (-124.5, 40.0, -123.5, 41.5)
+  with WindCube(file_name) as cube:
+    rows, columns = cube.window(*box, pad = 0)
+    inside = (lats >= box[1]) & (lats <= box[3]) & \
+      (lons >= box[0]) & (lons <= box[2])
+    assert inside[rows, columns].all() and inside.sum() == \
+      inside[rows, columns].sum()
+
+    # Padding widens the block without running off the grid.
+    padded = cube.window(*box)
+    assert padded[0].start == rows.start - 2 and padded[1].stop == \
+      columns.stop + 2
+    assert cube.window(0, 0, 1, 1) is None
+
+    # Steering times come back in the order asked for.
+    steps = [5, 1, 3]
+    wind = cube.read([ times[i] for i in steps ], box)
+    assert wind['time'] == [ times[i] for i in steps ]
+    assert np.allclose(wind['speed'], speed[steps][:, padded[0], padded[1]],
+      rtol = 1e-6)
+    assert np.array_equal(wind['lat'], lats[padded])
+
+    # A time asked for more than once comes back each time.
+    steps = [6, 2, 6, 2, 0]
+    wind = cube.read([ times[i] for i in steps ], box)
+    assert wind['time'] == [ times[i] for i in steps ]
+    assert np.allclose(wind['speed'], speed[steps][:, padded[0], padded[1]],
+      rtol = 1e-6)
+    assert np.allclose(wind['dir'], direction[steps][:, padded[0], padded[1]],
+      rtol = 1e-6, atol = 1e-4)
+
+    try:
+      cube.read([ times[0] + timedelta(hours = 1) ])
+    except KeyError:
+      pass
+    else:
+      raise AssertionError('missing time should raise KeyError')
+
+
+def check_mismatch(store_dir):
+  times, lats, lons, speed, direction = cube_data()
+  try:
+    save_cube(path.join(store_dir, 'bad.h5'), times[1:], lats, lons, speed,
+      direction)
+  except ValueError:
+    pass
+  else:
+    raise AssertionError('mismatched arrays should raise ValueError')
+
+
+def check_writer(store_dir):
+  # Steps written out of order, as a pipeline hands them over, read back in
+  # time order.  An unfinished cube is never moved into place.
+  times, lats, lons, speed, direction = cube_data()
+  file_name = path.join(store_dir, 'steps.h5')
+  with CubeWriter(file_name, times) as writer:
+    for i in [3, 0, 7, 5, 1, 2, 6, 4]:
+      writer.put(times[i], lats, lons, speed[i], direction[i])
+  with WindCube(file_name) as cube:
+    assert np.allclose(cube.read()['speed'], speed, rtol = 1e-6)
+  assert writer.extent() == (-130.0, 35.0, -115.0, 50.0)
+
+  partial = path.join(store_dir, 'partial.h5')
+  writer = CubeWriter(partial, times)
+  writer.put(times[0], lats, lons, speed[0], direction[0])
+  try:
+    writer.close()
+  except ValueError:
+    pass
+  else:
+    raise AssertionError('missing steps should raise ValueError')
+  assert sorted(os.listdir(store_dir)) == ['nam12.h5', 'steps.h5']
+
+  # A cube whose registration fails is not left behind either.
+  def register(writer):
+    raise RuntimeError('no catalog')
+  unlisted = path.join(store_dir, 'unlisted.h5')
+  try:
+    with CubeWriter(unlisted, times, register) as writer:
+      for i in xrange(len(times)):
+        writer.put(times[i], lats, lons, speed[i], direction[i])
+  except RuntimeError:
+    pass
+  else:
+    raise AssertionError('a failed registration should raise')
+  assert sorted(os.listdir(store_dir)) == ['nam12.h5', 'steps.h5']
+
+
+if __name__ == '__main__':
+  store_dir = tempfile.mkdtemp(prefix = 'wavecon-windstoretest-')
+  try:
+    file_name = save_cube(path.join(store_dir, 'nam12.h5'), *cube_data())
+    print '  cube is {0:.1f} MB on disk'.format(path.getsize(file_name) / 1e6)
+
+    for name, check, arg in [
+      ('round trip', check_round_trip, file_name),
+      ('box and times', check_window, file_name),
+      ('mismatched arrays', check_mismatch, store_dir),
+      ('step by step', check_writer, store_dir)
+    ]:
+      check(arg)
+      print '  ok {0}'.format(name)
+  finally:
+    shutil.rmtree(store_dir)
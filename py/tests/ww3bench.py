@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+Compares the regular expression parser GETman used for WW3 point spectra
+files with the streaming parser in wavecon.WW3.  A synthetic spectra file
+shaped like the ``enp.EKA*`` output is written and parsed by:
+
+  * *regex*: the original implementation, which matched every number in the
+    file with ``re.findall`` and converted them with ``map(float, ...)``.
+  * *stream*: ``WW3.read_point_spectra()``.
+
+Each parser runs in its own interpreter, so its peak memory use can be
+reported alongside the time taken.  Both results are checked for agreement
+first.  Usage::
+
+  ww3bench.py [number of times] [repetitions]
+"""
+
+# Make sure the WaveConnect py/lib folder is on the search path so
+# modules can be retrieved.
+import sys
+from os import path
+scriptLocation = path.dirname(path.abspath( __file__ ))
+waveLibs = path.abspath(path.join( scriptLocation, '..', 'lib' ))
+sys.path.insert( 0, waveLibs )
+
+import os
+import re
+import subprocess
+import tempfile
+from datetime import datetime, timedelta
+from math import degrees, pi
+
+import numpy as np
+
+from wavecon import WW3
+
+# The resolution of the NCEP enp point output.
+NFREQS = 50
+NDIRS = 36
+
+
+def write_spectra_file(file_name, ntimes, nfreqs = NFREQS, ndirs = NDIRS):
+  # Writes a file laid out the way ww3_outp writes them.
+  def block(values, per_line, width):
+    for i in xrange(0, len(values), per_line):
+      stream.write(''.join('{0:{1}.3E}'.format(x, width)
+        for x in values[i:i + per_line]) + '\n')
+
+  rng = np.random.RandomState(0)
+  start = datetime(2010, 12, 22)
+  with open(file_name, 'w') as stream:
+    stream.write("'WAVEWATCH III SPECTRA'{0:6d}{1:6d}{2:6d} "
+      "'spectral resolution for points'\n".format(nfreqs, ndirs, 1))
+    block(0.035 * 1.1 ** np.arange(nfreqs), 8, 10)
+    block(np.radians(np.arange(ndirs) * (360.0 / ndirs)), 7, 10)
+    for t in xrange(ntimes):
+      stream.write((start + timedelta(hours = 3 * t))\
+        .strftime('%Y%m%d %H%M%S') + '\n')
+      stream.write("'EKA01     '  40.84-124.23    1000.0  6.70 270.0"
+        "  0.00 270.0\n")
+      block(rng.random_sample(nfreqs * ndirs) * 10 ** rng.randint(-6, 1),
+        7, 11)
+
+
+def regex_parse(file_name):
+  # The ww3_parsefile() implementation prior to the streaming parser, less
+  # the construction of the record dictionary.
+  lines = open(file_name).read()
+
+  freqdir_pat = re.compile("III.*?(\d+).*?(\d+)")
+  num_pat = re.compile("-*\d+\.*\d+E.\d+")
+  timestamp_pat = re.compile("\d{8} \d{6}")
+  latlon_pat = re.compile("\d+.\d+-\d+.\d+")
+
+  freqdir_match = freqdir_pat.search(lines)
+  num_match = num_pat.findall(lines)
+  num_match = map(float, num_match)
+  timestamp_match = timestamp_pat.findall(lines)
+  latlon_match = latlon_pat.findall(lines)
+
+  lat = float(latlon_match[0][0:5])
+  lon = float(latlon_match[0][5:])
+
+  nfreqs = int(freqdir_match.group(1))
+  ndirs = int(freqdir_match.group(2))
+  freqs = num_match[0:nfreqs]
+  dirs = map(degrees, num_match[nfreqs:(nfreqs + ndirs)])
+
+  timestamps = [ datetime.strptime(ts, '%Y%m%d %H0000')
+    for ts in timestamp_match ]
+
+  spectra = np.array(num_match[(nfreqs + ndirs):])
+  spectra = spectra * (pi / 180)
+  spectra = spectra.reshape(len(timestamps), nfreqs, ndirs)
+
+  return lat, lon, timestamps, freqs, dirs, spectra
+
+
+def stream_parse(file_name):
+  return WW3.read_point_spectra(file_name)[0]
+
+
+PARSERS = { 'regex' : regex_parse, 'stream' : stream_parse }
+
+CHILD = '''
+import sys, time, resource
+sys.path.insert(0, {tests!r})
+import ww3bench
+start = time.time()
+ww3bench.PARSERS[{name!r}]({file_name!r})
+print time.time() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+'''
+
+def run(name, file_name):
+  code = CHILD.format(tests = scriptLocation, name = name,
+    file_name = file_name)
+  elapsed, peak = subprocess.check_output([sys.executable, '-c', code])\
+    .split()
+
+  return float(elapsed), int(peak)
+
+
+def check(file_name):
+  lat, lon, times, freqs, dirs, spectra = regex_parse(file_name)
+  point = stream_parse(file_name)
+
+  assert (point.lat, point.lon) == (lat, lon)
+  assert point.times == times
+  assert np.allclose(point.freqs, freqs) and np.allclose(point.dirs, dirs)
+  assert point.spectra.shape == spectra.shape
+  # Densities are loaded into float8 columns, so nothing may be lost.
+  assert point.spectra.dtype == np.float64
+  assert np.array_equal(point.spectra, spectra)
+
+
+if __name__ == '__main__':
+  ntimes = int(sys.argv[1]) if len(sys.argv) > 1 else 61
+  repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+  fd, file_name = tempfile.mkstemp(suffix = '.spec')
+  os.close(fd)
+
+  try:
+    write_spectra_file(file_name, ntimes)
+    check(file_name)
+    print '{0} times, {1} freqs, {2} dirs, {3:.1f} MB'.format(ntimes, NFREQS,
+      NDIRS, path.getsize(file_name) / 1e6)
+
+    for name in ('regex', 'stream'):
+      results = [ run(name, file_name) for i in xrange(repetitions) ]
+      elapsed = min( result[0] for result in results )
+      peak = max( result[1] for result in results )
+      print '{0:>8}: {1:.3f}s  peak RSS {2:.1f} MB'.format(name, elapsed,
+        peak / 1024.0)
+  finally:
+    os.unlink(file_name)